@@ -0,0 +1,368 @@
+"""
+File: cluster_benchmark.py
+Description:
+
+    Measures the throughput and the latency of a whole Blockchat network running on localhost.
+    The script:
+        - starts an N-node cluster (src/app.py on consecutive localhost ports, the bootstrap node on config.BOOTSTRAP_PORT)
+        in a fresh working directory, and waits until the bootstrap node reports that the session has started,
+        - replays a transaction workload on every node at a controlled rate, through the /make_transactions endpoint,
+        - waits until the mempools drain, reads the chain back and matches every transaction with the block that confirmed it,
+        - writes a JSON report with the transactions per second, the p50/p95/p99 latencies (submission and confirmation),
+        the block time and the time every node spent on every endpoint,
+        - optionally compares the report with a recorded baseline report.
+
+    The workload is a directory with one file per sender node, named trans{id}.txt after the id of the node.
+    Every line of a file is a transaction of that node: "id{recipient} {message}" for a message,
+    or "id{recipient} {amount}" when the rest of the line is an integer, for a transfer of coins.
+    Without a workload directory, a synthetic workload is generated.
+
+Usage: run "python benchmarks/cluster_benchmark.py --nodes 5 --capacity 5 [--workload dir] [--rate 10] [--batch 1] [--clients 1]
+            [--server production] [--transactions 100] [--keys-dir dir] [--output report.json] [--baseline baseline.json]"
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+import subprocess
+from argparse import ArgumentParser
+import requests
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SOURCE_DIR)
+
+import config
+from blockchain import Blockchain
+
+# The metrics of the report that are compared with the baseline, and whether a higher value is better.
+COMPARED_METRICS = {
+    ("throughput", "confirmed_tps"): True,
+    ("throughput", "submitted_tps"): True,
+    ("submission_latency", "p50"): False,
+    ("submission_latency", "p95"): False,
+    ("submission_latency", "p99"): False,
+    ("confirmation_latency", "p50"): False,
+    ("confirmation_latency", "p95"): False,
+    ("confirmation_latency", "p99"): False,
+    ("block_time", "mean"): False
+}
+
+def url(port, endpoint):
+    """Returns the URL of the given endpoint of the node on the given localhost port."""
+    return f"http://{config.BOOTSTRAP_IP}:{port}/blockchat/{endpoint}"
+
+def wait_until(condition, timeout, interval = 0.2):
+    """Polls the condition until it returns a true value, which is returned, or until the timeout expires (returns None)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            result = condition()
+            if result:
+                return result
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(interval)
+    return None
+
+def percentiles(values):
+    """Returns the count, mean, p50, p95, p99 and max of the given values (None for an empty list)."""
+    values = sorted(values)
+    def percentile(p):
+        return values[min(len(values) - 1, int(p * len(values)))] if values else None
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": values[-1] if values else None
+    }
+
+# ======================================================================================================================================================
+# Workload
+# ======================================================================================================================================================
+
+def parse_workload_line(line):
+    """Parses a line of a workload file into a transaction input for /make_transactions, or returns None for a blank line."""
+    parts = line.strip().split(" ", 1)
+    if not parts[0]:
+        return None
+    recipient_id = int(parts[0].removeprefix("id"))
+    rest = parts[1].strip() if len(parts) > 1 else ""
+    if rest.isdigit():
+        return {"recipient_id": recipient_id, "bcc": int(rest)}
+    return {"recipient_id": recipient_id, "message": rest}
+
+def load_workload(directory, nodes, limit):
+    """Loads the workload of every node (node id --> list of transaction inputs), skipping the transactions to the sender itself or to unknown nodes."""
+    workload = {}
+    for node_id in range(nodes):
+        path = os.path.join(directory, f"trans{node_id}.txt")
+        transactions = []
+        if os.path.exists(path):
+            with open(path, encoding = "utf-8") as workload_file:
+                for line in workload_file:
+                    transaction = parse_workload_line(line)
+                    if transaction is not None and transaction["recipient_id"] != node_id and transaction["recipient_id"] < nodes:
+                        transactions.append(transaction)
+        workload[node_id] = transactions[:limit]
+    return workload
+
+def generate_workload(nodes, count, seed = 0):
+    """Generates a synthetic workload of {count} cheap transactions per node, half messages and half transfers of coins."""
+    generator = random.Random(seed)
+    workload = {}
+    for node_id in range(nodes):
+        transactions = []
+        for _ in range(count):
+            recipient_id = generator.choice([other for other in range(nodes) if other != node_id])
+            if generator.random() < 0.5:
+                transactions.append({"recipient_id": recipient_id, "message": generator.choice(["hi", "hello", "ok", "thanks"])})
+            else:
+                transactions.append({"recipient_id": recipient_id, "bcc": generator.randint(1, 3)})
+        workload[node_id] = transactions
+    return workload
+
+# ======================================================================================================================================================
+# Cluster
+# ======================================================================================================================================================
+
+class Cluster:
+    """
+    A Blockchat network of local node processes.
+
+    Attributes:
+        nodes (int): the number of nodes.
+        capacity (int): the block capacity.
+        ports (list): the ports of the nodes, the bootstrap node's first.
+        work_dir (str): the working directory of the nodes, where their logs are kept.
+        keys_dir (str): the keystore directory shared across runs, or None to generate new key pairs.
+        node_ports (dict): node id --> port, known once the session has started.
+    """
+
+    def __init__(self, nodes, capacity, base_port, work_dir, keys_dir = None, server = None):
+        """Inits the cluster. No node runs until start() is called."""
+        self.nodes = nodes
+        self.capacity = capacity
+        self.server = server
+        self.ports = [int(config.BOOTSTRAP_PORT)] + [base_port + i for i in range(nodes - 1)]
+        self.work_dir = work_dir
+        self.node_ports = {}
+        self._processes = []
+        os.makedirs(os.path.join(work_dir, "logs"), exist_ok = True)
+        self.keys_dir = None
+        if keys_dir is not None:
+            # Share a keystore across runs, so that the nodes load their key pairs instead of generating them.
+            os.makedirs(keys_dir, exist_ok = True)
+            self.keys_dir = os.path.abspath(keys_dir)
+
+    def _launch(self, port, bootstrap = False):
+        """Starts the node process on the given port, with its output in the log directory."""
+        command = [sys.executable, os.path.join(SOURCE_DIR, "app.py"), "-prt", str(port)]
+        if self.server is not None:
+            command += ["--server", self.server]
+        if self.keys_dir is not None:
+            command += ["--keystore-dir", self.keys_dir]
+        if bootstrap:
+            command += ["-nds", str(self.nodes), "--capacity", str(self.capacity), "-btstrp"]
+        log_file = open(os.path.join(self.work_dir, "logs", f"node_{port}.log"), "w")
+        self._processes.append(subprocess.Popen(command, cwd = self.work_dir, stdout = log_file, stderr = subprocess.STDOUT))
+
+    def start(self, timeout):
+        """Starts the bootstrap node, then all the other nodes at once, and waits until the session has started. Returns the seconds it took."""
+        start = time.perf_counter()
+        self._launch(self.ports[0], bootstrap = True)
+        if wait_until(lambda: requests.get(url(self.ports[0], "health"), timeout = 1).ok, timeout) is None:
+            raise RuntimeError("The bootstrap node did not start.")
+        for port in self.ports[1:]:
+            self._launch(port)
+        status = wait_until(lambda: (lambda state: state if state in ("started", "failed") else None)(self._session_state()), timeout)
+        if status != "started":
+            raise RuntimeError(f"The session did not start: {status}.")
+        for port in self.ports:
+            self.node_ports[requests.get(url(port, "health"), timeout = 5).json()["id"]] = port
+        return time.perf_counter() - start
+
+    def _session_state(self):
+        """Returns the state of the start of the session, as the bootstrap node reports it."""
+        return requests.get(url(self.ports[0], "session_status"), timeout = 1).json()["state"]
+
+    def mempool_depths(self):
+        """Returns the number of transactions in the mempool of every node."""
+        return [requests.get(url(port, "mempool_metrics"), timeout = 5).json()["depth"] for port in self.ports]
+
+    def read_chain(self):
+        """Reads the whole chain of the bootstrap node and returns its blocks."""
+        with requests.get(url(self.ports[0], "get_blocks"), params = {"tip_height": -1}, timeout = 30, stream = True) as response:
+            response.raise_for_status()
+            return list(Blockchain.read_block_stream(response.raw))
+
+    def endpoint_stats(self):
+        """Returns the time every node spent on every endpoint: node id --> endpoint --> statistics."""
+        return {node_id: requests.get(url(port, "endpoint_stats"), timeout = 5).json() for node_id, port in sorted(self.node_ports.items())}
+
+    def stop(self):
+        """Stops all the node processes."""
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            try:
+                process.wait(timeout = 10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+# ======================================================================================================================================================
+# Replay
+# ======================================================================================================================================================
+
+def replay(cluster, workload, rate, batch, clients = 1):
+    """
+    Replays the workload of every node from {clients} concurrent threads per node, at {rate} transactions per second per node (0 for no limit),
+    in batches of {batch} transactions per request. Every thread replays every {clients}-th batch of the node.
+    Returns the list of submitted transactions as dicts with the node id, the hash, the result and the submission and response times.
+    """
+    submitted = []
+    submitted_lock = threading.Lock()
+
+    def replay_node(node_id, transactions, client):
+        session = requests.Session()
+        start = time.perf_counter()
+        for first in range(client * batch, len(transactions), clients * batch):
+            if rate:
+                # Keep the schedule of the rate, so that a slow request does not lower the offered load.
+                delay = start + first / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            chunk = transactions[first:first + batch]
+            submitted_at = time.time()
+            try:
+                response = session.post(url(cluster.node_ports[node_id], "make_transactions"), json = {"transactions": chunk, "all_or_nothing": False}, timeout = 120)
+                results = response.json().get("results") or [{"result": False, "hash": None}] * len(chunk)
+            except (requests.exceptions.RequestException, ValueError):
+                results = [{"result": False, "hash": None}] * len(chunk)
+            answered_at = time.time()
+            with submitted_lock:
+                for result in results:
+                    submitted.append({"node_id": node_id, "hash": result["hash"], "result": result["result"], "submitted_at": submitted_at, "answered_at": answered_at})
+
+    threads = [threading.Thread(target = replay_node, args = (node_id, transactions, client)) for node_id, transactions in workload.items() for client in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return submitted
+
+def build_report(args, startup_time, submitted, blocks, endpoint_stats):
+    """Builds the report of a run from the submitted transactions and the blocks of the chain."""
+    confirmed_at = {} # transaction hash --> timestamp of the block that holds it
+    for block in blocks:
+        for transaction in block.transactions:
+            confirmed_at[transaction.hash] = block.timestamp
+
+    accepted = [transaction for transaction in submitted if transaction["result"]]
+    confirmed = [transaction for transaction in accepted if transaction["hash"] in confirmed_at]
+    first_submission = min((transaction["submitted_at"] for transaction in submitted), default = None)
+    last_answer = max((transaction["answered_at"] for transaction in submitted), default = None)
+    last_confirmation = max((confirmed_at[transaction["hash"]] for transaction in confirmed), default = None)
+
+    # The block time counts only the blocks sealed during the replay.
+    workload_blocks = [block for block in blocks if first_submission is not None and block.timestamp >= first_submission]
+    block_times = [current.timestamp - previous.timestamp for previous, current in zip(workload_blocks, workload_blocks[1:])]
+
+    return {
+        "settings": {
+            "nodes": args.nodes,
+            "capacity": args.capacity,
+            "rate": args.rate,
+            "batch": args.batch,
+            "clients": args.clients,
+            "server": args.server or "default",
+            "workload": args.workload or f"synthetic, {args.transactions} per node"
+        },
+        "startup_time": startup_time,
+        "transactions": {
+            "submitted": len(submitted),
+            "accepted": len(accepted),
+            "confirmed": len(confirmed),
+            "unconfirmed": len(accepted) - len(confirmed) # e.g. fewer than a block's capacity left in the mempools
+        },
+        "throughput": {
+            "submitted_tps": len(accepted) / (last_answer - first_submission) if accepted and last_answer > first_submission else None,
+            "confirmed_tps": len(confirmed) / (last_confirmation - first_submission) if confirmed and last_confirmation > first_submission else None
+        },
+        "submission_latency": percentiles([transaction["answered_at"] - transaction["submitted_at"] for transaction in accepted]),
+        "confirmation_latency": percentiles([confirmed_at[transaction["hash"]] - transaction["submitted_at"] for transaction in confirmed]),
+        "block_time": {**percentiles(block_times), "blocks": len(workload_blocks), "chain_length": len(blocks)},
+        "endpoints": endpoint_stats
+    }
+
+def compare(report, baseline):
+    """Returns the relative change of every compared metric from the baseline report, and whether it is an improvement."""
+    comparison = {}
+    for (group, metric), higher_is_better in COMPARED_METRICS.items():
+        current = report.get(group, {}).get(metric)
+        previous = baseline.get(group, {}).get(metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        comparison[f"{group}.{metric}"] = {
+            "baseline": previous,
+            "current": current,
+            "change": change,
+            "improved": change > 0 if higher_is_better else change < 0
+        }
+    return comparison
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Cluster throughput and latency benchmark.")
+    parser.add_argument("--nodes", type = int, default = 5, help = "insert the number of nodes of the cluster")
+    parser.add_argument("--capacity", type = int, default = 5, help = "insert the block capacity")
+    parser.add_argument("--workload", default = None, help = "insert the directory with the trans{id}.txt workload files")
+    parser.add_argument("--transactions", type = int, default = 100, help = "insert the maximum number of transactions per node")
+    parser.add_argument("--rate", type = float, default = 0, help = "insert the transactions per second per node, 0 for no limit")
+    parser.add_argument("--batch", type = int, default = 1, help = "insert the number of transactions per /make_transactions request")
+    parser.add_argument("--clients", type = int, default = 1, help = "insert the number of concurrent client threads per node")
+    parser.add_argument("--server", choices = ["development", "production"], default = None, help = "insert the HTTP server of the nodes, config.SERVER by default")
+    parser.add_argument("--base-port", type = int, default = 5001, help = "insert the port of the first node after the bootstrap node")
+    parser.add_argument("--keys-dir", default = None, help = "insert a keystore directory shared across runs, to skip the key generation")
+    parser.add_argument("--timeout", type = float, default = 300, help = "insert the seconds to wait for the session start and for the mempools to drain")
+    parser.add_argument("--output", default = None, help = "insert the path of the JSON report, printed if not given")
+    parser.add_argument("--baseline", default = None, help = "insert the path of a previous JSON report to compare with")
+    parser.add_argument("--keep", action = "store_true", help = "insert to keep the working directory of the nodes (block stores and logs)")
+    args = parser.parse_args()
+
+    if args.workload is None:
+        workload = generate_workload(args.nodes, args.transactions)
+    else:
+        workload = load_workload(args.workload, args.nodes, args.transactions)
+
+    work_dir = tempfile.mkdtemp(prefix = "blockchat_cluster_")
+    cluster = Cluster(args.nodes, args.capacity, args.base_port, work_dir, args.keys_dir, args.server)
+    try:
+        startup_time = cluster.start(args.timeout)
+        print(f"Cluster of {args.nodes} nodes started in {startup_time:.2f}s.")
+        submitted = replay(cluster, workload, args.rate, args.batch, args.clients)
+        # A block is sealed only once a full block of transactions is ready, so the last transactions may never drain.
+        wait_until(lambda: max(cluster.mempool_depths()) < args.capacity, args.timeout)
+        report = build_report(args, startup_time, submitted, cluster.read_chain(), cluster.endpoint_stats())
+    finally:
+        cluster.stop()
+        if args.keep:
+            print(f"Working directory kept in {work_dir}.")
+        else:
+            shutil.rmtree(work_dir, ignore_errors = True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            report["comparison"] = compare(report, json.load(baseline_file))
+    if args.output is None:
+        print(json.dumps(report, indent = 2))
+    else:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent = 2)
+        print(f"Report written to {args.output}.")
@@ -0,0 +1,51 @@
+"""
+File: crypto_benchmark.py
+Description:
+
+    Compares the signature backends of the crypto engine (src/libraries/crypto_engine.py).
+    For every available backend, the script reports:
+        - signatures per second with the private key parsed once,
+        - verifications per second when the public key PEM is parsed on every call (the old path),
+        - verifications per second with the public key served from the engine's cache.
+    The backends whose packages are not installed are skipped.
+
+Usage: run "python benchmarks/crypto_benchmark.py [--repeat 200]"
+"""
+
+import os
+import sys
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import rsa
+from libraries.crypto_engine import BACKENDS, CryptoEngine, get_backend
+
+def throughput(function, repeat):
+    """Returns how many times per second the function runs."""
+    return repeat / timeit.timeit(function, number = repeat)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Crypto engine benchmark.")
+    parser.add_argument("--repeat", type = int, default = 200, help = "insert the number of operations per measurement")
+    args = parser.parse_args()
+
+    public_key, private_key = rsa.newkeys(2048)
+    public_key_pem = public_key.save_pkcs1().decode()
+    private_key_pem = private_key.save_pkcs1().decode()
+    data = "0" * 64 # the size of a transaction hash
+
+    print(f"{'backend':>13} {'sign/s':>8} {'verify/s (parse)':>17} {'verify/s (cached)':>18}")
+    for name in BACKENDS:
+        try:
+            backend = get_backend(name)
+        except ImportError:
+            print(f"{name:>13} skipped: the backend's package is not installed")
+            continue
+        engine = CryptoEngine(backend = backend)
+        signature = engine.sign(data, private_key_pem)
+        sign_rate = throughput(lambda: engine.sign(data, private_key_pem), args.repeat)
+        parse_rate = throughput(lambda: backend.verify(data.encode(), signature, backend.load_public_key(public_key_pem)), args.repeat)
+        cached_rate = throughput(lambda: engine.verify(data, signature, public_key_pem), args.repeat)
+        print(f"{name:>13} {sign_rate:>8.0f} {parse_rate:>17.0f} {cached_rate:>18.0f}")
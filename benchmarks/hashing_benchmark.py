@@ -0,0 +1,50 @@
+"""
+File: hashing_benchmark.py
+Description:
+
+    Compares the hashing of the transactions and the blocks:
+        - json: the old path, json.dumps(to_dict(), sort_keys = True) and SHA-256 on every call,
+        - canonical: the canonical binary encoding with the public keys replaced by their fingerprints, calculated on every call,
+        - memoised: the canonical hash as get_hash() / calculate_hash() return it, i.e. calculated once per object.
+    The script reports hashes per second for every path.
+
+Usage: run "python benchmarks/hashing_benchmark.py [--capacity 20] [--repeat 10000]"
+"""
+
+import os
+import sys
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import config
+from node import Node
+from block import Block
+from transaction import Transaction
+from libraries.functions_library import calculate_hash, calculate_digest
+
+def throughput(function, repeat):
+    """Returns how many times per second the function runs."""
+    return repeat / timeit.timeit(function, number = repeat)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Hashing benchmark.")
+    parser.add_argument("--capacity", type = int, default = 20, help = "insert the number of transactions per block")
+    parser.add_argument("--repeat", type = int, default = 10000, help = "insert the number of hashes per measurement")
+    args = parser.parse_args()
+    config.set_block_capacity(args.capacity)
+
+    sender = Node()
+    sender.id = 0
+    transaction = Transaction(sender, 1, sender.wallet.public_key, bcc = 10, message = "benchmark", nonce = 1)
+    block = Block(validator = sender, index = 1, previous_hash = "0" * 64)
+    for nonce in range(args.capacity):
+        block.add_transaction(Transaction(sender, 1, sender.wallet.public_key, bcc = 10, nonce = nonce + 1))
+
+    print(f"{'object':>12} {'json/s':>10} {'canonical/s':>12} {'memoised/s':>11}")
+    for name, obj, memoised in [("transaction", transaction, transaction.get_hash), ("block", block, block.calculate_hash)]:
+        json_rate = throughput(lambda: calculate_hash(obj.to_dict()), args.repeat)
+        canonical_rate = throughput(lambda: calculate_digest(obj.hashed_bytes()), args.repeat)
+        memoised_rate = throughput(memoised, args.repeat)
+        print(f"{name:>12} {json_rate:>10.0f} {canonical_rate:>12.0f} {memoised_rate:>11.0f}")
@@ -0,0 +1,96 @@
+"""
+File: wire_format_benchmark.py
+Description:
+
+    Compares the wire format of the transactions with the pickle of the whole transaction object,
+    which used to be sent to the /validate_transaction endpoint.
+    A pickled transaction carries the whole sender node (chain, ring and wallet),
+    so its size grows with the length of the chain, whereas the wire format does not.
+    For every chain length, the script reports the payload size in bytes
+    and the encode + decode throughput in transactions per second of both formats.
+
+Usage: run "python benchmarks/wire_format_benchmark.py [--chain-lengths 0 10 100] [--repeat 1000]"
+"""
+
+import os
+import sys
+import copy
+import pickle
+import timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import config
+from node import Node
+from block import Block
+from blockchain import Blockchain
+from transaction import Transaction
+
+def build_sender(chain_length):
+    """Returns a bootstrap node whose chain holds {chain_length} full blocks besides the genesis block."""
+    sender = Node()
+    sender.id = 0
+    sender.ip = config.BOOTSTRAP_IP
+    sender.port = config.BOOTSTRAP_PORT
+    sender.is_bootstrap = True
+    sender.wallet.balance = 10 ** 9
+    sender.ring = [{"id": 0, "ip": sender.ip, "port": sender.port, "public_key": sender.wallet.public_key}]
+    sender.chain = Blockchain(sender)
+    for _ in range(chain_length):
+        block = Block(validator = sender)
+        for _ in range(config.block_capacity):
+            block.add_transaction(build_transaction(sender))
+        sender.chain.add_block(block)
+    return sender
+
+def build_transaction(sender):
+    """Returns a signed transaction of the sender to itself."""
+    transaction = Transaction(sender, sender.id, sender.wallet.public_key, bcc = 10, message = "benchmark")
+    transaction.get_signature()
+    return transaction
+
+class LegacySender:
+    """
+    The state of the sender node that used to be pickled along with every transaction: its id, wallet, ring and chain.
+    The Node class itself holds locks and is no longer picklable.
+    """
+
+    def __init__(self, sender):
+        """Copies the pickled state of the given sender node."""
+        self.id = sender.id
+        self.wallet = sender.wallet
+        self.ring = sender.ring
+        self.chain = copy.copy(sender.chain)
+        self.chain.blocks = [copy.copy(block) for block in sender.chain.blocks]
+        for block in self.chain.blocks:
+            block.validator = self
+            block.transactions = [copy.copy(transaction) for transaction in block.transactions]
+            for transaction in block.transactions:
+                transaction.sender = self
+
+def legacy_transaction(transaction):
+    """Returns a copy of the transaction as it used to be pickled, i.e. with the whole state of its sender."""
+    legacy = copy.copy(transaction)
+    legacy.sender = LegacySender(transaction.sender)
+    return legacy
+
+def throughput(function, repeat):
+    """Returns how many times per second the function runs."""
+    return repeat / timeit.timeit(function, number = repeat)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Wire format benchmark.")
+    parser.add_argument("--chain-lengths", type = int, nargs = "+", default = [0, 10, 100], help = "insert the chain lengths to benchmark")
+    parser.add_argument("--repeat", type = int, default = 1000, help = "insert the number of encodings per measurement")
+    args = parser.parse_args()
+
+    print(f"{'chain':>6} {'pickle bytes':>13} {'wire bytes':>11} {'pickle tx/s':>12} {'wire tx/s':>10}")
+    for chain_length in args.chain_lengths:
+        transaction = build_transaction(build_sender(chain_length))
+        legacy = legacy_transaction(transaction)
+        pickle_size = len(pickle.dumps(legacy))
+        wire_size = len(transaction.to_bytes())
+        pickle_rate = throughput(lambda: pickle.loads(pickle.dumps(legacy)), args.repeat)
+        wire_rate = throughput(lambda: Transaction.from_bytes(transaction.to_bytes()), args.repeat)
+        print(f"{chain_length:>6} {pickle_size:>13} {wire_size:>11} {pickle_rate:>12.0f} {wire_rate:>10.0f}")
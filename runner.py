@@ -5,6 +5,8 @@ Description:
     Runs all the nodes in the network.
     There are two case-scenarios: one with 5 nodes and one with 10 nodes.
     The bootstrap node is always the first one to run, to initialize the session.
+    The other nodes are started as soon as the server of the bootstrap node answers, all at once,
+    and the runner waits until the bootstrap node reports that the session has started.
     The block capacity is retrieved as a required command-line argument.
     The Blockchat Application resides in src/app.py.
     Before running a node, the python virtual environment is activated.
@@ -14,7 +16,8 @@ Usage: run "python runner.py --capacity {capacity, choices = [5, 10, 20]}"
 """
 
 import subprocess
-from src.config import BOOTSTRAP_PORT
+import requests
+from src.config import BOOTSTRAP_IP, BOOTSTRAP_PORT, SESSION_READY_TIMEOUT, SESSION_POLL_INTERVAL
 from argparse import ArgumentParser
 import time
 
@@ -41,7 +44,22 @@ def run_node(port, nodes, capacity):
 
     # Run command in a new terminal window.
     subprocess.Popen(["C:\\path\\to\\git-bash.exe", "-c", command])
-    time.sleep(6)
+
+def wait_for_bootstrap(endpoint, is_done):
+    """
+    Polls the given endpoint of the bootstrap node until is_done(response) holds, instead of sleeping for a fixed time.
+    Returns the last response, or None if the bootstrap node did not get there within SESSION_READY_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + SESSION_READY_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(f"http://{BOOTSTRAP_IP}:{BOOTSTRAP_PORT}/blockchat/{endpoint}", timeout = SESSION_POLL_INTERVAL * 5)
+            if is_done(response):
+                return response
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(SESSION_POLL_INTERVAL)
+    return None
 
 if __name__ == "__main__":
     # Get block capacity from command-line arguments.
@@ -56,6 +74,13 @@ if __name__ == "__main__":
     # node_ports = [BOOTSTRAP_PORT, ]
     nodes = len(node_ports) # the total number of nodes
 
-    # Start each node in a separate terminal
-    for port in node_ports:
+    # Start the bootstrap node first and the other nodes as soon as its server answers, each in a separate terminal.
+    # The nodes register in any order and the bootstrap node starts the session once all of them report ready.
+    run_node(node_ports[0], nodes, capacity)
+    if wait_for_bootstrap("health", lambda response: response.status_code == 200) is None:
+        raise SystemExit("The bootstrap node did not start.")
+    for port in node_ports[1:]:
         run_node(port, nodes, capacity)
+
+    status = wait_for_bootstrap("session_status", lambda response: response.json()["state"] in ("started", "failed"))
+    print(status.json() if status is not None else "The session did not start in time.")
@@ -1,9 +1,17 @@
-from libraries.functions_library import calculate_hash
+from libraries.functions_library import calculate_digest
 from transaction import Transaction
 from time import time
-from libraries.custom_exceptions import BlockCapacityError
+from libraries.custom_exceptions import BlockCapacityError, WireFormatError
+from libraries.wire_format import WireWriter, WireReader, BLOCK_MAGIC, BLOCK_HASH_MAGIC
+from libraries.batch_verifier import batch_verifier
+from libraries.merkle_tree import MerkleTree
+from libraries.metrics import timed, HASH_LATENCY, SERIALIZATION_LATENCY
 import config
 
+# The attributes that the hash of the block covers. Changing any of them drops the memoised hash.
+# The transactions are covered through the Merkle root of their hashes, so the hashed data has the same size for any number of transactions.
+HASHED_FIELDS = frozenset(["index", "previous_hash", "transactions", "validator_id", "timestamp"])
+
 class Block:
     """
     A block in the blockchain.
@@ -13,7 +21,8 @@ class Block:
         index (int): the index of the block once it enters the blockchain.
         previous_hash (str): the hash of the previous block in the blockchain.
         transactions (list): the transactions that have been added to the block.
-        validator (Node object): the node object that creates the block.
+        validator (Node object): the node object that creates the block. It is None for a block received from another node.
+        validator_id (int): the id of the node that creates the block.
         timestamp (float): the timestamp when the block is created.
     """
 
@@ -23,6 +32,7 @@ class Block:
         self.previous_hash = previous_hash # Needed for validation purposes.
         self.transactions = [] # a list of the transaction objects (in dictionary form) that belong to the block
         self.validator = validator
+        self.validator_id = validator.id
         self.timestamp = time()
         self.hash = None
         self.get_new_hash()
@@ -31,25 +41,79 @@ class Block:
         """Returns a string representation of the block."""
         return str(self.__class__) + ": " + str(self.__dict__)
 
+    def __setattr__(self, name, value):
+        """Sets an attribute and drops the memoised hash if the attribute is hashed (and the Merkle tree if the transactions are replaced)."""
+        if name in HASHED_FIELDS:
+            self.__dict__.pop("_digest", None)
+        if name == "transactions":
+            self.__dict__.pop("_merkle_tree", None)
+        object.__setattr__(self, name, value)
+
     def to_dict(self):
-        """Converts the self block object to dict for the get_new_hash() function."""
+        """Converts the self block object to dict."""
         return {
             "index": self.index,
             "previous_hash": self.previous_hash,
             "transactions": [transaction.hash for transaction in self.transactions],
-            "validator": self.validator.id,
+            "merkle_root": self.merkle_root(),
+            "validator": self.validator_id,
             "timestamp": self.timestamp
         }
 
+    def hashed_bytes(self):
+        """Returns the canonical binary encoding of the hashed attributes of the block, in a fixed order."""
+        writer = WireWriter(BLOCK_HASH_MAGIC)
+        writer.int64(self.index)
+        writer.string(self.previous_hash)
+        writer.int64(self.validator_id)
+        writer.float64(self.timestamp)
+        writer.uint32(len(self.transactions))
+        writer.raw(bytes.fromhex(self.merkle_root()))
+        return writer.to_bytes()
+
+    def merkle_tree(self):
+        """
+        Returns the Merkle tree of the hashes of the transactions of the block.
+        The tree grows with every transaction added through add_transaction(); for a received block it is built on first use.
+        """
+        tree = self.__dict__.get("_merkle_tree")
+        if tree is None:
+            tree = MerkleTree(transaction.hash for transaction in self.transactions)
+            self.__dict__["_merkle_tree"] = tree
+        return tree
+
+    def merkle_root(self):
+        """Returns the Merkle root of the transactions of the block."""
+        return self.merkle_tree().root()
+
+    def transaction_proof(self, position):
+        """Returns the inclusion proof of the transaction at the given position of the block, to be checked against the Merkle root with verify_inclusion()."""
+        return self.merkle_tree().proof(position)
+
+    def calculate_hash(self):
+        """
+        Calculates the hash of the block from its hashed attributes.
+        The hash is memoised and only calculated again after a hashed attribute changes or a transaction is added through add_transaction().
+        """
+        digest = self.__dict__.get("_digest")
+        if digest is None:
+            with HASH_LATENCY.time(object = "block"):
+                digest = calculate_digest(self.hashed_bytes())
+            self.__dict__["_digest"] = digest
+        return digest
+
     def get_new_hash(self):
         """Calculates the hash of the block."""
-        self.hash = calculate_hash(self.to_dict())
+        self.hash = self.calculate_hash()
 
     def add_transaction(self, transaction):
         """Adds a new transaction to the block."""
         try:
             if len(self.transactions) < config.block_capacity:
+                tree = self.merkle_tree()
                 self.transactions.append(transaction)
+                tree.append(transaction.hash)
+                self.__dict__.pop("_digest", None) # the list of transactions changed in place
             else:
                 raise BlockCapacityError("Block capacity exceeded. The addition of the transaction is declined.")
         except BlockCapacityError as e:
@@ -67,6 +131,59 @@ class Block:
         self.previous_hash = previous_block.hash
 
     def is_valid(self):
-        """"""
-        ## FIX ME ##
-        return True
\ No newline at end of file
+        """
+        Checks whether the block is valid:
+            - the block does not exceed the block capacity,
+            - the hash of the block corresponds to its data,
+            - the signatures of all its transactions are valid (verified as a batch, in parallel).
+        """
+        if len(self.transactions) > config.block_capacity:
+            print(f"Block {self.index} exceeds the block capacity.")
+            return False
+        if self.hash != self.calculate_hash():
+            print(f"Invalid hash in block: {self.index}")
+            return False
+        for transaction, is_verified in zip(self.transactions, batch_verifier.verify_transactions(self.transactions)):
+            if not is_verified:
+                print(f"Invalid signature of transaction {transaction.hash} in block: {self.index}")
+                return False
+        return True
+
+    @timed(SERIALIZATION_LATENCY, object = "block", operation = "encode")
+    def to_bytes(self):
+        """
+        Encodes the self block in the wire format that is sent to the other nodes.
+        The transactions are embedded in their own wire format, one after the other.
+        """
+        writer = WireWriter(BLOCK_MAGIC)
+        writer.int64(self.index)
+        writer.string(self.previous_hash)
+        writer.int64(self.validator_id)
+        writer.float64(self.timestamp)
+        writer.string(self.hash)
+        writer.uint32(len(self.transactions))
+        for transaction in self.transactions:
+            writer.bytes(transaction.to_bytes())
+        return writer.to_bytes()
+
+    @classmethod
+    @timed(SERIALIZATION_LATENCY, object = "block", operation = "decode")
+    def from_bytes(cls, data):
+        """
+        Decodes a block received from another node.
+        The hash is kept as received, so that it can be checked against the decoded fields.
+        """
+        reader = WireReader(data, BLOCK_MAGIC)
+        block = cls.__new__(cls)
+        block.validator = None
+        block.index = reader.int64()
+        block.previous_hash = reader.string()
+        block.validator_id = reader.int64()
+        block.timestamp = reader.float64()
+        block.hash = reader.string()
+        block.transactions = [Transaction.from_bytes(reader.nested()) for _ in range(reader.uint32())]
+        reader.finish()
+        for field in ("index", "validator_id", "hash"):
+            if getattr(block, field) is None:
+                raise WireFormatError(f"Missing block field {field}.")
+        return block
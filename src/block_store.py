@@ -0,0 +1,262 @@
+import os
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from block import Block
+from libraries.custom_exceptions import WireFormatError
+import config
+
+# Every block in the segment file is stored as a 4-byte length followed by the block in the wire format,
+# so the index can always be rebuilt from the segment file alone.
+_RECORD_HEADER = struct.Struct("!I")
+# Every entry of the index file is the offset of the record in the segment file, the length of the encoded block and the raw block hash.
+_INDEX_ENTRY = struct.Struct("!QI32s")
+# Every entry of the checkpoint file is the height of the checkpoint, the raw hash of the block at that height and the raw chain digest.
+_CHECKPOINT_ENTRY = struct.Struct("!Q32s32s")
+
+class BlockStore:
+    """
+    An append-only store of the blocks of a blockchain on disk.
+
+    The store is made of three files in its directory:
+        - blocks.dat, the segment file with the encoded blocks one after the other, in the order of the chain,
+        - blocks.idx, the index file with one fixed-size entry per block, read through a memory map,
+        so that the block at any height is found without scanning the segment file,
+        - checkpoints.dat, the checkpoints of the validated chain, so that a restarted node does not validate the whole chain again.
+    A lookup table from block hash to height is built from the index when the store opens.
+
+    Attributes:
+        directory (str): the directory of the store.
+    """
+
+    def __init__(self, directory):
+        """Opens the store in the given directory, creating it if needed, and repairs a write interrupted by a crash."""
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+        self._segment = open(os.path.join(directory, "blocks.dat"), "a+b")
+        self._index = open(os.path.join(directory, "blocks.idx"), "a+b")
+        self._checkpoints = open(os.path.join(directory, "checkpoints.dat"), "a+b")
+        self._index_map = None
+        self._mapped_entries = 0
+        self._length = 0
+        self._heights = {} # block hash --> height
+        self._lock = threading.Lock()
+        self._recover()
+
+    def __str__(self):
+        """Returns a string representation of the block store."""
+        return str(self.__class__) + ": " + str({"directory": self.directory, "blocks": self._length})
+
+    def __len__(self):
+        """Returns the number of stored blocks."""
+        return self._length
+
+    def _recover(self):
+        """
+        Loads the index and makes the two files consistent:
+            - a partial index entry or an entry that points past the end of the segment file is dropped,
+            - the blocks of the segment file that are missing from the index (e.g. a lost or deleted index file) are indexed again,
+            - a partially written block at the end of the segment file is dropped,
+            - a partial checkpoint entry is dropped.
+        """
+        segment_size = os.fstat(self._segment.fileno()).st_size
+        index_size = os.fstat(self._index.fileno()).st_size
+        entries = index_size // _INDEX_ENTRY.size
+
+        # Find the last index entry that points to a complete block and the end of that block in the segment file.
+        self._remap(entries)
+        end = 0
+        while entries > 0:
+            offset, length, _ = self._entry(entries - 1)
+            if offset + _RECORD_HEADER.size + length <= segment_size:
+                end = offset + _RECORD_HEADER.size + length
+                break
+            entries -= 1
+        self._remap(entries)
+        if entries * _INDEX_ENTRY.size != index_size:
+            self._index.truncate(entries * _INDEX_ENTRY.size)
+
+        self._length = entries
+        for height in range(entries):
+            self._heights[self._entry(height)[2].hex()] = height
+        self._index_records_from(end, segment_size)
+
+        checkpoints_size = os.fstat(self._checkpoints.fileno()).st_size
+        if checkpoints_size % _CHECKPOINT_ENTRY.size:
+            self._checkpoints.truncate(checkpoints_size - checkpoints_size % _CHECKPOINT_ENTRY.size)
+
+    def _index_records_from(self, offset, segment_size):
+        """Indexes the complete records of the segment file from the given offset onwards and drops a partial record at its end."""
+        while offset + _RECORD_HEADER.size <= segment_size:
+            length = _RECORD_HEADER.unpack(os.pread(self._segment.fileno(), _RECORD_HEADER.size, offset))[0]
+            if offset + _RECORD_HEADER.size + length > segment_size:
+                break
+            try:
+                block = Block.from_bytes(os.pread(self._segment.fileno(), length, offset + _RECORD_HEADER.size))
+            except WireFormatError:
+                break
+            self._index.write(_INDEX_ENTRY.pack(offset, length, bytes.fromhex(block.hash)))
+            self._heights[block.hash] = self._length
+            self._length += 1
+            offset += _RECORD_HEADER.size + length
+        self._index.flush()
+        if offset != segment_size:
+            self._segment.truncate(offset)
+
+    def _remap(self, entries):
+        """Memory-maps the first {entries} entries of the index file."""
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        self._mapped_entries = entries
+        if entries > 0:
+            self._index_map = mmap.mmap(self._index.fileno(), entries * _INDEX_ENTRY.size, access = mmap.ACCESS_READ)
+
+    def _entry(self, height):
+        """Returns the (offset, length, raw hash) index entry of the block at the given height."""
+        if height >= self._mapped_entries:
+            # The index has grown since it was mapped.
+            self._remap(self._length)
+        return _INDEX_ENTRY.unpack_from(self._index_map, height * _INDEX_ENTRY.size)
+
+    def append(self, block):
+        """Appends the given block to the end of the store."""
+        encoded_block = block.to_bytes()
+        with self._lock:
+            offset = self._segment.seek(0, os.SEEK_END)
+            self._segment.write(_RECORD_HEADER.pack(len(encoded_block)) + encoded_block)
+            self._segment.flush()
+            # The index entry is written after the block, so an interrupted append never indexes a partial block.
+            self._index.write(_INDEX_ENTRY.pack(offset, len(encoded_block), bytes.fromhex(block.hash)))
+            self._index.flush()
+            if config.BLOCK_STORE_FSYNC:
+                os.fsync(self._segment.fileno())
+                os.fsync(self._index.fileno())
+            self._heights[block.hash] = self._length
+            self._length += 1
+
+    def read(self, height):
+        """Reads and decodes the block at the given height."""
+        with self._lock:
+            if not 0 <= height < self._length:
+                raise IndexError("Block height out of range.")
+            offset, length, _ = self._entry(height)
+        return Block.from_bytes(os.pread(self._segment.fileno(), length, offset + _RECORD_HEADER.size))
+
+    def append_checkpoint(self, height, block_hash, digest):
+        """Appends a checkpoint of the validated chain: its height, the hash of the block at that height and the chain digest (hex strings)."""
+        with self._lock:
+            self._checkpoints.write(_CHECKPOINT_ENTRY.pack(height, bytes.fromhex(block_hash), bytes.fromhex(digest)))
+            self._checkpoints.flush()
+            if config.BLOCK_STORE_FSYNC:
+                os.fsync(self._checkpoints.fileno())
+
+    def read_checkpoints(self):
+        """Returns the stored checkpoints as (height, block hash, digest) tuples, ignoring those above the stored blocks."""
+        with self._lock:
+            data = os.pread(self._checkpoints.fileno(), os.fstat(self._checkpoints.fileno()).st_size, 0)
+            length = self._length
+        return [(height, block_hash.hex(), digest.hex()) for height, block_hash, digest in _CHECKPOINT_ENTRY.iter_unpack(data) if height < length]
+
+    def truncate(self, length):
+        """Removes the blocks from the given height onwards, keeping the first {length} blocks, and the checkpoints above the kept blocks."""
+        with self._lock:
+            if length >= self._length:
+                return
+            offset = self._entry(length)[0]
+            for height in range(length, self._length):
+                self._heights.pop(self._entry(height)[2].hex(), None)
+            # The map must not cover the part of the index file that is cut off.
+            self._remap(0)
+            self._index.truncate(length * _INDEX_ENTRY.size)
+            self._segment.truncate(offset)
+            self._length = length
+            self._remap(length)
+            data = os.pread(self._checkpoints.fileno(), os.fstat(self._checkpoints.fileno()).st_size, 0)
+            kept = sum(1 for height, _, _ in _CHECKPOINT_ENTRY.iter_unpack(data) if height < length)
+            self._checkpoints.truncate(kept * _CHECKPOINT_ENTRY.size)
+            if config.BLOCK_STORE_FSYNC:
+                os.fsync(self._segment.fileno())
+                os.fsync(self._index.fileno())
+                os.fsync(self._checkpoints.fileno())
+
+    def height_of(self, block_hash):
+        """Returns the height of the block with the given hash, or None if it is not stored."""
+        return self._heights.get(block_hash)
+
+    def close(self):
+        """Closes the files of the store."""
+        with self._lock:
+            if self._index_map is not None:
+                self._index_map.close()
+                self._index_map = None
+            self._segment.close()
+            self._index.close()
+            self._checkpoints.close()
+
+class StoredBlocks:
+    """
+    The list of blocks of a Blockchain, backed by a BlockStore.
+    Supports the list operations that the blockchain uses (len, indexing, slicing, iteration and append).
+    Only the most recent blocks are kept decoded in memory; any other block is read from the store when it is accessed.
+
+    Attributes:
+        store (BlockStore object): the store that holds the blocks.
+        hot_blocks (int): the number of decoded blocks kept in memory.
+    """
+
+    def __init__(self, store, hot_blocks = None):
+        """Inits the list of blocks. Nothing is read from the store until a block is accessed."""
+        self.store = store
+        self.hot_blocks = config.BLOCK_STORE_HOT_BLOCKS if hot_blocks is None else hot_blocks
+        self._hot = OrderedDict() # height --> block, least recently used first
+        self._lock = threading.Lock() # guards the decoded blocks, which concurrent requests read and reorder
+
+    def __len__(self):
+        """Returns the number of blocks."""
+        return len(self.store)
+
+    def __iter__(self):
+        """Iterates over the blocks in the order of the chain."""
+        for height in range(len(self)):
+            yield self[height]
+
+    def __getitem__(self, key):
+        """Returns the block at the given height (negative heights count from the tip), or a list of blocks for a slice."""
+        if isinstance(key, slice):
+            return [self[height] for height in range(*key.indices(len(self)))]
+        height = key + len(self) if key < 0 else key
+        with self._lock:
+            block = self._hot.get(height)
+            if block is not None:
+                self._hot.move_to_end(height)
+                return block
+        block = self.store.read(height)
+        self._remember(height, block)
+        return block
+
+    def _remember(self, height, block):
+        """Keeps the decoded block in memory, evicting the least recently used one if needed."""
+        with self._lock:
+            self._hot[height] = block
+            if len(self._hot) > self.hot_blocks:
+                self._hot.popitem(last = False)
+
+    def append(self, block):
+        """Writes the block through to the store and keeps it in memory."""
+        self.store.append(block)
+        self._remember(len(self) - 1, block)
+
+    def truncate(self, length):
+        """Removes the blocks from the given height onwards from the store and from memory."""
+        self.store.truncate(length)
+        with self._lock:
+            for height in [height for height in self._hot if height >= length]:
+                del self._hot[height]
+
+def open_block_store(port):
+    """Opens the block store of the node listening on the given port, or returns None if the blockchain is kept in memory only."""
+    if config.BLOCK_STORE_DIR is None:
+        return None
+    return BlockStore(os.path.join(config.BLOCK_STORE_DIR, f"node_{port}"))
@@ -1,21 +1,71 @@
+import threading
 from block import Block
-from libraries.custom_exceptions import BootstrapError
-from libraries.functions_library import calculate_hash
+from block_store import StoredBlocks
+from libraries.custom_exceptions import BootstrapError, ChainSyncError
+from libraries.wire_format import stream_header, stream_frame, stream_end, read_stream, BLOCK_STREAM_MAGIC
+from libraries.functions_library import calculate_digest
+import config
+
+# The chain digest before the first block: every validated block extends the digest with its hash.
+_INITIAL_DIGEST = "0" * 64
+
+class Checkpoint:
+    """
+    A checkpoint of the validated chain.
+
+    Attributes:
+        height (int): the height of the last block covered by the checkpoint.
+        block_hash (str): the hash of the block at that height.
+        digest (str): the chain digest up to that height, i.e. the hash of the hashes of all the blocks up to it, in order.
+    """
+
+    def __init__(self, height, block_hash, digest):
+        """Inits a checkpoint."""
+        self.height = height
+        self.block_hash = block_hash
+        self.digest = digest
+
+    def __str__(self):
+        """Returns a string representation of the checkpoint."""
+        return str(self.__class__) + ": " + str(self.__dict__)
 
 class Blockchain:
     """
     The blockchain.
 
     Attributes:
-        blocks (list): the blocks that have been validated and have entered the blockchain.
+        blocks (list or StoredBlocks object): the blocks that have been validated and have entered the blockchain.
+        validated_height (int): the watermark of the validation, i.e. the height of the last block up to which the chain is known to be valid, -1 if none.
+        checkpoints (list): the Checkpoint objects of the validated chain, one every config.CHECKPOINT_INTERVAL blocks, in order.
+        block_heights (dict): index of the blocks, block hash --> height.
+        transaction_locations (dict): index of the transactions in the blocks, transaction hash --> (height, position in the block).
+        account_transactions (dict): index of the transactions of every account, public key --> list of (height, position),
+            in the order of the chain, with every transaction that the account sent or received.
     """
 
-    def __init__(self, bootstrap_node):
-        """Inits the blockchain."""
-        if bootstrap_node.id != 0:
+    def __init__(self, bootstrap_node = None, store = None):
+        """
+        Inits the blockchain.
+        Without a bootstrap node, the blockchain starts empty and receives all its blocks, genesis included, from a chain synchronization.
+        With a block store, the blocks are written through to disk and the blocks stored by a previous run are loaded lazily,
+        in which case the genesis block is not created again.
+        """
+        if bootstrap_node is not None and bootstrap_node.id != 0:
             raise BootstrapError("The node initiating the blockchain is not the bootstrap node.")
-        self.blocks = []
-        self.create_genesis_block(bootstrap_node)
+        self.blocks = [] if store is None else StoredBlocks(store)
+        self.validated_height = -1
+        self.checkpoints = []
+        self._digest = _INITIAL_DIGEST # the chain digest up to the validated height
+        self._store = store
+        self.block_heights = {}
+        self.transaction_locations = {}
+        self.account_transactions = {}
+        self._indexed_height = -1 # the height of the last indexed block
+        self._lock = threading.RLock() # guards the blocks and the indexes against the concurrent requests that read them while blocks are appended
+        if store is not None:
+            self._load_checkpoints()
+        if bootstrap_node is not None and not self.blocks:
+            self.create_genesis_block(bootstrap_node)
 
     def __str__(self):
         """Returns a string representation of the blockchain."""
@@ -24,7 +74,8 @@ class Blockchain:
     def create_genesis_block(self, bootstrap_node):
         """Creates the genesis block on behalf of the bootstrap node and places it into the blockchain."""
         genesis_block = Block(validator = bootstrap_node, index = 0, previous_hash = "1")
-        self.blocks.append(genesis_block)
+        self._append_block(genesis_block)
+        self._mark_validated(0)
 
     def add_block(self, block):
         """Adds a new, validated block into the blockchain."""
@@ -33,23 +84,354 @@ class Blockchain:
         block.update_previous_hash(self.blocks[-1])
         block.get_new_hash()
         if block.is_valid():
-            self.blocks.append(block)
+            self._append_block(block)
+            if self.validated_height == len(self.blocks) - 2:
+                self._mark_validated(len(self.blocks) - 1)
         else:
             block.index = None
             block.previous_hash = None
             block.hash = initial_block_hash ## FIX ME: This or get_new_hash() or exception
 
+    def _append_block(self, block):
+        """Appends a block to the end of the chain and adds it to the indexes."""
+        with self._lock:
+            self.blocks.append(block)
+            if self._indexed_height == len(self.blocks) - 2:
+                self._index_block(len(self.blocks) - 1, block)
+
     def is_valid(self):
-        """Checks if the chain is valid."""
-        for i in range(1, len(self.blocks)): # skip the validation of the genesis block
-            current_block = self.blocks[i]
-            previous_block = self.blocks[i-1]
-            # Current block hash validation, i.e. the data in the block has not been tampered with.
-            if current_block.hash != calculate_hash(current_block.to_dict()):
-                print(f"Invalid hash in block: {i}")
-                return False
-            # Previous block hash validation, i.e. the blocks in the blockchain are linked in the correct order.
-            if current_block.previous_hash != previous_block.hash:
-                print(f"Mismatched previous hash in block: {i}")
+        """
+        Checks if the chain is valid.
+        Only the blocks above the validation watermark are checked, since the blocks below it have been checked already,
+        e.g. when they entered the chain. The watermark moves up to the last valid block.
+        """
+        for height in range(self.validated_height + 1, len(self.blocks)):
+            if not self._is_valid_block(height) or not self._mark_validated(height):
                 return False
-        return True
\ No newline at end of file
+        return True
+
+    def audit(self, from_checkpoint = True):
+        """
+        Checks the chain again, regardless of the validation watermark, e.g. to detect blocks tampered with on disk.
+        With from_checkpoint = True, the audit resumes from the last checkpoint whose block is still in the chain,
+        so only the blocks above it are checked again.
+        With from_checkpoint = False, the whole chain is checked from the genesis block and the chain digest is compared
+        with every checkpoint on the way.
+        Returns True if the chain is valid, else False, in which case the watermark stays below the first invalid block.
+        """
+        checkpoint = None
+        if from_checkpoint:
+            checkpoint = next((checkpoint for checkpoint in reversed(self.checkpoints)
+                               if checkpoint.height < len(self.blocks) and self.blocks[checkpoint.height].hash == checkpoint.block_hash), None)
+        if checkpoint is None:
+            self.validated_height, self._digest = -1, _INITIAL_DIGEST
+        else:
+            self.validated_height, self._digest = checkpoint.height, checkpoint.digest
+        return self.is_valid()
+
+    def _is_valid_block(self, height):
+        """Checks the block at the given height: its link to the previous block, its hash and its transactions (skipped for the genesis block)."""
+        if height == 0:
+            return True
+        current_block = self.blocks[height]
+        previous_block = self.blocks[height - 1]
+        # Previous block hash validation, i.e. the blocks in the blockchain are linked in the correct order.
+        if current_block.index != height or current_block.previous_hash != previous_block.hash:
+            print(f"Mismatched previous hash in block: {height}")
+            return False
+        # Current block validation, i.e. the data in the block has not been tampered with.
+        return current_block.is_valid()
+
+    def _mark_validated(self, height):
+        """
+        Moves the validation watermark to the given height, which must be the block right above it,
+        extends the chain digest with the hash of the block and records a checkpoint every config.CHECKPOINT_INTERVAL blocks.
+        A checkpoint that is already known is compared with the digest instead, so an audit never records it twice.
+        Returns False, without moving the watermark, if the digest does not match the known checkpoint.
+        """
+        block_hash = self.blocks[height].hash
+        digest = calculate_digest(bytes.fromhex(self._digest) + bytes.fromhex(block_hash))
+        if height > 0 and height % config.CHECKPOINT_INTERVAL == 0:
+            position = height // config.CHECKPOINT_INTERVAL - 1
+            if position < len(self.checkpoints):
+                if self.checkpoints[position].digest != digest:
+                    print(f"Mismatched chain digest at checkpoint: {height}")
+                    return False
+            else:
+                checkpoint = Checkpoint(height, block_hash, digest)
+                self.checkpoints.append(checkpoint)
+                if self._store is not None:
+                    self._store.append_checkpoint(checkpoint.height, checkpoint.block_hash, checkpoint.digest)
+        self.validated_height, self._digest = height, digest
+        return True
+
+    def _load_checkpoints(self):
+        """
+        Loads the checkpoints of the block store and moves the validation watermark to the last of them,
+        since the blocks of the store up to it were validated by a previous run.
+        """
+        for height, block_hash, digest in self._store.read_checkpoints():
+            if height != (len(self.checkpoints) + 1) * config.CHECKPOINT_INTERVAL:
+                break # the checkpoint interval has changed since the checkpoints were recorded
+            self.checkpoints.append(Checkpoint(height, block_hash, digest))
+        if self.checkpoints and self.blocks[self.checkpoints[-1].height].hash == self.checkpoints[-1].block_hash:
+            self.validated_height, self._digest = self.checkpoints[-1].height, self.checkpoints[-1].digest
+        else:
+            self.checkpoints = []
+
+# ======================================================================================================================================================
+# Indexes
+# ======================================================================================================================================================
+
+    def _index_block(self, height, block):
+        """Adds the block at the given height and its transactions to the indexes."""
+        self.block_heights[block.hash] = height
+        for position, transaction in enumerate(block.transactions):
+            self.transaction_locations[transaction.hash] = (height, position)
+            self.account_transactions.setdefault(transaction.sender_public_key, []).append((height, position))
+            if transaction.recipient_public_key != transaction.sender_public_key:
+                self.account_transactions.setdefault(transaction.recipient_public_key, []).append((height, position))
+        self._indexed_height = height
+
+    def _update_indexes(self):
+        """
+        Indexes the blocks that are not indexed yet.
+        The blocks appended to the chain are indexed as they enter it, so this only catches up with the blocks loaded from a block store,
+        which are indexed on the first query instead of when the node starts.
+        Concurrent queries catch up under the lock of the chain, so no block is indexed twice.
+        """
+        with self._lock:
+            for height in range(self._indexed_height + 1, len(self.blocks)):
+                self._index_block(height, self.blocks[height])
+
+    def get_block(self, block_hash):
+        """Returns the block with the given hash, or None if it is not in the chain."""
+        with self._lock:
+            self._update_indexes()
+            height = self.block_heights.get(block_hash)
+            return None if height is None else self.blocks[height]
+
+    def find_transaction(self, transaction_hash):
+        """Returns (transaction, height, position) for the transaction with the given hash, or None if it is not in the chain."""
+        with self._lock:
+            self._update_indexes()
+            location = self.transaction_locations.get(transaction_hash)
+            if location is None:
+                return None
+            height, position = location
+            return self.blocks[height].transactions[position], height, position
+
+    def account_history(self, public_key, offset = 0, limit = None):
+        """
+        Returns a page of the transactions that the account with the given public key sent or received, most recent first,
+        as (total number of transactions of the account, list of (transaction, height, position)).
+        """
+        with self._lock:
+            self._update_indexes()
+            locations = self.account_transactions.get(public_key, [])
+            limit = len(locations) if limit is None else limit
+            end = max(len(locations) - offset, 0)
+            page = locations[max(end - limit, 0):end][::-1]
+            return len(locations), [(self.blocks[height].transactions[position], height, position) for height, position in page]
+
+# ======================================================================================================================================================
+# Chain Synchronization
+# ======================================================================================================================================================
+
+    def _unindex_blocks_above(self, height):
+        """Removes the indexed blocks above the given height and their transactions from the indexes, most recent first."""
+        public_keys = set()
+        for removed_height in range(self._indexed_height, height, -1):
+            block = self.blocks[removed_height]
+            self.block_heights.pop(block.hash, None)
+            for transaction in block.transactions:
+                location = self.transaction_locations.get(transaction.hash)
+                if location is not None and location[0] == removed_height:
+                    del self.transaction_locations[transaction.hash]
+                public_keys.update((transaction.sender_public_key, transaction.recipient_public_key))
+        # The locations of every account are in the order of the chain, so the removed ones are at the end.
+        for public_key in public_keys:
+            locations = self.account_transactions.get(public_key, [])
+            while locations and locations[-1][0] > height:
+                locations.pop()
+            if not locations:
+                self.account_transactions.pop(public_key, None)
+        self._indexed_height = min(self._indexed_height, height)
+
+    def tip(self):
+        """Returns the height and the hash of the last block in the chain, or (-1, None) if the chain is empty."""
+        with self._lock:
+            if not self.blocks:
+                return -1, None
+            return len(self.blocks) - 1, self.blocks[-1].hash
+
+    def stream_blocks_after(self, tip_height, tip_hash):
+        """
+        Returns a stream with the blocks that follow the given tip of the requesting node, in the wire format:
+        a header, then every block prefixed by its length, then an empty frame (see libraries.wire_format.read_stream()).
+        The stream is a generator that encodes one block at a time, so serving a chain of any length holds one block in memory.
+        It ends at the tip of the chain when the stream starts, or earlier if the chain is reorganized below the blocks not sent yet.
+        Raises ChainSyncError, before the stream starts, if the given tip is not a block of the self chain.
+        """
+        with self._lock:
+            length = len(self.blocks)
+            if tip_height >= length:
+                raise ChainSyncError(f"The requested tip {tip_height} is above the tip of the chain {length - 1}.")
+            if tip_height >= 0 and self.blocks[tip_height].hash != tip_hash:
+                raise ChainSyncError(f"The requested tip {tip_height} does not match block {tip_height} of the chain.")
+        return self._encode_stream(tip_height + 1, length, tip_hash)
+
+    def _encode_stream(self, height, length, previous_hash):
+        """Yields the stream of the blocks from the given height up to the given length, each on top of the previous one."""
+        yield stream_header(BLOCK_STREAM_MAGIC)
+        # Other requests may append, or replace, blocks while the stream is sent, so every block is read under the lock.
+        while height < length:
+            with self._lock:
+                if height >= len(self.blocks) or (height > 0 and self.blocks[height].previous_hash != previous_hash):
+                    break
+                block = self.blocks[height]
+            yield stream_frame(block.to_bytes())
+            previous_hash = block.hash
+            height += 1
+        yield stream_end()
+
+    @staticmethod
+    def read_block_stream(stream, max_block_bytes = None):
+        """
+        Reads a stream made by stream_blocks_after() from a binary file-like object, e.g. the raw body of an HTTP response,
+        and yields its blocks as they arrive, decoding each one from a memoryview over its own buffer.
+        Raises WireFormatError if the stream is malformed, cut short, or holds a block larger than max_block_bytes (config.SYNC_MAX_BLOCK_BYTES by default).
+        """
+        max_block_bytes = config.SYNC_MAX_BLOCK_BYTES if max_block_bytes is None else max_block_bytes
+        for data in read_stream(stream, BLOCK_STREAM_MAGIC, max_block_bytes):
+            yield Block.from_bytes(data)
+
+    @staticmethod
+    def _check_synced_block(block, tip_height, tip_hash):
+        """Checks that a received block is valid and extends the given tip. Raises ChainSyncError otherwise."""
+        if block.index != tip_height + 1:
+            raise ChainSyncError(f"Received block {block.index} does not follow block {tip_height}.")
+        if tip_height >= 0 and block.previous_hash != tip_hash:
+            raise ChainSyncError(f"Mismatched previous hash in received block: {block.index}")
+        if not block.is_valid():
+            raise ChainSyncError(f"Received block {block.index} is invalid.")
+
+    def _append_synced_block(self, block):
+        """Appends a checked block to the end of the chain and moves the validation watermark over it, if the watermark is at the tip."""
+        self._append_block(block)
+        if self.validated_height == block.index - 1:
+            self._mark_validated(block.index)
+
+    def append_synced_blocks(self, blocks):
+        """
+        Appends the blocks received from a chain synchronization to the end of the self chain, without rebuilding it.
+        Every block must be valid and extend the current tip of the chain, otherwise ChainSyncError is raised
+        and the blocks from the invalid one onwards are not appended.
+        """
+        for block in blocks:
+            with self._lock:
+                self._check_synced_block(block, *self.tip())
+                self._append_synced_block(block)
+
+# ======================================================================================================================================================
+# Forks
+# ======================================================================================================================================================
+
+    def locator(self):
+        """
+        Returns the block locator of the chain: the hashes of the last config.SYNC_LOCATOR_DENSE_BLOCKS blocks, from the tip down,
+        then of blocks further and further apart, the step doubling every time, down to the genesis block.
+        A peer finds the most recent block that both chains share from the first hash of the locator that it knows,
+        with only O(log N) hashes for a chain of N blocks.
+        """
+        with self._lock:
+            hashes = []
+            height = len(self.blocks) - 1
+            step = 1
+            while height > 0:
+                hashes.append(self.blocks[height].hash)
+                if len(hashes) >= config.SYNC_LOCATOR_DENSE_BLOCKS:
+                    step *= 2
+                height -= step
+            if self.blocks:
+                hashes.append(self.blocks[0].hash)
+            return hashes
+
+    def fork_point(self, locator):
+        """
+        Returns the height of the most recent block of the self chain that the given block locator lists,
+        -1 for an empty locator (the requesting chain is empty), or None if the chains share no block.
+        """
+        if not locator:
+            return -1
+        with self._lock:
+            self._update_indexes()
+            return next((self.block_heights[block_hash] for block_hash in locator if block_hash in self.block_heights), None)
+
+    def stream_blocks_after_locator(self, locator):
+        """
+        Returns a stream with the blocks that follow the most recent block that the self chain shares with the given block locator,
+        as stream_blocks_after() does. The requesting node learns that block from the index of the first block of the stream.
+        Raises ChainSyncError if the chains share no block.
+        """
+        with self._lock:
+            height = self.fork_point(locator)
+            if height is None:
+                raise ChainSyncError("The chains share no block.")
+            return self.stream_blocks_after(height, self.blocks[height].hash if height >= 0 else None)
+
+    def is_preferred_to(self, tip_height, tip_hash):
+        """
+        Returns whether the self chain is preferred to a chain with the given tip: the longer chain is preferred
+        and, between chains of the same length, the one with the lower tip hash, so that every node makes the same choice.
+        """
+        own_height, own_hash = self.tip()
+        if own_height != tip_height:
+            return own_height > tip_height
+        return own_height < 0 or own_hash <= tip_hash
+
+    def check_blocks_after(self, height, blocks):
+        """
+        Checks that the given blocks of another chain are valid and extend the block of the self chain at the given height, one after the other,
+        without changing the self chain. Raises ChainSyncError otherwise.
+        """
+        with self._lock:
+            tip_height, tip_hash = height, self.blocks[height].hash if height >= 0 else None
+            for block in blocks:
+                self._check_synced_block(block, tip_height, tip_hash)
+                tip_height, tip_hash = block.index, block.hash
+
+    def truncate(self, height):
+        """
+        Removes the blocks above the given height from the chain, together with their entries in the indexes and in the block store.
+        The checkpoints above the height are dropped and the validation watermark moves down to the height, if it is above it.
+        Costs O(number of removed blocks + config.CHECKPOINT_INTERVAL). Returns the removed blocks, in order.
+        """
+        with self._lock:
+            if height >= len(self.blocks) - 1:
+                return []
+            removed = self.blocks[height + 1:]
+            self._unindex_blocks_above(height)
+            if self._store is None:
+                del self.blocks[height + 1:]
+            else:
+                self.blocks.truncate(height + 1)
+            self.checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint.height <= height]
+            if self.validated_height > height:
+                # The digest at the height is rebuilt from the last checkpoint below it.
+                checkpoint = self.checkpoints[-1] if self.checkpoints else None
+                self.validated_height, self._digest = (checkpoint.height, checkpoint.digest) if checkpoint else (-1, _INITIAL_DIGEST)
+                for validated_height in range(self.validated_height + 1, height + 1):
+                    self._mark_validated(validated_height)
+            return removed
+
+    def replace_blocks_after(self, height, blocks):
+        """
+        Replaces the blocks above the given height with the given blocks of another chain, which must have been checked with check_blocks_after().
+        Returns the removed blocks of the self chain, in order.
+        """
+        with self._lock:
+            removed = self.truncate(height)
+            for block in blocks:
+                self._append_synced_block(block)
+            return removed
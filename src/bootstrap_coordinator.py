@@ -0,0 +1,124 @@
+import math
+import time
+import json
+import threading
+import config
+from libraries.custom_exceptions import SessionInitializationError
+from libraries.broadcast_engine import broadcast_engine
+
+class BootstrapCoordinator:
+    """
+    Starts the session on behalf of the bootstrap node.
+
+    The nodes register with the bootstrap node in any order, possibly at the same time, and report when they are ready,
+    i.e. when their server is up and they know the total number of nodes and the block capacity.
+    Once every node is ready (the readiness barrier), the coordinator starts the session:
+        - the final ring is sent to all the nodes concurrently,
+        - all the nodes synchronize their chain with the bootstrap node's chain concurrently,
+        - the bootstrap node sends the initial coins to every node as a single batch of transactions,
+        and the session starts once the batch is confirmed in the chain.
+
+    Attributes:
+        node (Node object): the bootstrap node.
+        ready_nodes (set): the ids of the nodes that have reported ready.
+        state (str): 'registering', 'starting', 'started' or 'failed'.
+        error (str): the reason why the session failed to start, None if it did not fail.
+    """
+
+    def __init__(self, node):
+        """Inits the coordinator of the given bootstrap node."""
+        self.node = node
+        self.ready_nodes = set()
+        self.state = "registering"
+        self.error = None
+        self._lock = threading.Lock() # guards the registration and the readiness barrier
+
+    def __str__(self):
+        """Returns a string representation of the coordinator."""
+        return str(self.__class__) + ": " + str(self.status())
+
+    def register(self, ip, port, public_key):
+        """
+        Registers a new node in the network, adds it to the ring and returns its id.
+        Raises SessionInitializationError if the network is already full.
+        """
+        with self._lock:
+            if len(self.node.ring) >= config.total_nodes:
+                raise SessionInitializationError(f"The network is full: all {config.total_nodes} nodes have registered.")
+            new_node_id = len(self.node.ring)
+            self.node.register_node_to_ring(new_node_id, ip, port, public_key)
+            return new_node_id
+
+    def mark_ready(self, node_id):
+        """
+        Records that the node with the given id is ready.
+        The last node to report ready releases the barrier, and the session starts in a background thread.
+        """
+        with self._lock:
+            if not 0 < node_id < len(self.node.ring):
+                raise SessionInitializationError(f"Node {node_id} has not registered.")
+            self.ready_nodes.add(node_id)
+            if self.state != "registering" or len(self.ready_nodes) < config.total_nodes - 1:
+                return
+            self.state = "starting"
+        threading.Thread(target = self._start_session, name = "session-start", daemon = True).start()
+
+    def status(self):
+        """Returns the progress of the start of the session."""
+        return {
+            "state": self.state,
+            "total_nodes": config.total_nodes,
+            "registered_nodes": len(self.node.ring),
+            "ready_nodes": len(self.ready_nodes) + 1, # the bootstrap node is ready once it answers
+            "error": self.error
+        }
+
+    def _start_session(self):
+        """Sends the ring and the chain to every node and funds them. Runs once, after the readiness barrier."""
+        try:
+            peers = self.node.ring[1:] # exclude the bootstrap node
+            self._broadcast(peers, "post_ring", json.dumps({"ring": self.node.ring}))
+            self._broadcast(peers, "sync_chain", {"ip": self.node.ip, "port": self.node.port})
+
+            # Now that everyone in the network has the ring and the initial image of the blockchain,
+            # the bootstrap node sends everyone their initial coins in one batch, so that we can get started.
+            funding = self._funding_transactions(peers)
+            funding_results = self.node.create_transactions(funding, all_or_nothing = True)
+            for (recipient_id, _, _, _), (result, description, _) in zip(funding, funding_results):
+                if not result:
+                    raise SessionInitializationError(f"Funding of node {recipient_id} failed: {description}")
+            self._wait_until_confirmed(funding_results[-1][2])
+            print(f"Session started: {len(peers)} nodes funded with {config.GENESIS_BCC_PER_NODE} BCC each.")
+            self.state = "started"
+        except SessionInitializationError as e:
+            print(f"{e}")
+            self.state, self.error = "failed", f"{e}"
+
+    @staticmethod
+    def _funding_transactions(peers):
+        """
+        Returns the funding transactions of the peers, as inputs of Node.create_transactions().
+        Only full blocks are sealed, so the funding of every peer is split into as many equal parts as it takes for the batch
+        to fill whole blocks; otherwise the coins of the peers would wait in the mempools until other transactions fill the last block.
+        """
+        parts = config.block_capacity // math.gcd(len(peers), config.block_capacity)
+        funding = []
+        for part in range(parts):
+            amount = config.GENESIS_BCC_PER_NODE // parts + (config.GENESIS_BCC_PER_NODE % parts if part == parts - 1 else 0)
+            funding += [(peer["id"], peer["public_key"], amount, None) for peer in peers]
+        return funding
+
+    def _wait_until_confirmed(self, transaction_hash):
+        """Waits until the transaction with the given hash enters the chain of the bootstrap node. Raises SessionInitializationError on timeout."""
+        deadline = time.monotonic() + config.SESSION_READY_TIMEOUT
+        while self.node.chain.find_transaction(transaction_hash) is None:
+            if time.monotonic() >= deadline:
+                raise SessionInitializationError("The funding of the nodes was not confirmed in time.")
+            time.sleep(config.SESSION_POLL_INTERVAL)
+
+    def _broadcast(self, peers, endpoint, data):
+        """Posts the data to the given endpoint of all the peers concurrently. Raises SessionInitializationError if a peer fails."""
+        result = broadcast_engine.broadcast(peers, endpoint = endpoint, data = data, deadline = config.SESSION_READY_TIMEOUT, stop_on_rejection = False)
+        for peer_result in result.rejections():
+            raise SessionInitializationError(f"Session start failed at {endpoint} of node {peer_result.node_id}: {peer_result.outcome}. {peer_result.message or ''}")
+        print(f"Session start: {endpoint} of {len(peers)} nodes in {result.elapsed:.3f}s.")
@@ -4,6 +4,9 @@ BOOTSTRAP_IP = "127.0.0.1"
 # BOOTSTRAP_PORT = "5000"
 BOOTSTRAP_PORT = "9876"
 
+GENESIS_BCC_PER_NODE = 1000 # BCC that every node receives from the bootstrap node when the session starts
+BCC_CENTS = 100 # fixed-point units per BCC in which the ledger and the wallets keep every amount, so that the 3% fee of any whole amount is exact
+
 block_capacity = 5 # default value for the capacity of the blocks
 total_nodes = 0 # initialize the total number of nodes in the network
 
@@ -17,4 +20,69 @@ def set_total_nodes(value):
     """Updates the global variable total_nodes with the given value."""
     # The given value should be passed to the main program as a command-line argument.
     global total_nodes
-    total_nodes = value
\ No newline at end of file
+    total_nodes = value
+
+# Settings of the start of a session, coordinated by the bootstrap node.
+SESSION_READY_TIMEOUT = 120 # seconds that a node waits for a server (its own or the bootstrap's) to answer, or for the session to start
+SESSION_POLL_INTERVAL = 0.2 # seconds between two checks of whether a server answers
+
+# Settings of the HTTP server of every node.
+SERVER = "development" # "development" (the threaded Flask development server) or "production" (waitress, requires the waitress package)
+SERVER_THREADS = 16 # threads that serve the requests of a node in production mode
+
+# Settings of the metrics exposed at /blockchat/metrics.
+METRICS_ENABLED = True # whether the latency histograms and the counters are recorded
+
+# Settings of the peer client that carries all the inter-node HTTP requests.
+PEER_CONNECT_TIMEOUT = 3.05 # seconds to wait for a TCP connection to a peer
+PEER_READ_TIMEOUT = 30 # seconds to wait for a peer to answer a request
+PEER_MAX_RETRIES = 3 # retries of a failed request, on top of the initial attempt
+PEER_BACKOFF_FACTOR = 0.1 # the n-th retry waits PEER_BACKOFF_FACTOR * 2 ** (n - 1) seconds
+PEER_MAX_CONCURRENCY = 8 # maximum number of simultaneous requests (and pooled connections) per peer
+
+# Settings of the broadcast engine that fans requests out to all the nodes in the network.
+BROADCAST_DEADLINE = 10 # seconds after which the peers that have not answered a broadcast count as failed
+BROADCAST_MAX_WORKERS = 32 # threads that carry the blocking HTTP requests of all the broadcasts
+
+# Settings of the relay tree that carries the transactions and the blocks to all the nodes in the network.
+RELAY_FANOUT = 4 # nodes to which every node relays a message; a fanout of total_nodes - 1 makes the sender contact every node directly
+RELAY_DEADLINE_FACTOR = 0.75 # share of its own deadline that a node gives to its children to answer for their subtrees in a relayed validation
+VALIDATED_NONCE_TIMEOUT = 30 # seconds during which a nonce that a node has validated lets the next nonce of the sender validate, while the transaction is relayed to its mempool
+RELAY_SEEN_CACHE_SIZE = 100000 # hashes of accepted transactions and blocks kept to drop the duplicates
+
+# Settings of the crypto engine that signs and verifies the transactions.
+SIGNATURE_BACKEND = "rsa" # "rsa" (pure Python, always available) or "cryptography" (requires the cryptography package)
+PUBLIC_KEY_CACHE_SIZE = 1024 # parsed public keys of the peers kept in memory
+VERIFIED_SIGNATURE_CACHE_SIZE = 50000 # (transaction hash, signature) pairs already verified as valid, whose signatures are not verified again
+
+# Settings of the batch verifier that checks the signatures of many transactions at once.
+BATCH_VERIFY_WORKERS = None # processes of the verification pool, None for one per CPU core
+BATCH_VERIFY_MIN_PARALLEL = 4 # smaller batches are verified in the calling thread, since the pool round trip would cost more
+
+# Settings of the chain synchronization, which transfers only the blocks that the requesting node is missing.
+SYNC_MAX_BLOCK_BYTES = 16 * 1024 * 1024 # largest block that a node accepts from the stream of a peer, so a bad length prefix cannot exhaust its memory
+SYNC_LOCATOR_DENSE_BLOCKS = 10 # most recent blocks whose hashes a block locator lists one by one, before the steps between the listed blocks start doubling
+
+# Settings of the block store that keeps the blockchain on disk.
+BLOCK_STORE_DIR = None # directory with one block store per node (named after its port), None (the default) to keep the blockchain in memory only (see also --block-store-dir)
+BLOCK_STORE_HOT_BLOCKS = 256 # most recent blocks kept decoded in memory
+BLOCK_STORE_FSYNC = False # whether every appended block is forced to disk before add_block() returns
+
+# Settings of the keystore that keeps the key pair of every node across restarts.
+KEYSTORE_DIR = None # directory of the keystore, None (the default) to generate a new key pair on every start (see also --keystore-dir)
+KEY_SIZE = 2048 # bits of the RSA keys of a new key pair
+
+# Settings of the ledger that applies the blocks to the balances of the nodes.
+LEDGER_BACKEND = "python" # "python" (a list, always available) or "numpy" (vectorised arrays, requires the numpy package, which is not a dependency; its tests are skipped without numpy, so this backend is untested there)
+LEDGER_UNDO_BLOCKS = 100 # most recent applied blocks that the ledger can roll back
+
+# Settings of the chain validation, which only checks the blocks above the last validated block.
+CHECKPOINT_INTERVAL = 100 # a checkpoint of the validated chain is recorded every CHECKPOINT_INTERVAL blocks
+
+# Settings of the queries on the blockchain (blocks, transaction receipts and account histories).
+HISTORY_PAGE_SIZE = 50 # default number of transactions per page of an account history
+HISTORY_MAX_PAGE_SIZE = 500 # maximum number of transactions per page of an account history
+
+# Settings of the mempool that holds the validated transactions until they enter a block.
+MEMPOOL_MAX_SIZE = 10000 # maximum number of transactions; when full, the lowest-fee transactions are evicted
+MEMPOOL_INCLUSION_SAMPLES = 1000 # most recent time-to-inclusion samples kept for the mempool metrics
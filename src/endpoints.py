@@ -1,36 +1,98 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, g
 from node import Node
-import pickle
+import time
 import config
-from libraries.custom_exceptions import InsufficientBalanceError, TransactionValidationError
-from libraries.functions_library import retrieve_from_ring_node
+from libraries.custom_exceptions import InsufficientBalanceError, TransactionValidationError, WireFormatError, ChainSyncError, SessionInitializationError
+from libraries.functions_library import retrieve_from_ring_node, parse_bcc, to_bcc
+from libraries.metrics import registry, ENDPOINT_LATENCY, ENDPOINT_REQUESTS
+from transaction import Transaction
+from block import Block
+from bootstrap_coordinator import BootstrapCoordinator
 
 # Init the current node.
 node = Node()
+# Init the coordinator of the session, used only if the current node is the bootstrap node.
+coordinator = BootstrapCoordinator(node)
 
 # Define the blockchat_bp blueprint for the endpoints.
 blockchat_bp = Blueprint("blockchat_bp", __name__)
 
+@blockchat_bp.before_request
+def start_timer():
+    """Records when the current node starts serving a request."""
+    g.request_start = time.perf_counter()
+
+@blockchat_bp.after_request
+def record_time(response):
+    """Adds the time spent serving the request to the metrics of its endpoint."""
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint.split(".")[-1] if request.endpoint else "unknown"
+    ENDPOINT_LATENCY.observe(elapsed, endpoint = endpoint, method = request.method)
+    ENDPOINT_REQUESTS.inc(endpoint = endpoint, method = request.method, status = response.status_code)
+    return response
+
 @blockchat_bp.route("/register_node", methods = ["POST"])
 def register_node():
     """
     Request to the bootstrap node only:
         - Register a new node in the network and add it to the ring.
     """
-    # Calculate the id for the new node.
-    new_node_id = len(node.ring)
-
     # Retrieve the new node data from the request.
     new_node_ip = request.form.get("ip")
     new_node_port = request.form.get("port")
     new_node_public_key = request.form.get("public_key")
 
-    # Register the new node.
-    node.register_node_to_ring(new_node_id, new_node_ip, new_node_port, new_node_public_key)
+    # Register the new node and calculate its id.
+    # The nodes may register at the same time, so the coordinator hands out the ids.
+    try:
+        new_node_id = coordinator.register(new_node_ip, new_node_port, new_node_public_key)
+    except SessionInitializationError as e:
+        return jsonify({"message": f"{e}"}), 409
 
     # Return the id of the new node.
     return jsonify({"id": new_node_id})
 
+@blockchat_bp.route("/node_ready", methods = ["POST"])
+def node_ready():
+    """
+    Request to the bootstrap node only:
+        - A registered node reports that its server is up and it knows the settings of the session.
+        Once every node is ready, the bootstrap node starts the session.
+    """
+    try:
+        coordinator.mark_ready(int(request.form.get("id")))
+    except (TypeError, ValueError, SessionInitializationError) as e:
+        return jsonify({"message": f"{e}"}), 409
+    return jsonify({"message": "Node ready.", **coordinator.status()})
+
+@blockchat_bp.route("/session_status", methods = ["GET"])
+def session_status():
+    """
+    Request to the bootstrap node only:
+        - Send the progress of the start of the session.
+    """
+    return jsonify(coordinator.status())
+
+@blockchat_bp.route("/health", methods = ["GET"])
+def health():
+    """Answers as soon as the server of the current node is up."""
+    return jsonify({"message": f"Node {node.id} up.", "id": node.id})
+
+@blockchat_bp.route("/metrics", methods = ["GET"])
+def get_metrics():
+    """Get the metrics of the current node (latency histograms and counters) in the Prometheus text format."""
+    return Response(registry.render(), mimetype = "text/plain; version=0.0.4")
+
+@blockchat_bp.route("/endpoint_stats", methods = ["GET"])
+def get_endpoint_stats():
+    """Get the number of requests and the time spent serving every endpoint of the current node, summed over the request methods."""
+    endpoint_stats = {}
+    for (endpoint, _), _, total, count in ENDPOINT_LATENCY.samples():
+        stats = endpoint_stats.setdefault(endpoint, {"count": 0, "total": 0.0})
+        stats["count"] += count
+        stats["total"] += total
+    return jsonify({endpoint: {**stats, "mean": stats["total"] / stats["count"]} for endpoint, stats in endpoint_stats.items()})
+
 @blockchat_bp.route("/get_ring", methods = ["GET"])
 def get_ring():
     """
@@ -43,27 +105,62 @@ def get_ring():
 def post_ring():
     """
     Called for all the nodes in the network, except for the bootstrap node.
-    Updates the ring of the current node with the final ring of nodes in the network.
+    Updates the ring of the current node with the final ring of nodes in the network, sent as JSON in the format of /get_ring.
     """
-    node.ring = pickle.loads(request.get_data())
+    payload = request.get_json(force = True, silent = True)
+    ring = payload.get("ring") if isinstance(payload, dict) else None
+    if not isinstance(ring, list) or not all(isinstance(ring_node, dict) and isinstance(ring_node.get("id"), int) and isinstance(ring_node.get("public_key"), str) for ring_node in ring):
+        return jsonify({"message": f"Update node {node.id} ring failed: invalid ring."}), 400
+    node.set_ring(ring)
     return jsonify({"message": f"Update node {node.id} ring successful."})
 
 @blockchat_bp.route("/ask_chain", methods = ["POST"])
 def ask_chain():
     """
-    The requesting node asks the receiving node for their self.chain.
+    The requesting node, given by its id, ip address and port, asks the receiving node to synchronize the chain of the requesting node with its own.
     """
-    requesting_node = pickle.loads(request.get_data())
+    requesting_node = {"id": request.form.get("id"), "ip": request.form.get("ip"), "port": request.form.get("port")}
     node.share_chain(requesting_node)
     return jsonify({"message": f"Update node {requesting_node['id']} chain from node {node.id} successful."})
 
-@blockchat_bp.route("/post_chain", methods = ["POST"])
-def post_chain():
+@blockchat_bp.route("/sync_chain", methods = ["POST"])
+def sync_chain():
     """
-    Updates the chain of the current node with the given blockchain.
+    Synchronizes the chain of the current node with the chain of the given node.
+    Only the blocks that the current node is missing are transferred.
     """
-    node.chain = pickle.loads(request.get_data())
-    return jsonify({"message": f"Update node {node.id} chain successful."})
+    peer_ip = request.form.get("ip")
+    peer_port = request.form.get("port")
+    try:
+        received_blocks = node.sync_chain(peer_ip, peer_port)
+    except (ChainSyncError, WireFormatError) as e:
+        return jsonify({"message": f"Update node {node.id} chain failed: {e}"}), 409
+    return jsonify({"message": f"Update node {node.id} chain successful: {received_blocks} new blocks."})
+
+@blockchat_bp.route("/get_blocks", methods = ["GET"])
+def get_blocks():
+    """
+    Streams the blocks that follow the tip of the requesting node, or the most recent block that the chains share,
+    as a chunked response of length-prefixed blocks (see Blockchain.stream_blocks_after()).
+    The requesting node gives either:
+        - the query argument locator, the comma-separated block locator of its chain (empty for an empty chain),
+        - or the query arguments tip_height and tip_hash of the last block it has.
+    """
+    locator = request.args.get("locator")
+    tip_height = request.args.get("tip_height", type = int)
+    tip_hash = request.args.get("tip_hash")
+    if locator is None and tip_height is None:
+        return jsonify({"message": "Argument locator or tip_height is missing."}), 400
+    if node.chain is None:
+        return jsonify({"message": f"Node {node.id} has no chain yet."}), 404
+    try:
+        if locator is not None:
+            stream = node.chain.stream_blocks_after_locator([block_hash for block_hash in locator.split(",") if block_hash])
+        else:
+            stream = node.chain.stream_blocks_after(tip_height, tip_hash)
+    except ChainSyncError as e:
+        return jsonify({"message": f"{e}"}), 409
+    return Response(stream, mimetype = "application/octet-stream")
 
 @blockchat_bp.route("/get_total_nodes", methods = ["GET"])
 def get_total_nodes():
@@ -85,18 +182,15 @@ def make_transaction():
     Makes a new transaction.
     The sender node is the current node.
     """
-    # Retrieve transaction input data.
-    recipient_id = request.form.get("recipient_id")
-    recipient_id = int(recipient_id)
-    bcc = request.form.get("bcc")
-    if not bcc:
-        bcc = 0
-    else:
-        bcc = int(bcc)
-    message = request.form.get("message")
-
-    # Get recipient public_key.
-    recipient_public_key = retrieve_from_ring_node(node.ring, recipient_id, "public_key")
+    # Retrieve transaction input data and the public key of the recipient.
+    try:
+        recipient_id = int(request.form.get("recipient_id"))
+    except (TypeError, ValueError):
+        return jsonify({"message": f"Invalid recipient_id {request.form.get('recipient_id')!r}."}), 400
+    try:
+        recipient_id, recipient_public_key, bcc, message = _check_transaction_input(recipient_id, request.form.get("bcc"), request.form.get("message"))
+    except ValueError as e:
+        return jsonify({"message": f"{e}"}), 400
 
     # Make the transaction.
     try:
@@ -110,36 +204,263 @@ def make_transaction():
 
     return jsonify({"message": f"Transaction of {bcc} BCC and message: '{message}' from node {node.id} to node {recipient_id} successful."})
 
+def _check_transaction_input(recipient_id, bcc, message):
+    """
+    Checks the input data of a new transaction: the id of a node in the ring, an optional whole, non-negative amount of bcc
+    (a number or its string, see parse_bcc()) and an optional string message, at least one of which must be given.
+    Returns the inputs of the transaction for Node.create_transaction(s)(). Raises ValueError if the input data is invalid.
+    """
+    recipient_public_key = None if isinstance(recipient_id, bool) or not isinstance(recipient_id, int) else retrieve_from_ring_node(node.ring, recipient_id, "public_key")
+    if recipient_public_key is None:
+        raise ValueError(f"Unknown recipient_id {recipient_id!r}.")
+    bcc = parse_bcc(bcc)
+    if message is not None and not isinstance(message, str):
+        raise ValueError(f"The message must be a string: {message!r}")
+    if bcc == 0 and not message:
+        raise ValueError("A transaction needs an amount of bcc or a message.")
+    return recipient_id, recipient_public_key, bcc, message
+
+def _parse_transaction_input(transaction_input):
+    """
+    Parses a transaction of a batch of /make_transactions, a JSON object with:
+        - recipient_id: the id of a node in the ring,
+        - bcc (optional): a whole, non-negative number,
+        - message (optional): a string,
+    with an amount of bcc or a message, or both.
+    Returns the inputs of the transaction for Node.create_transactions(). Raises ValueError if the transaction is malformed.
+    """
+    if not isinstance(transaction_input, dict):
+        raise ValueError("A JSON object is expected.")
+    bcc = transaction_input.get("bcc")
+    if bcc is not None and (isinstance(bcc, bool) or not isinstance(bcc, (int, float))):
+        raise ValueError(f"The amount of bcc must be a number: {bcc!r}")
+    return _check_transaction_input(transaction_input.get("recipient_id"), bcc, transaction_input.get("message"))
+
+@blockchat_bp.route("/make_transactions", methods = ["POST"])
+def make_transactions():
+    """
+    Makes a batch of new transactions, given as a JSON object:
+        - transactions: a list of objects with the recipient_id, bcc and message of every transaction,
+        - all_or_nothing (optional, default true): whether the batch is made only if every transaction succeeds,
+        otherwise the transactions up to the first one that fails are made.
+    The sender node is the current node. The response holds one result per transaction, in order.
+    """
+    batch = request.get_json(silent = True)
+    if not isinstance(batch, dict) or not isinstance(batch.get("transactions"), list):
+        return jsonify({"message": "A JSON object with a list of transactions is expected."}), 400
+    all_or_nothing = bool(batch.get("all_or_nothing", True))
+
+    # Retrieve the input data of every transaction and the public key of its recipient.
+    # The whole batch is rejected if any transaction is malformed, before any transaction is made.
+    transaction_inputs = []
+    for index, transaction_input in enumerate(batch["transactions"]):
+        try:
+            transaction_inputs.append(_parse_transaction_input(transaction_input))
+        except ValueError as e:
+            return jsonify({"message": f"Invalid transaction {index} in the batch: {e}", "index": index}), 400
+
+    # Make the transactions.
+    results = node.create_transactions(transaction_inputs, all_or_nothing)
+    successful = sum(1 for result, _, _ in results if result)
+    response = {
+        "message": f"{successful} of {len(results)} transactions from node {node.id} successful.",
+        "results": [{"result": result, "message": description, "hash": transaction_hash} for result, description, transaction_hash in results]
+    }
+    if successful < len(results):
+        return jsonify(response), 403 if successful == 0 else 207
+    return jsonify(response)
+
 @blockchat_bp.route("/validate_transaction", methods = ["POST"])
 def validate_transaction():
     """Asks the current node to validate the input transaction."""
-    transaction = pickle.loads(request.get_data())
+    try:
+        transaction = Transaction.from_bytes(request.get_data())
+    except WireFormatError as e:
+        return jsonify({"message": f"Transaction validation by node {node.id} failed: {e}"}), 400
     validation_result, validation_description = node.validate_transaction(transaction)
     if not validation_result:
         return jsonify({"message": f"Transaction validation by node {node.id} failed: {validation_description}"}), 403
 
     return jsonify({"message": "Transaction validation successful."})
 
-@blockchat_bp.route("/update_balance", methods = ["POST"])
-def update_balance():
-    """Updates the balance of the current node with the input amount."""
-    amount = request.form.get("amount")
-    if not amount:
-        amount = 0
+@blockchat_bp.route("/validate_transactions", methods = ["POST"])
+def validate_transactions():
+    """
+    Asks the current node to validate the input batch of transactions. The response holds one result per transaction, in order.
+    With the query argument relay_root, the batch travels through the relay tree of the given node:
+    the current node relays it to its children and answers for its whole subtree, within the seconds of the query argument deadline.
+    """
+    try:
+        transactions = Transaction.batch_from_bytes(request.get_data())
+    except WireFormatError as e:
+        return jsonify({"message": f"Batch validation by node {node.id} failed: {e}"}), 400
+    relay_root = request.args.get("relay_root", type = int)
+    if relay_root is None:
+        results = node.validate_transactions(transactions)
     else:
-        amount = int(amount)
+        results = node.relay_validate_transactions(transactions, relay_root, request.args.get("deadline", type = float))
+    response = {
+        "message": f"Batch validation by node {node.id}: {sum(1 for result, _ in results if result)} of {len(results)} transactions valid.",
+        "results": [{"result": result, "message": description} for result, description in results]
+    }
+    if not all(result for result, _ in results):
+        return jsonify(response), 403
+    return jsonify(response)
+
+@blockchat_bp.route("/receive_transaction", methods = ["POST"])
+def receive_transaction():
+    """Adds a transaction that has been validated by all the nodes in the network to the mempool of the current node."""
     try:
-        node.wallet.update_balance(amount)
-    except InsufficientBalanceError:
-        return jsonify({"message": f"Node {node.id}'s projected balance is negative. Balance update with {amount} BCC rejected."}), 400
-    if amount > 0:
-        return jsonify({"message": f"{amount} bcc successfully added to node {node.id}'s balance."})
-    elif amount < 0:
-        return jsonify({"message": f"{amount} bcc successfully subtracted from node {node.id}'s balance."})
+        transaction = Transaction.from_bytes(request.get_data())
+    except WireFormatError as e:
+        return jsonify({"message": f"Transaction rejected by node {node.id}: {e}"}), 400
+    result, description = node.receive_transaction(transaction)
+    if not result:
+        return jsonify({"message": f"Transaction rejected by node {node.id}: {description}"}), 409
+    return jsonify({"message": description})
+
+@blockchat_bp.route("/receive_transactions", methods = ["POST"])
+def receive_transactions():
+    """
+    Adds a batch of transactions that has been validated by all the nodes in the network to the mempool of the current node.
+    With the query argument relay_root, the current node also relays the batch to its children in the relay tree of the given node.
+    """
+    try:
+        transactions = Transaction.batch_from_bytes(request.get_data())
+    except WireFormatError as e:
+        return jsonify({"message": f"Batch rejected by node {node.id}: {e}"}), 400
+    relay_root = request.args.get("relay_root", type = int)
+    if relay_root is None:
+        results = node.receive_transactions(transactions)
     else:
-        return jsonify({"message": f"{amount} bcc sent. Node {node.id}'s balance remains the same."})
+        results = node.relay_transactions(transactions, relay_root)
+    response = {
+        "message": f"{sum(1 for result, _ in results if result)} of {len(results)} transactions added to the mempool of node {node.id}.",
+        "results": [{"result": result, "message": description} for result, description in results]
+    }
+    if not all(result for result, _ in results):
+        return jsonify(response), 409
+    return jsonify(response)
+
+@blockchat_bp.route("/receive_block", methods = ["POST"])
+def receive_block():
+    """
+    Adds a block sealed by its validator to the chain of the current node.
+    With the query argument relay_root (the validator of the block), the current node also relays the block to its children in the relay tree.
+    """
+    try:
+        block = Block.from_bytes(request.get_data())
+    except WireFormatError as e:
+        return jsonify({"message": f"Block rejected by node {node.id}: {e}"}), 400
+    if request.args.get("relay_root") is None:
+        result, description = node.receive_block(block)
+    else:
+        result, description = node.relay_block(block)
+    if not result:
+        return jsonify({"message": f"Block rejected by node {node.id}: {description}"}), 409
+    return jsonify({"message": description})
+
+@blockchat_bp.route("/mempool_metrics", methods = ["GET"])
+def mempool_metrics():
+    """Get the depth, the counters and the time-to-inclusion statistics of the mempool of the current node."""
+    return jsonify(node.mempool.metrics())
 
 @blockchat_bp.route("/get_balance", methods = ["GET"])
 def get_balance():
     """Get the current balance of the current node."""
-    return jsonify({"current_balance": node.wallet.balance})
+    return jsonify({"current_balance": to_bcc(node.wallet.balance)})
+
+@blockchat_bp.route("/get_block", methods = ["GET"])
+def get_block():
+    """Get the block with the hash given by the query argument hash, with the hashes of its transactions."""
+    block_hash = request.args.get("hash")
+    if block_hash is None:
+        return jsonify({"message": "Argument hash is missing."}), 400
+    block = None if node.chain is None else node.chain.get_block(block_hash)
+    if block is None:
+        return jsonify({"message": f"Block {block_hash} not found."}), 404
+    return jsonify({"block": {**block.to_dict(), "hash": block.hash}})
+
+@blockchat_bp.route("/get_transaction_receipt", methods = ["GET"])
+def get_transaction_receipt():
+    """
+    Get the receipt of the transaction with the hash given by the query argument hash:
+        - a confirmed transaction comes with the block that holds it, its position in the block and the number of confirmations,
+        - a transaction that waits in the mempool of the current node is reported as pending.
+    """
+    transaction_hash = request.args.get("hash")
+    if transaction_hash is None:
+        return jsonify({"message": "Argument hash is missing."}), 400
+    found = None if node.chain is None else node.chain.find_transaction(transaction_hash)
+    if found is not None:
+        transaction, height, position = found
+        return jsonify({
+            "status": "confirmed",
+            "transaction": {**transaction.to_dict(), "hash": transaction.hash},
+            "block_height": height,
+            "block_hash": node.chain.blocks[height].hash,
+            "position": position,
+            "confirmations": node.chain.tip()[0] - height + 1
+        })
+    if transaction_hash in node.mempool:
+        return jsonify({"status": "pending", "transaction": {**node.mempool.transactions[transaction_hash][0].to_dict(), "hash": transaction_hash}})
+    return jsonify({"message": f"Transaction {transaction_hash} not found."}), 404
+
+@blockchat_bp.route("/get_transaction_proof", methods = ["GET"])
+def get_transaction_proof():
+    """
+    Get the Merkle inclusion proof of the confirmed transaction with the hash given by the query argument hash.
+    The proof is checked against the Merkle root of the block with libraries.merkle_tree.verify_inclusion(),
+    without downloading the other transactions of the block.
+    """
+    transaction_hash = request.args.get("hash")
+    if transaction_hash is None:
+        return jsonify({"message": "Argument hash is missing."}), 400
+    found = None if node.chain is None else node.chain.find_transaction(transaction_hash)
+    if found is None:
+        return jsonify({"message": f"Transaction {transaction_hash} not found in the chain."}), 404
+    _, height, position = found
+    block = node.chain.blocks[height]
+    return jsonify({
+        "transaction_hash": transaction_hash,
+        "block_height": height,
+        "block_hash": block.hash,
+        "merkle_root": block.merkle_root(),
+        "position": position,
+        "tree_size": len(block.transactions),
+        "proof": block.transaction_proof(position)
+    })
+
+@blockchat_bp.route("/get_account_history", methods = ["GET"])
+def get_account_history():
+    """
+    Get a page of the confirmed transactions that an account sent or received, most recent first.
+    The account is given by the query argument node_id or public_key, and the page by the query arguments offset and limit.
+    """
+    node_id = request.args.get("node_id", type = int)
+    public_key = request.args.get("public_key") if node_id is None else node.ledger.public_key_of(node_id)
+    if public_key is None:
+        return jsonify({"message": "Argument node_id or public_key is missing or unknown."}), 400
+    offset = request.args.get("offset", default = 0, type = int)
+    limit = request.args.get("limit", default = config.HISTORY_PAGE_SIZE, type = int)
+    if offset < 0 or not 0 < limit <= config.HISTORY_MAX_PAGE_SIZE:
+        return jsonify({"message": f"Arguments offset must be non-negative and limit between 1 and {config.HISTORY_MAX_PAGE_SIZE}."}), 400
+    if node.chain is None:
+        return jsonify({"message": f"Node {node.id} has no chain yet."}), 404
+
+    total, page = node.chain.account_history(public_key, offset, limit)
+    return jsonify({
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "transactions": [
+            {
+                **transaction.to_dict(),
+                "hash": transaction.hash,
+                "direction": "sent" if transaction.sender_public_key == public_key else "received",
+                "block_height": height,
+                "position": position
+            }
+            for transaction, height, position in page
+        ]
+    })
@@ -0,0 +1,138 @@
+"""
+File: keystore.py
+Description:
+
+    The on-disk keystore that keeps the key pair of every node across restarts.
+    Run it as a script to pre-generate key pairs in parallel, e.g. before a session with many nodes,
+    so that the new nodes take a ready key pair instead of generating one.
+
+Usage: run "python src/keystore.py --pregenerate {count} --dir {directory} [--workers {workers}]"
+"""
+
+import os
+import uuid
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import rsa
+import config
+
+def generate_key_pair(key_size = None):
+    """Generates an RSA key pair and returns it as (public key PEM, private key PEM). Runs in the worker processes of pregenerate()."""
+    public_key, private_key = rsa.newkeys(config.KEY_SIZE if key_size is None else key_size)
+    return public_key.save_pkcs1().decode(), private_key.save_pkcs1().decode()
+
+class Keystore:
+    """
+    A directory of key pairs.
+
+    Every identity, i.e. the key pair of a node, is a single file named after the identity,
+    with the private key PEM followed by the public key PEM, readable by the owner only.
+    The pool subdirectory holds pre-generated key pairs; a new identity takes one of them, if any, instead of generating its own.
+
+    Attributes:
+        directory (str): the directory of the keystore.
+    """
+
+    def __init__(self, directory):
+        """Opens the keystore in the given directory, creating it if needed."""
+        self.directory = directory
+        self._pool_directory = os.path.join(directory, "pool")
+        os.makedirs(self._pool_directory, exist_ok = True)
+
+    def __str__(self):
+        """Returns a string representation of the keystore."""
+        return str(self.__class__) + ": " + str({"directory": self.directory, "pooled": self.pooled()})
+
+    def _path(self, name):
+        """Returns the path of the file of the identity with the given name."""
+        return os.path.join(self.directory, f"{name}.pem")
+
+    @staticmethod
+    def _read(path):
+        """Reads a key pair file and returns (public key PEM, private key PEM)."""
+        with open(path) as key_file:
+            pem = key_file.read()
+        split = pem.index("-----BEGIN RSA PUBLIC KEY-----")
+        return pem[split:], pem[:split]
+
+    @staticmethod
+    def _write(path, key_pair):
+        """Writes a key pair file atomically, so that a crash never leaves a partial key pair behind."""
+        public_key, private_key = key_pair
+        temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descriptor, "w") as key_file:
+            key_file.write(private_key + public_key)
+        os.replace(temporary_path, path)
+
+    def load(self, name):
+        """Returns the key pair of the identity with the given name as (public key PEM, private key PEM), or None if it does not exist."""
+        try:
+            return self._read(self._path(name))
+        except FileNotFoundError:
+            return None
+
+    def save(self, name, key_pair):
+        """Saves the given (public key PEM, private key PEM) key pair as the identity with the given name."""
+        self._write(self._path(name), key_pair)
+
+    def pooled(self):
+        """Returns the number of pre-generated key pairs in the pool."""
+        return sum(1 for file_name in os.listdir(self._pool_directory) if file_name.endswith(".pem"))
+
+    def take_pregenerated(self):
+        """
+        Takes a pre-generated key pair out of the pool and returns it, or returns None if the pool is empty.
+        Each key pair is claimed by renaming its file, so two nodes that start at the same time never get the same key pair.
+        """
+        for file_name in sorted(os.listdir(self._pool_directory)):
+            if not file_name.endswith(".pem"):
+                continue
+            path = os.path.join(self._pool_directory, file_name)
+            claimed_path = f"{path}.{uuid.uuid4().hex}.claimed"
+            try:
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                continue # claimed by another node
+            key_pair = self._read(claimed_path)
+            os.remove(claimed_path)
+            return key_pair
+        return None
+
+    def load_or_create(self, name):
+        """
+        Returns the key pair of the identity with the given name.
+        A new identity takes a pre-generated key pair from the pool, or generates one if the pool is empty, and is saved.
+        """
+        key_pair = self.load(name)
+        if key_pair is None:
+            key_pair = self.take_pregenerated() or generate_key_pair()
+            self.save(name, key_pair)
+        return key_pair
+
+    def pregenerate(self, count, max_workers = None):
+        """Generates {count} key pairs in parallel on a process pool, adds them to the pool and returns the number of pooled key pairs."""
+        # The pool is spawned rather than forked, as for the batch verifier.
+        with ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context("spawn")) as pool:
+            for key_pair in pool.map(generate_key_pair, [config.KEY_SIZE] * count):
+                self._write(os.path.join(self._pool_directory, f"{uuid.uuid4().hex}.pem"), key_pair)
+        return self.pooled()
+
+def open_keystore():
+    """Opens the keystore of the installation, or returns None if every node generates a new key pair on every start."""
+    if config.KEYSTORE_DIR is None:
+        return None
+    return Keystore(config.KEYSTORE_DIR)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Keystore of the Blockchat nodes.")
+    parser.add_argument("--pregenerate", type = int, required = True, help = "insert the number of key pairs to pre-generate")
+    parser.add_argument("--dir", default = config.KEYSTORE_DIR, help = "insert the directory of the keystore")
+    parser.add_argument("--workers", type = int, default = None, help = "insert the number of worker processes, one per CPU core by default")
+    args = parser.parse_args()
+
+    if args.dir is None:
+        raise SystemExit("The keystore is disabled: pass --dir or set config.KEYSTORE_DIR.")
+    keystore = Keystore(args.dir)
+    print(f"{keystore.pregenerate(args.pregenerate, args.workers)} pre-generated key pairs in {keystore.directory}.")
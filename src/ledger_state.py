@@ -0,0 +1,209 @@
+from collections import deque
+import config
+from libraries.balance_engine import get_backend
+from libraries.custom_exceptions import LedgerError
+from libraries.functions_library import genesis_bcc
+from libraries.proof_of_stake import StakeLottery
+
+class LedgerState:
+    """
+    The balances and the nonces of all the accounts in the network, as they result from the blocks of the blockchain.
+    The ledger is kept up to date incrementally, one block at a time, so validating a transaction against it costs O(1)
+    and never depends on the data that the sender sends about itself.
+    The confirmed balances of the nodes are also their stakes in the lottery that elects the validator of every block.
+
+    The balances live in an array indexed by node id (see config.LEDGER_BACKEND).
+    A block is turned into per-node integer deltas, which are added to the balances and checked for negative results in one pass,
+    so that the whole block is applied atomically, or not at all.
+    The changes of the most recent blocks are kept as undo records, so that they can be rolled back.
+
+    Attributes:
+        public_keys (dict): node id --> public key.
+        node_ids (dict): public key --> node id.
+        balances: the balance array of the nodes, in cents of BCC.
+        next_nonces (list): node id --> the smallest nonce that a new transaction of the node may carry.
+        stakes (StakeLottery object): the stakes of the nodes, in whole BCC of their confirmed balances.
+        applied_height (int): the height of the last block applied to the ledger, -1 if none.
+    """
+
+    def __init__(self, backend = None, undo_blocks = None):
+        """Inits an empty ledger. The arguments that are not given are taken from the config file."""
+        self.public_keys = {}
+        self.node_ids = {}
+        self.balances = get_backend(config.LEDGER_BACKEND if backend is None else backend)
+        self.next_nonces = []
+        self.stakes = StakeLottery()
+        self.applied_height = -1
+        self._undo = deque(maxlen = config.LEDGER_UNDO_BLOCKS if undo_blocks is None else undo_blocks) # (height, balance undo record, {node id: previous next nonce})
+
+    def __str__(self):
+        """Returns a string representation of the ledger."""
+        return str(self.__class__) + ": " + str({"nodes": len(self.public_keys), "applied_height": self.applied_height, "backend": self.balances.name})
+
+    def register_account(self, node_id, public_key):
+        """Registers the account of a node in the ring and enters the node in the stake lottery."""
+        self.public_keys[node_id] = public_key
+        self.node_ids[public_key] = node_id
+        if node_id >= len(self.next_nonces):
+            self.balances.grow(node_id + 1)
+            self.next_nonces.extend([1] * (node_id + 1 - len(self.next_nonces)))
+        self.stakes.add_node(node_id, self.balances.get(node_id) // config.BCC_CENTS)
+
+    def public_key_of(self, node_id):
+        """Returns the public key of the node with the given id, or None if it is not registered."""
+        return self.public_keys.get(node_id)
+
+    def elected_validator(self, height, previous_hash):
+        """
+        Returns the id of the node elected to build the block at the given height, on top of the block with the given hash,
+        by the stake lottery seeded with that hash. The ledger must have applied all the blocks below the given height.
+        Until some node holds a stake, the registered nodes take turns in the order of their ids.
+        """
+        elected = self.stakes.draw(previous_hash)
+        if elected is None:
+            node_ids = sorted(self.public_keys)
+            return node_ids[height % len(node_ids)] if node_ids else None
+        return elected
+
+    def balance(self, public_key):
+        """Returns the confirmed balance of the account with the given public key, in cents of BCC (0 for an unknown account)."""
+        node_id = self.node_ids.get(public_key)
+        return 0 if node_id is None else self.balances.get(node_id)
+
+    def next_nonce(self, public_key):
+        """Returns the smallest nonce that a new transaction of the account with the given public key may carry."""
+        node_id = self.node_ids.get(public_key)
+        return 1 if node_id is None else self.next_nonces[node_id]
+
+    @staticmethod
+    def _has_valid_content(transaction):
+        """Returns whether the transaction transfers a whole, non-negative amount of bcc and a text message, either of them optional."""
+        bcc = transaction.bcc
+        if bcc is not None and (isinstance(bcc, bool) or not isinstance(bcc, int) or bcc < 0):
+            return False
+        return transaction.message is None or isinstance(transaction.message, str)
+
+    def check_transaction(self, transaction, pending_expenses = 0, next_nonce = None, last_nonce = None):
+        """
+        Checks a transaction against the ledger:
+            - the amount of bcc must be a whole, non-negative number and the message a string,
+            - the sender and the recipient must be registered accounts,
+            - the nonce must lie between next_nonce and last_nonce: by default both are the next nonce of the sender in the ledger,
+            the caller raises them for the transactions of the sender that are not in a block yet, so that the nonces have no gaps,
+            - the confirmed balance of the sender, minus the given expenses of its transactions that are not in a block yet,
+            must cover the total expenses of the transaction.
+        Returns (True, description) or (False, reason).
+        """
+        if not self._has_valid_content(transaction):
+            return False, "Invalid amount of bcc or message."
+        sender_id = self.node_ids.get(transaction.sender_public_key)
+        if sender_id is None:
+            return False, "Unknown sender."
+        if transaction.recipient_public_key not in self.node_ids:
+            return False, "Unknown recipient."
+        next_nonce = self.next_nonces[sender_id] if next_nonce is None else next_nonce
+        last_nonce = next_nonce if last_nonce is None else last_nonce
+        if transaction.nonce is None or not next_nonce <= transaction.nonce <= last_nonce:
+            return False, "Invalid nonce."
+        if self.balances.get(sender_id) - pending_expenses < transaction.total_expenses():
+            return False, "Insufficient balance."
+        return True, "Transaction validation successful."
+
+    def _stage_block(self, block):
+        """
+        Computes the new balances and nonces of the nodes that the given block touches, without changing the ledger.
+        The genesis block credits the initial coins of the network to the bootstrap node.
+        The validator of any other block collects the fees of its transactions.
+        Every transaction of the block becomes a debit of its sender and a credit of its recipient,
+        and the whole block is checked at once: no balance may end up negative.
+        Returns (staged balances, {node id: next nonce}).
+        Raises LedgerError if the block cannot be applied.
+        """
+        if block.index != self.applied_height + 1:
+            raise LedgerError(f"Block {block.index} does not follow the last applied block {self.applied_height}.")
+        validator_id = block.validator_id
+        if validator_id not in self.public_keys:
+            raise LedgerError(f"The validator of block {block.index} is not registered.")
+        if block.index > 0 and validator_id != self.elected_validator(block.index, block.previous_hash):
+            raise LedgerError(f"Node {validator_id} is not the elected validator of block {block.index}.")
+
+        node_ids = []
+        deltas = []
+        next_nonces = {}
+        if block.index == 0:
+            node_ids.append(validator_id)
+            deltas.append(genesis_bcc())
+        fees = 0
+        for transaction in block.transactions:
+            if not self._has_valid_content(transaction):
+                raise LedgerError(f"Invalid amount of bcc or message in transaction {transaction.hash} in block {block.index}.")
+            sender_id = self.node_ids.get(transaction.sender_public_key)
+            recipient_id = self.node_ids.get(transaction.recipient_public_key)
+            if sender_id is None or recipient_id is None:
+                raise LedgerError(f"Unknown account in block {block.index}.")
+            if transaction.nonce != next_nonces.get(sender_id, self.next_nonces[sender_id]):
+                raise LedgerError(f"Invalid nonce of transaction {transaction.hash} in block {block.index}.")
+            next_nonces[sender_id] = transaction.nonce + 1
+            node_ids += [sender_id, recipient_id]
+            deltas += [-transaction.total_expenses(), (transaction.bcc or 0) * config.BCC_CENTS]
+            fees += transaction.fee()
+        if fees:
+            node_ids.append(validator_id)
+            deltas.append(fees)
+
+        staged_balances = self.balances.stage(node_ids, deltas)
+        if staged_balances is None:
+            raise LedgerError(f"Insufficient balance for the transactions in block {block.index}.")
+        return staged_balances, next_nonces
+
+    def check_block(self, block):
+        """Checks whether the given block can be applied to the ledger. Returns (True, description) or (False, reason)."""
+        try:
+            self._stage_block(block)
+        except LedgerError as e:
+            return False, f"{e}"
+        return True, "Block can be applied."
+
+    def apply_block(self, block):
+        """
+        Applies the transactions of the given block to the ledger and records how to undo them.
+        The block is applied atomically: if any transaction of the block is invalid, LedgerError is raised and the ledger is not changed.
+        The stakes of the nodes whose balances changed are updated in the lottery.
+        """
+        staged_balances, next_nonces = self._stage_block(block)
+        balance_undo = self.balances.commit(staged_balances)
+        nonce_undo = {node_id: self.next_nonces[node_id] for node_id in next_nonces}
+        for node_id, next_nonce in next_nonces.items():
+            self.next_nonces[node_id] = next_nonce
+        self._update_stakes(self.balances.changed_ids(balance_undo))
+        self._undo.append((block.index, balance_undo, nonce_undo))
+        self.applied_height = block.index
+
+    def apply_chain(self, chain):
+        """Applies the blocks of the given chain that follow the last applied block. Returns the number of applied blocks."""
+        tip_height = len(chain.blocks) - 1
+        applied_blocks = 0
+        for height in range(self.applied_height + 1, tip_height + 1):
+            self.apply_block(chain.blocks[height])
+            applied_blocks += 1
+        return applied_blocks
+
+    def rollback(self, blocks = 1):
+        """
+        Undoes the given number of the last applied blocks, most recent first, from their undo records.
+        Only the last config.LEDGER_UNDO_BLOCKS blocks can be undone; raises LedgerError for more, without changing the ledger.
+        """
+        if blocks > len(self._undo):
+            raise LedgerError(f"Only the last {len(self._undo)} blocks can be rolled back, not {blocks}.")
+        for _ in range(blocks):
+            height, balance_undo, nonce_undo = self._undo.pop()
+            self.balances.restore(balance_undo)
+            for node_id, next_nonce in nonce_undo.items():
+                self.next_nonces[node_id] = next_nonce
+            self._update_stakes(self.balances.changed_ids(balance_undo))
+            self.applied_height = height - 1
+
+    def _update_stakes(self, node_ids):
+        """Sets the stakes of the nodes with the given ids to their balances in whole BCC."""
+        for node_id in node_ids:
+            self.stakes.set_stake(node_id, self.balances.get(node_id) // config.BCC_CENTS)
@@ -0,0 +1,124 @@
+class PythonBalances:
+    """
+    The balances of the nodes in a Python list indexed by node id. Always available.
+
+    A block is applied in one pass over its per-node deltas: only the touched balances are copied, changed and checked.
+    """
+
+    name = "python"
+
+    def __init__(self):
+        """Inits an array without any node."""
+        self._balances = []
+
+    def __len__(self):
+        """Returns the number of nodes in the array."""
+        return len(self._balances)
+
+    def get(self, node_id):
+        """Returns the balance of the node with the given id."""
+        return self._balances[node_id]
+
+    def grow(self, size):
+        """Extends the array with zero balances up to the given number of nodes."""
+        self._balances.extend([0] * (size - len(self._balances)))
+
+    def stage(self, node_ids, deltas):
+        """
+        Adds the deltas (integers) to the balances of the nodes with the given ids, in parallel lists where an id may repeat,
+        without changing the self balances.
+        Returns the staged changes, to be committed with commit(), or None if any balance would be negative.
+        """
+        staged = {}
+        for node_id, delta in zip(node_ids, deltas):
+            staged[node_id] = staged.get(node_id, self._balances[node_id]) + delta
+        if any(balance < 0 for balance in staged.values()):
+            return None
+        return staged
+
+    def commit(self, staged):
+        """Applies the staged changes of stage(). Returns the undo record of the changes, as (node ids, previous balances)."""
+        node_ids = list(staged)
+        previous = [self._balances[node_id] for node_id in node_ids]
+        for node_id, balance in staged.items():
+            self._balances[node_id] = balance
+        return node_ids, previous
+
+    def restore(self, undo):
+        """Restores the balances from an undo record of commit()."""
+        for node_id, balance in zip(*undo):
+            self._balances[node_id] = balance
+
+    def changed_ids(self, undo):
+        """Returns the ids of the nodes whose balances an undo record covers."""
+        return list(undo[0])
+
+class NumpyBalances:
+    """
+    The balances of the nodes in a NumPy int64 array indexed by node id, which requires the numpy package.
+
+    A block is applied as whole-array operations: its deltas are scattered into one array of the size of the network,
+    added to the balances and checked for negative results in one vectorised pass.
+    """
+
+    name = "numpy"
+
+    def __init__(self):
+        """Inits an array without any node. Raises ImportError if the numpy package is not installed."""
+        import numpy
+        self._numpy = numpy
+        self._balances = numpy.zeros(0, dtype = numpy.int64)
+
+    def __len__(self):
+        """Returns the number of nodes in the array."""
+        return len(self._balances)
+
+    def get(self, node_id):
+        """Returns the balance of the node with the given id."""
+        return int(self._balances[node_id])
+
+    def grow(self, size):
+        """Extends the array with zero balances up to the given number of nodes."""
+        if size > len(self._balances):
+            self._balances = self._numpy.concatenate([self._balances, self._numpy.zeros(size - len(self._balances), dtype = self._numpy.int64)])
+
+    def stage(self, node_ids, deltas):
+        """
+        Adds the deltas (integers) to the balances of the nodes with the given ids, in parallel lists where an id may repeat,
+        without changing the self balances.
+        Returns the staged changes, to be committed with commit(), or None if any balance would be negative.
+        """
+        block_deltas = self._numpy.zeros(len(self._balances), dtype = self._numpy.int64)
+        self._numpy.add.at(block_deltas, self._numpy.asarray(node_ids, dtype = self._numpy.intp), self._numpy.asarray(deltas, dtype = self._numpy.int64))
+        staged = self._balances + block_deltas
+        if (staged < 0).any():
+            return None
+        return staged
+
+    def commit(self, staged):
+        """Applies the staged changes of stage(). Returns the undo record of the changes, as (node ids, previous balances)."""
+        node_ids = self._numpy.flatnonzero(staged != self._balances)
+        undo = (node_ids, self._balances[node_ids])
+        self._balances = staged
+        return undo
+
+    def restore(self, undo):
+        """Restores the balances from an undo record of commit()."""
+        node_ids, previous = undo
+        self._balances[node_ids] = previous
+
+    def changed_ids(self, undo):
+        """Returns the ids of the nodes whose balances an undo record covers."""
+        return [int(node_id) for node_id in undo[0]]
+
+# The available balance arrays by name.
+BACKENDS = {
+    PythonBalances.name: PythonBalances,
+    NumpyBalances.name: NumpyBalances
+}
+
+def get_backend(name):
+    """Returns a new, empty balance array of the backend with the given name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ledger backend '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
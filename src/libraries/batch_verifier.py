@@ -0,0 +1,87 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import config
+from libraries.crypto_engine import crypto_engine, verified_signatures
+from libraries.metrics import BATCH_VERIFY_LATENCY, VERIFIED_SIGNATURES
+
+def _verify_chunk(items):
+    """
+    Runs in a worker process of the pool.
+    Verifies a chunk of (data, signature, public key PEM) items and returns one bool per item.
+    Every worker has its own crypto engine, so each public key is parsed once per worker.
+    """
+    return [crypto_engine.verify(data, signature, public_key_pem) for data, signature, public_key_pem in items]
+
+class BatchVerifier:
+    """
+    Verifies the signatures of a batch of transactions (e.g. all the transactions of a block) in parallel on a process pool,
+    so that the verification scales with the CPU cores instead of being serialized by the GIL.
+
+    Attributes:
+        max_workers (int): the number of worker processes, one per CPU core if None.
+        min_parallel (int): the smallest batch that is sent to the pool; smaller batches are verified in the calling thread.
+    """
+
+    def __init__(self, max_workers = None, min_parallel = None):
+        """Inits the batch verifier. The process pool starts on the first batch that needs it."""
+        self.max_workers = config.BATCH_VERIFY_WORKERS if max_workers is None else max_workers
+        self.min_parallel = config.BATCH_VERIFY_MIN_PARALLEL if min_parallel is None else min_parallel
+        self._pool = None
+        self._lock = threading.Lock() # guards the lazy start of the pool
+
+    def _get_pool(self):
+        """Returns the process pool, starting it on first use."""
+        with self._lock:
+            if self._pool is None:
+                # The pool is spawned rather than forked, since the Flask server runs several threads.
+                self._pool = ProcessPoolExecutor(max_workers = self.max_workers, mp_context = multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _worker_count(self):
+        """Returns the number of worker processes of the pool."""
+        return self.max_workers or os.cpu_count() or 1
+
+    def verify_transactions(self, transactions):
+        """
+        Verifies the signatures of the given transactions and returns a list with one bool per transaction, in the same order.
+        As in Node.validate_transaction(), every signature is verified against the recalculated hash of the transaction.
+        The signatures already in the cache of verified signatures are not verified again, e.g. those of the transactions of a block
+        that the current node validated when they were broadcast, and the valid ones are added to it.
+        """
+        hashes = [transaction.get_hash() for transaction in transactions]
+        results = [verified_signatures.is_verified(transaction_hash, transaction.signature) for transaction_hash, transaction in zip(hashes, transactions)]
+        pending = [position for position, is_verified in enumerate(results) if not is_verified]
+        items = [(hashes[position], transactions[position].signature, transactions[position].sender_public_key) for position in pending]
+        if not items:
+            return results
+        if len(items) < self.min_parallel:
+            with BATCH_VERIFY_LATENCY.time(mode = "inline"):
+                pending_results = _verify_chunk(items)
+        else:
+            # Split the batch into one contiguous chunk per worker, so that every worker gets a single task.
+            chunk_size = -(-len(items) // self._worker_count())
+            chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+            pending_results = []
+            with BATCH_VERIFY_LATENCY.time(mode = "pool"):
+                for chunk_results in self._get_pool().map(_verify_chunk, chunks):
+                    pending_results.extend(chunk_results)
+        for position, is_verified in zip(pending, pending_results):
+            results[position] = is_verified
+            if is_verified:
+                verified_signatures.add(hashes[position], transactions[position].signature)
+        valid = sum(pending_results)
+        VERIFIED_SIGNATURES.inc(valid, result = "valid")
+        VERIFIED_SIGNATURES.inc(len(pending_results) - valid, result = "invalid")
+        return results
+
+    def close(self):
+        """Shuts the process pool down."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+# The batch verifier shared by the whole installation of the current node.
+batch_verifier = BatchVerifier()
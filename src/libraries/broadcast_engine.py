@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
+from libraries.peer_client import peer_client
+from libraries.metrics import BROADCAST_LATENCY, BROADCAST_PEER_LATENCY
+
+class PeerResult:
+    """
+    The outcome of a broadcast request to a single peer.
+
+    Attributes:
+        node_id (int): the id of the peer in the ring.
+        outcome (str): 'accepted' (2xx response), 'rejected' (any other response), 'error' (the request failed),
+            'timeout' (no answer before the deadline) or 'cancelled' (the broadcast was already decided).
+        status_code (int): the HTTP status code of the response, None if there was no response.
+        message (str): the message of the response, or the description of the error.
+        elapsed (float): the seconds from the start of the broadcast until the outcome was known.
+        data (dict): the JSON body of the response, None if there was no JSON response.
+    """
+
+    def __init__(self, node_id, outcome, status_code = None, message = None, elapsed = None, data = None):
+        """Inits a peer result."""
+        self.node_id = node_id
+        self.outcome = outcome
+        self.status_code = status_code
+        self.message = message
+        self.elapsed = elapsed
+        self.data = data
+
+    def __str__(self):
+        """Returns a string representation of the peer result."""
+        return str(self.__class__) + ": " + str(self.__dict__)
+
+class BroadcastResult:
+    """
+    The outcome of a broadcast to all the nodes in the ring.
+
+    Attributes:
+        accepted (bool): True if every peer accepted the request, else False.
+        results (list): the PeerResult objects, one per peer, in the order of the ring.
+        elapsed (float): the seconds that the broadcast took.
+    """
+
+    def __init__(self, accepted, results, elapsed):
+        """Inits a broadcast result."""
+        self.accepted = accepted
+        self.results = results
+        self.elapsed = elapsed
+
+    def __str__(self):
+        """Returns a string representation of the broadcast result."""
+        return str(self.__class__) + ": " + str(self.__dict__)
+
+    def rejections(self):
+        """Returns the results of the peers that did not accept the request."""
+        return [result for result in self.results if result.outcome != "accepted"]
+
+class BroadcastEngine:
+    """
+    Sends the same POST request to all the nodes in the ring concurrently.
+
+    The requests are scheduled on an asyncio event loop that runs in a background thread for the whole session,
+    and the blocking HTTP calls of the peer client run on a fixed pool of worker threads,
+    so no thread is created per broadcast.
+    The broadcast is decided as soon as possible:
+        - as soon as one peer rejects the request, the requests still in flight are cancelled,
+        - the peers that have not answered when the deadline expires count as failed.
+
+    Attributes:
+        client (PeerClient): the client that carries the HTTP requests.
+        deadline (float): the seconds that a broadcast may last.
+    """
+
+    def __init__(self, client = None, deadline = None, max_workers = None):
+        """Inits the broadcast engine. The event loop and the worker threads start on the first broadcast."""
+        self.client = peer_client if client is None else client
+        self.deadline = config.BROADCAST_DEADLINE if deadline is None else deadline
+        self._max_workers = config.BROADCAST_MAX_WORKERS if max_workers is None else max_workers
+        self._loop = None
+        self._executor = None
+        self._lock = threading.Lock() # guards the lazy start of the event loop
+
+    def _get_loop(self):
+        """Returns the event loop of the engine, starting it in a daemon thread on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._executor = ThreadPoolExecutor(max_workers = self._max_workers, thread_name_prefix = "broadcast")
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(self._executor)
+                threading.Thread(target = self._loop.run_forever, name = "broadcast-loop", daemon = True).start()
+            return self._loop
+
+    def broadcast(self, ring, endpoint, data = None, deadline = None, stop_on_rejection = True):
+        """
+        Posts the data to the given endpoint of every node in the ring and returns a BroadcastResult.
+        Blocks the calling thread until the broadcast is decided.
+        With stop_on_rejection = False, a rejection does not cancel the requests to the other nodes,
+        e.g. when the data must reach every node regardless of the answers.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        future = asyncio.run_coroutine_threadsafe(self._broadcast(ring, endpoint, data, deadline, stop_on_rejection), self._get_loop())
+        return future.result()
+
+    async def _post(self, ring_node, endpoint, data):
+        """Posts the data to a single ring node on a worker thread and returns the response."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.client.post(ring_node["ip"], ring_node["port"], endpoint, data = data))
+
+    async def _broadcast(self, ring, endpoint, data, deadline, stop_on_rejection):
+        """The coroutine behind self.broadcast()."""
+        start = time.perf_counter()
+        tasks = {asyncio.ensure_future(self._post(ring_node, endpoint, data)): ring_node for ring_node in ring}
+        results = {}
+        accepted = True
+
+        pending = set(tasks)
+        while pending:
+            remaining = deadline - (time.perf_counter() - start)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout = remaining, return_when = asyncio.FIRST_COMPLETED)
+            for task in done:
+                node_id = tasks[task]["id"]
+                elapsed = time.perf_counter() - start
+                try:
+                    response = task.result()
+                except Exception as e:
+                    results[node_id] = PeerResult(node_id, "error", message = str(e), elapsed = elapsed)
+                    accepted = False
+                    continue
+                outcome = "accepted" if 200 <= response.status_code < 300 else "rejected"
+                data = _response_json(response)
+                message = data["message"] if isinstance(data, dict) and "message" in data else response.text
+                results[node_id] = PeerResult(node_id, outcome, response.status_code, message, elapsed, data)
+                if outcome != "accepted":
+                    accepted = False
+            # As soon as one peer has not accepted, the outcome of the broadcast is known.
+            if not accepted and stop_on_rejection:
+                break
+
+        # Cancel the requests that are still in flight.
+        # A request whose worker thread has already started runs to completion, but nobody waits for it.
+        elapsed = time.perf_counter() - start
+        for task in pending:
+            task.cancel()
+            node_id = tasks[task]["id"]
+            results[node_id] = PeerResult(node_id, "cancelled" if not accepted and stop_on_rejection else "timeout", elapsed = elapsed)
+            accepted = False
+
+        endpoint_name = endpoint.split("?")[0] # the query arguments would multiply the series of the metrics
+        BROADCAST_LATENCY.observe(elapsed, endpoint = endpoint_name)
+        for peer_result in results.values():
+            BROADCAST_PEER_LATENCY.observe(peer_result.elapsed, endpoint = endpoint_name, peer = peer_result.node_id, outcome = peer_result.outcome)
+        return BroadcastResult(accepted, [results[ring_node["id"]] for ring_node in ring], elapsed)
+
+def _response_json(response):
+    """Returns the JSON body of a response, or None if the body is not JSON."""
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+# The broadcast engine shared by the whole installation of the current node.
+broadcast_engine = BroadcastEngine()
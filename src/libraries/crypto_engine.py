@@ -0,0 +1,198 @@
+import threading
+from collections import OrderedDict
+import rsa
+import config
+from libraries.metrics import SIGN_LATENCY, VERIFY_LATENCY, SIGNATURE_CACHE_LOOKUPS
+
+class RsaBackend:
+    """Signs and verifies with the pure Python rsa module."""
+
+    name = "rsa"
+
+    def load_public_key(self, public_key_pem):
+        """Parses a PKCS#1 PEM public key."""
+        return rsa.PublicKey.load_pkcs1(public_key_pem.encode())
+
+    def load_private_key(self, private_key_pem):
+        """Parses a PKCS#1 PEM private key."""
+        return rsa.PrivateKey.load_pkcs1(private_key_pem.encode())
+
+    def sign(self, data, private_key):
+        """Returns the PKCS#1 v1.5 SHA-256 signature of the data (bytes)."""
+        return rsa.sign(data, private_key, "SHA-256")
+
+    def verify(self, data, signature, public_key):
+        """Returns True if the signature of the data (bytes) is valid, else False."""
+        try:
+            rsa.verify(data, signature, public_key)
+            return True
+        except rsa.VerificationError:
+            return False
+
+class CryptographyBackend:
+    """
+    Signs and verifies with the OpenSSL bindings of the cryptography package.
+    The keys and the signatures are interchangeable with the ones of RsaBackend.
+    """
+
+    name = "cryptography"
+
+    def __init__(self):
+        """Inits the backend. Raises ImportError if the cryptography package is not installed."""
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import padding
+        self._invalid_signature = InvalidSignature
+        self._serialization = serialization
+        self._padding = padding.PKCS1v15()
+        self._hash = hashes.SHA256()
+
+    def load_public_key(self, public_key_pem):
+        """Parses a PKCS#1 PEM public key."""
+        return self._serialization.load_pem_public_key(public_key_pem.encode())
+
+    def load_private_key(self, private_key_pem):
+        """Parses a PKCS#1 PEM private key."""
+        return self._serialization.load_pem_private_key(private_key_pem.encode(), password = None)
+
+    def sign(self, data, private_key):
+        """Returns the PKCS#1 v1.5 SHA-256 signature of the data (bytes)."""
+        return private_key.sign(data, self._padding, self._hash)
+
+    def verify(self, data, signature, public_key):
+        """Returns True if the signature of the data (bytes) is valid, else False."""
+        try:
+            public_key.verify(signature, data, self._padding, self._hash)
+            return True
+        except self._invalid_signature:
+            return False
+
+# The available signature backends by name. New backends register here with register_backend().
+BACKENDS = {
+    RsaBackend.name: RsaBackend,
+    CryptographyBackend.name: CryptographyBackend
+}
+
+def register_backend(backend_class):
+    """Makes a signature backend available to get_backend() under its name."""
+    BACKENDS[backend_class.name] = backend_class
+
+def get_backend(name):
+    """Returns a new instance of the signature backend with the given name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown signature backend '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
+
+class CryptoEngine:
+    """
+    Signs and verifies data on behalf of the wallets and the transactions, without parsing a PEM key on every call.
+
+    Attributes:
+        backend: the signature backend that does the actual cryptographic work.
+        cache_size (int): the maximum number of parsed public keys kept in memory.
+    """
+
+    def __init__(self, backend = None, cache_size = None):
+        """Inits the crypto engine. The arguments that are not given are taken from the config file."""
+        self.backend = get_backend(config.SIGNATURE_BACKEND) if backend is None else backend
+        self.cache_size = config.PUBLIC_KEY_CACHE_SIZE if cache_size is None else cache_size
+        self._public_keys = OrderedDict() # public key PEM --> parsed public key, least recently used first
+        self._private_keys = {} # private key PEM --> parsed private key, normally only the key of the current node
+        self._lock = threading.Lock() # guards both key caches
+
+    def __str__(self):
+        """Returns a string representation of the crypto engine."""
+        return str(self.__class__) + ": " + str({"backend": self.backend.name, "cache_size": self.cache_size})
+
+    def public_key(self, public_key_pem):
+        """Returns the parsed public key, parsing it only if it is not in the cache."""
+        with self._lock:
+            key = self._public_keys.get(public_key_pem)
+            if key is not None:
+                self._public_keys.move_to_end(public_key_pem)
+                return key
+        key = self.backend.load_public_key(public_key_pem)
+        with self._lock:
+            self._public_keys[public_key_pem] = key
+            if len(self._public_keys) > self.cache_size:
+                self._public_keys.popitem(last = False)
+        return key
+
+    def private_key(self, private_key_pem):
+        """Returns the parsed private key, parsing it only on first use."""
+        with self._lock:
+            key = self._private_keys.get(private_key_pem)
+        if key is None:
+            key = self.backend.load_private_key(private_key_pem)
+            with self._lock:
+                self._private_keys[private_key_pem] = key
+        return key
+
+    def sign(self, data, private_key_pem):
+        """Returns the signature of the given string with the given private key."""
+        with SIGN_LATENCY.time(backend = self.backend.name):
+            return self.backend.sign(data.encode(), self.private_key(private_key_pem))
+
+    def verify(self, data, signature, public_key_pem):
+        """Returns True if the signature of the given string derives from the given public key, else False."""
+        with VERIFY_LATENCY.time(backend = self.backend.name):
+            return self.backend.verify(data.encode(), signature, self.public_key(public_key_pem))
+
+class VerifiedSignatureCache:
+    """
+    The (transaction hash, signature) pairs whose signatures the current node has already verified as valid,
+    so that a transaction that reaches the node again (in a block, a chain synchronization or a revalidation) is not verified again.
+    The hash of a transaction commits to the public key of its sender, so a pair stays valid forever; only valid pairs are kept.
+
+    Attributes:
+        max_size (int): the maximum number of pairs kept; the least recently used pairs are dropped first.
+        hits (int): the lookups that found a verified pair.
+        misses (int): the lookups that did not, so the signature had to be verified.
+    """
+
+    def __init__(self, max_size = None):
+        """Inits an empty cache. The size that is not given is taken from the config file."""
+        self.max_size = config.VERIFIED_SIGNATURE_CACHE_SIZE if max_size is None else max_size
+        self.hits = 0
+        self.misses = 0
+        self._pairs = OrderedDict() # (transaction hash, signature) --> None, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of pairs in the cache."""
+        return len(self._pairs)
+
+    def __str__(self):
+        """Returns a string representation of the cache."""
+        return str(self.__class__) + ": " + str(self.stats())
+
+    def is_verified(self, transaction_hash, signature):
+        """Returns whether the signature of the transaction with the given hash has been verified as valid, and counts a hit or a miss."""
+        key = (transaction_hash, bytes(signature))
+        with self._lock:
+            if key in self._pairs:
+                self._pairs.move_to_end(key)
+                self.hits += 1
+                SIGNATURE_CACHE_LOOKUPS.inc(result = "hit")
+                return True
+            self.misses += 1
+        SIGNATURE_CACHE_LOOKUPS.inc(result = "miss")
+        return False
+
+    def add(self, transaction_hash, signature):
+        """Records that the signature of the transaction with the given hash is valid."""
+        key = (transaction_hash, bytes(signature))
+        with self._lock:
+            self._pairs[key] = None
+            self._pairs.move_to_end(key)
+            if len(self._pairs) > self.max_size:
+                self._pairs.popitem(last = False)
+
+    def stats(self):
+        """Returns the size of the cache and its hit and miss counters."""
+        with self._lock:
+            return {"size": len(self._pairs), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+# The crypto engine and the verified signatures shared by the whole installation of the current node.
+crypto_engine = CryptoEngine()
+verified_signatures = VerifiedSignatureCache()
@@ -17,3 +17,15 @@ class InsufficientBalanceError(Exception):
 class TransactionValidationError(Exception):
     """Custom error for detecting transaction validation failure across the nodes in the network."""
     pass
+
+class WireFormatError(Exception):
+    """Custom error for decoding a transaction or a block that is not in the expected wire format."""
+    pass
+
+class ChainSyncError(Exception):
+    """Custom error for blocks received during a chain synchronization that do not extend the current chain."""
+    pass
+
+class LedgerError(Exception):
+    """Custom error for applying a block to the ledger that would leave it in an invalid state."""
+    pass
@@ -1,6 +1,10 @@
 import hashlib
 import json
-import requests
+import time
+from requests.exceptions import RequestException
+from functools import lru_cache
+from libraries.peer_client import peer_client
+import config
 
 def to_json(obj):
     """Converts the given object into a json string."""
@@ -11,31 +15,96 @@ def calculate_hash(obj):
     hash = hashlib.sha256(to_json(obj).encode()).hexdigest()
     return hash
 
-def make_get_request(ip, port, endpoint):
-    """Makes a GET request to http://{ip}:{port}/blockchat/{endpoint} and returns the response."""
-    url = f"http://{ip}:{port}/blockchat/{endpoint}"
-    response = requests.get(url)
+def calculate_digest(data):
+    """Calculates and returns the hash of the given bytes, in the same hexadecimal form as calculate_hash()."""
+    return hashlib.sha256(data).hexdigest()
+
+@lru_cache(maxsize = 1024)
+def key_fingerprint(public_key):
+    """Returns the 32-byte SHA-256 fingerprint of the given public key, which stands for the whole key in the hashed data."""
+    return hashlib.sha256(public_key.encode()).digest()
+
+def make_get_request(ip, port, endpoint, stream = False):
+    """
+    Makes a GET request to http://{ip}:{port}/blockchat/{endpoint} and returns the response.
+    If stream is True, the body is left unread, to be read from response.raw, and the caller must close the response.
+    """
+    # The request goes through the shared peer client, which reuses a keep-alive connection to the peer.
+    response = peer_client.get(ip, port, endpoint, stream = stream)
     return response
 
 def make_post_request(ip, port, endpoint, data = None):
     """Makes a POST request to http://{ip}:{port}/blockchat/{endpoint} with the given data and returns the response."""
-    url = f"http://{ip}:{port}/blockchat/{endpoint}"
-    response = requests.post(url, data)
+    # The request goes through the shared peer client, which reuses a keep-alive connection to the peer.
+    response = peer_client.post(ip, port, endpoint, data = data)
     return response
 
+def wait_for_node(ip, port, timeout = None):
+    """
+    Waits until the server of the node at the given ip address and port answers, instead of sleeping for a fixed time.
+    Returns True if the server answered within the timeout (config.SESSION_READY_TIMEOUT by default), else False.
+    """
+    timeout = config.SESSION_READY_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if peer_client.request("GET", ip, port, "health", timeout = config.SESSION_POLL_INTERVAL * 5).status_code == 200:
+                return True
+        except RequestException:
+            pass
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(config.SESSION_POLL_INTERVAL)
+
 def transaction_total_expenses(bcc = None, message = None):
     """
-    Calculates the total expenses of the transaction:
+    Calculates the total expenses of the transaction, in cents of BCC (see config.BCC_CENTS):
     - When transferring bcc, there is a fee of 3%.
     - When sending a message, there is a fee of 1 bcc per character in the message.
     """
     total = 0
     if bcc:
-        total += bcc * 1.03 # include the amount of bcc being transferred
+        total += bcc * config.BCC_CENTS * 103 // 100 # include the amount of bcc being transferred
     if message:
-        total += len(message.strip())
+        total += len(message.strip()) * config.BCC_CENTS
     return total
 
+def transaction_fee(bcc = None, message = None):
+    """Calculates the fee of the transaction in cents of BCC, i.e. its total expenses except for the bcc that reach the recipient."""
+    return transaction_total_expenses(bcc, message) - (bcc or 0) * config.BCC_CENTS
+
+def genesis_bcc():
+    """
+    Calculates the cents of BCC that the genesis block credits to the bootstrap node:
+    config.GENESIS_BCC_PER_NODE for every node in the network, together with the fees of sending them to the other nodes,
+    so that the bootstrap node can fund a network of any size.
+    """
+    return config.total_nodes * transaction_total_expenses(config.GENESIS_BCC_PER_NODE)
+
+def to_bcc(cents):
+    """Converts an amount in cents of BCC, as the ledger and the wallets keep it, into BCC."""
+    return cents / config.BCC_CENTS
+
+def parse_bcc(value):
+    """
+    Parses the amount of bcc of a new transaction, as a client sends it: a whole, non-negative number or its string.
+    A missing amount is 0. Raises ValueError for any other value.
+    """
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid amount of bcc: {value}")
+    if isinstance(value, str):
+        value = value.strip()
+        value = int(value) if value.lstrip("-").isdigit() else float(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f"The amount of bcc must be a whole number: {value}")
+        value = int(value)
+    if not isinstance(value, int) or value < 0:
+        raise ValueError(f"Invalid amount of bcc: {value}")
+    return value
+
 def retrieve_from_ring_node(ring, ring_node_id, request):
     """Returns the ip address, the port or the public key of the ring node, given its id."""
     for ring_node in ring:
@@ -0,0 +1,120 @@
+import hashlib
+
+# Leaves and inner nodes are hashed with different prefixes, so that an inner node can never pass for a leaf (RFC 6962).
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+def leaf_hash(data):
+    """Returns the raw hash of a leaf of the tree with the given data."""
+    return hashlib.sha256(_LEAF_PREFIX + data).digest()
+
+def node_hash(left, right):
+    """Returns the raw hash of an inner node of the tree with the given raw hashes of its children."""
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+class MerkleTree:
+    """
+    A Merkle tree over a list of transaction hashes, laid out as in RFC 6962:
+    the left subtree of every inner node is the largest perfect subtree that fits, so the tree grows by appending leaves.
+
+    The root is kept up to date with a frontier, i.e. the roots of the perfect subtrees that the leaves form so far
+    (one per set bit of the number of leaves), so appending a leaf costs O(log n) hashes and the root never needs
+    the whole tree again.
+
+    Attributes:
+        leaves (list): the raw hashes of the leaves, in order.
+    """
+
+    def __init__(self, transaction_hashes = ()):
+        """Inits a tree with the given transaction hashes (hex strings) as leaves."""
+        self.leaves = []
+        self._frontier = [] # level --> raw root of the perfect subtree of 2 ** level leaves at that level, or None
+        for transaction_hash in transaction_hashes:
+            self.append(transaction_hash)
+
+    def __str__(self):
+        """Returns a string representation of the tree."""
+        return str(self.__class__) + ": " + str({"leaves": len(self.leaves), "root": self.root()})
+
+    def __len__(self):
+        """Returns the number of leaves."""
+        return len(self.leaves)
+
+    def append(self, transaction_hash):
+        """Appends the given transaction hash (hex string) as the next leaf of the tree."""
+        carry = leaf_hash(bytes.fromhex(transaction_hash))
+        self.leaves.append(carry)
+        # Merge the new leaf with the perfect subtrees of the same size, like a carry in a binary counter.
+        level = 0
+        while level < len(self._frontier) and self._frontier[level] is not None:
+            carry = node_hash(self._frontier[level], carry)
+            self._frontier[level] = None
+            level += 1
+        if level == len(self._frontier):
+            self._frontier.append(None)
+        self._frontier[level] = carry
+
+    def root(self):
+        """Returns the root of the tree as a hex string. The root of an empty tree is the hash of no data."""
+        root = None
+        for subtree_root in self._frontier:
+            if subtree_root is not None:
+                root = subtree_root if root is None else node_hash(subtree_root, root)
+        return hashlib.sha256().hexdigest() if root is None else root.hex()
+
+    def _subtree_root(self, start, end):
+        """Returns the raw root of the subtree of the leaves from start up to (not including) end."""
+        if end - start == 1:
+            return self.leaves[start]
+        split = _largest_power_of_two_below(end - start)
+        return node_hash(self._subtree_root(start, start + split), self._subtree_root(start + split, end))
+
+    def proof(self, position):
+        """
+        Returns the inclusion proof of the leaf at the given position, i.e. the hex hashes of the siblings on the path
+        from the leaf up to the root, starting from the leaf. The proof holds O(log n) hashes.
+        """
+        if not 0 <= position < len(self.leaves):
+            raise IndexError("Leaf position out of range.")
+        path = []
+        start, end = 0, len(self.leaves)
+        while end - start > 1:
+            split = start + _largest_power_of_two_below(end - start)
+            if position < split:
+                path.append(self._subtree_root(split, end))
+                end = split
+            else:
+                path.append(self._subtree_root(start, split))
+                start = split
+        return [sibling.hex() for sibling in reversed(path)]
+
+def _largest_power_of_two_below(n):
+    """Returns the largest power of two that is smaller than n (n > 1)."""
+    return 1 << ((n - 1).bit_length() - 1)
+
+def verify_inclusion(transaction_hash, position, tree_size, proof, root):
+    """
+    Checks the inclusion proof of a transaction, as returned by MerkleTree.proof(), against the Merkle root of a block,
+    without the other transactions of the block.
+    The transaction hash, the proof hashes and the root are hex strings. Returns True if the transaction is at the given position
+    of a tree of tree_size leaves with the given root, else False.
+    """
+    if not 0 <= position < tree_size:
+        return False
+    index, last_index = position, tree_size - 1
+    result = leaf_hash(bytes.fromhex(transaction_hash))
+    for sibling in proof:
+        if last_index == 0:
+            return False
+        sibling = bytes.fromhex(sibling)
+        if index & 1 or index == last_index:
+            result = node_hash(sibling, result)
+            # A right-most node without a sibling moves up the levels unchanged.
+            while not index & 1 and index != 0:
+                index >>= 1
+                last_index >>= 1
+        else:
+            result = node_hash(result, sibling)
+        index >>= 1
+        last_index >>= 1
+    return last_index == 0 and result.hex() == root
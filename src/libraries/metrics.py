@@ -0,0 +1,202 @@
+import bisect
+import functools
+import threading
+import time
+import config
+
+# The default buckets of the latency histograms, in seconds, from 50 microseconds to 10 seconds.
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class _Timer:
+    """Times a block of code and observes the elapsed seconds in a histogram when the block exits."""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        """Inits the timer."""
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        """Starts the timer."""
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Observes the elapsed seconds."""
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+class _NullTimer:
+    """The timer used while the metrics are disabled, which does nothing."""
+
+    def __enter__(self):
+        """Does nothing."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Does nothing."""
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Counter:
+    """
+    A counter that only goes up, with one value per combination of label values.
+
+    Attributes:
+        name (str): the name of the metric.
+        documentation (str): the help text of the metric.
+        label_names (tuple): the names of the labels.
+    """
+
+    def __init__(self, name, documentation, label_names = ()):
+        """Inits the counter."""
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {} # label values --> value
+        self._lock = threading.Lock()
+
+    def inc(self, amount = 1, **labels):
+        """Increases the counter of the given label values by the given amount."""
+        if not config.METRICS_ENABLED:
+            return
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Returns the (label values, value) pairs of the counter."""
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        """Returns the counter in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.samples()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class Histogram:
+    """
+    A histogram of observed values (e.g. latencies in seconds), with cumulative buckets, a sum and a count
+    for every combination of label values.
+    Observing a value costs a binary search over the buckets and a short critical section, so it can stay on in production.
+
+    Attributes:
+        name (str): the name of the metric.
+        documentation (str): the help text of the metric.
+        label_names (tuple): the names of the labels.
+        buckets (tuple): the upper bounds of the buckets, in increasing order.
+    """
+
+    def __init__(self, name, documentation, label_names = (), buckets = LATENCY_BUCKETS):
+        """Inits the histogram."""
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {} # label values --> [count per bucket (the last for +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Observes a value for the given label values."""
+        if not config.METRICS_ENABLED:
+            return
+        key = tuple(str(labels[name]) for name in self.label_names)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Returns a context manager that observes the seconds its block takes, for the given label values."""
+        if not config.METRICS_ENABLED:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def samples(self):
+        """Returns the (label values, bucket counts, sum, count) tuples of the histogram."""
+        with self._lock:
+            return [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+
+    def render(self):
+        """Returns the histogram in the Prometheus text format, with cumulative buckets."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, bucket_counts, total, count in sorted(self.samples()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names + ("le",), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+def _format_labels(names, values):
+    """Returns the labels of a sample in the Prometheus text format, e.g. {endpoint="get_balance"}."""
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f"{name}=\"{value}\"" for name, value in zip(names, escaped)) + "}"
+
+def timed(histogram, **labels):
+    """Returns a decorator that observes the seconds every call of the decorated function takes in the given histogram."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not config.METRICS_ENABLED:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+class MetricsRegistry:
+    """The metrics of the current node, rendered together at the /blockchat/metrics endpoint."""
+
+    def __init__(self):
+        """Inits an empty registry."""
+        self._metrics = []
+
+    def counter(self, name, documentation, label_names = ()):
+        """Creates a counter and registers it."""
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, label_names = (), buckets = LATENCY_BUCKETS):
+        """Creates a histogram and registers it."""
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns all the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# The metrics registry shared by the whole installation of the current node, and the metrics of the hot paths.
+registry = MetricsRegistry()
+
+ENDPOINT_LATENCY = registry.histogram("blockchat_endpoint_duration_seconds", "Time spent serving a request, per endpoint.", ("endpoint", "method"))
+ENDPOINT_REQUESTS = registry.counter("blockchat_endpoint_requests_total", "Requests served, per endpoint and status code.", ("endpoint", "method", "status"))
+BROADCAST_LATENCY = registry.histogram("blockchat_broadcast_duration_seconds", "Time until a broadcast to the ring is decided, per endpoint.", ("endpoint",))
+BROADCAST_PEER_LATENCY = registry.histogram("blockchat_broadcast_peer_duration_seconds", "Time until the outcome of a broadcast request to a single peer is known.", ("endpoint", "peer", "outcome"))
+SIGN_LATENCY = registry.histogram("blockchat_sign_duration_seconds", "Time spent signing data, per signature backend.", ("backend",))
+VERIFY_LATENCY = registry.histogram("blockchat_verify_duration_seconds", "Time spent verifying a signature in the current process, per signature backend.", ("backend",))
+BATCH_VERIFY_LATENCY = registry.histogram("blockchat_batch_verify_duration_seconds", "Time spent verifying the signatures of a batch of transactions, per mode.", ("mode",))
+SIGNATURE_CACHE_LOOKUPS = registry.counter("blockchat_signature_cache_lookups_total", "Lookups of a transaction signature in the cache of verified signatures, per result (hit or miss).", ("result",))
+VERIFIED_SIGNATURES = registry.counter("blockchat_verified_signatures_total", "Signatures verified, per result.", ("result",))
+HASH_LATENCY = registry.histogram("blockchat_hash_duration_seconds", "Time spent calculating a hash that is not memoised yet, per kind of object.", ("object",))
+SERIALIZATION_LATENCY = registry.histogram("blockchat_serialization_duration_seconds", "Time spent encoding or decoding the wire format, per kind of object.", ("object", "operation"))
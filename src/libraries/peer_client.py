@@ -0,0 +1,110 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import config
+
+class PeerClient:
+    """
+    The HTTP client that carries every request from the current node to the other nodes in the network.
+
+    Every peer, i.e. every distinct (ip, port) pair, gets its own requests.Session with a pool of keep-alive connections,
+    so that consecutive requests to the same peer reuse an open TCP connection instead of making a new one.
+
+    Attributes:
+        connect_timeout (float): the seconds to wait for a TCP connection to a peer.
+        read_timeout (float): the seconds to wait for a peer to answer a request.
+        max_retries (int): the number of retries of a failed request, on top of the initial attempt.
+        backoff_factor (float): the base of the exponential waiting time between two retries.
+        max_concurrency (int): the maximum number of simultaneous requests (and pooled connections) per peer.
+    """
+
+    def __init__(self, connect_timeout = None, read_timeout = None, max_retries = None, backoff_factor = None, max_concurrency = None):
+        """Inits the peer client. The arguments that are not given are taken from the config file."""
+        self.connect_timeout = config.PEER_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = config.PEER_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = config.PEER_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_factor = config.PEER_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+        self.max_concurrency = config.PEER_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self._peers = {} # (ip, port) --> (session, semaphore)
+        self._lock = threading.Lock() # guards self._peers
+
+    def __str__(self):
+        """Returns a string representation of the peer client."""
+        return str(self.__class__) + ": " + str(self.__dict__)
+
+    def _get_peer(self, ip, port):
+        """Returns the session and the concurrency semaphore of the given peer, creating them on first use."""
+        key = (str(ip), str(port))
+        with self._lock:
+            if key not in self._peers:
+                session = requests.Session()
+                # One connection pool per peer, as large as the number of requests allowed to run simultaneously.
+                # The retries are handled by self.request(), so the adapter itself never retries.
+                adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = self.max_concurrency, max_retries = 0)
+                session.mount("http://", adapter)
+                self._peers[key] = (session, threading.BoundedSemaphore(self.max_concurrency))
+            return self._peers[key]
+
+    def _should_retry(self, method, error):
+        """
+        Decides whether a failed request may be sent again:
+            - a request that never reached the peer (connection refused, connect timeout) is always retried,
+            - a request that may have been processed by the peer (read timeout, connection dropped after the request was sent)
+            is only retried if it is a GET request, since POST requests change the state of the peer.
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return method == "GET" or self._is_refused_connection(error)
+        return False
+
+    @staticmethod
+    def _is_refused_connection(error):
+        """Returns whether a ConnectionError comes from a new connection that the peer refused, so the request was never sent."""
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def request(self, method, ip, port, endpoint, data = None, timeout = None, stream = False):
+        """
+        Makes a {method} request to http://{ip}:{port}/blockchat/{endpoint} and returns the response.
+        If stream is True, only the headers of the response are read: the caller reads the body from response.raw
+        and must close the response, which returns its connection to the pool.
+        Failed requests are retried up to self.max_retries times with exponential backoff.
+        If the last attempt fails as well, its exception is raised.
+        """
+        url = f"http://{ip}:{port}/blockchat/{endpoint}"
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        session, semaphore = self._get_peer(ip, port)
+
+        attempt = 0
+        while True:
+            try:
+                # Do not exceed the allowed number of simultaneous requests to the peer.
+                with semaphore:
+                    return session.request(method, url, data = data, timeout = timeout, stream = stream)
+            except requests.exceptions.RequestException as e:
+                if attempt >= self.max_retries or not self._should_retry(method, e):
+                    raise
+            time.sleep(self.backoff_factor * 2 ** attempt)
+            attempt += 1
+
+    def get(self, ip, port, endpoint, timeout = None, stream = False):
+        """Makes a GET request to the given peer and returns the response, with its body left unread if stream is True."""
+        return self.request("GET", ip, port, endpoint, timeout = timeout, stream = stream)
+
+    def post(self, ip, port, endpoint, data = None, timeout = None):
+        """Makes a POST request to the given peer with the given data and returns the response."""
+        return self.request("POST", ip, port, endpoint, data = data, timeout = timeout)
+
+    def close(self):
+        """Closes the pooled connections to all the peers."""
+        with self._lock:
+            for session, _ in self._peers.values():
+                session.close()
+            self._peers = {}
+
+# The peer client shared by the whole installation of the current node.
+peer_client = PeerClient()
@@ -0,0 +1,91 @@
+import hashlib
+
+class StakeLottery:
+    """
+    The proof-of-stake lottery that elects the validator of every block, with a chance proportional to the stake of each node.
+
+    The stakes are kept in a Fenwick tree (binary indexed tree) over the node ids, i.e. an implicit cumulative-stake array:
+        - a stake change updates O(log N) entries of the tree in place, instead of rebuilding the cumulative sums,
+        - the draw is a binary search for the node whose cumulative stake range holds a pseudo-random point, in O(log N).
+    The point is derived from the hash of the previous block, so every node elects the same validator without extra messages.
+
+    Attributes:
+        stakes (list): node id --> stake of the node, in whole BCC.
+        total_stake (int): the sum of the stakes of all the nodes.
+    """
+
+    def __init__(self):
+        """Inits a lottery without any node."""
+        self.stakes = []
+        self.total_stake = 0
+        self._tree = [0] # 1-based Fenwick tree: _tree[i] is the sum of the stakes of the nodes i - (i & -i), ..., i - 1
+
+    def __str__(self):
+        """Returns a string representation of the lottery."""
+        return str(self.__class__) + ": " + str({"stakes": self.stakes, "total_stake": self.total_stake})
+
+    def __len__(self):
+        """Returns the number of nodes in the lottery."""
+        return len(self.stakes)
+
+    def _rebuild(self):
+        """Rebuilds the Fenwick tree from the stakes in O(N). Only needed when nodes join the lottery."""
+        self._tree = [0] + list(self.stakes)
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def add_node(self, node_id, stake = 0):
+        """Adds the node with the given id to the lottery with the given stake, or sets its stake if it is already in the lottery."""
+        if node_id < len(self.stakes):
+            self.set_stake(node_id, stake)
+            return
+        self.stakes.extend([0] * (node_id + 1 - len(self.stakes)))
+        self.stakes[node_id] = stake
+        self.total_stake += stake
+        self._rebuild()
+
+    def set_stake(self, node_id, stake):
+        """Sets the stake of the node with the given id, updating the Fenwick tree incrementally in O(log N)."""
+        delta = stake - self.stakes[node_id]
+        if not delta:
+            return
+        self.stakes[node_id] = stake
+        self.total_stake += delta
+        i = node_id + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_stake(self, node_id):
+        """Returns the sum of the stakes of the nodes with ids up to the given one, inclusive, in O(log N)."""
+        total = 0
+        i = node_id + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, point):
+        """Returns the id of the node whose cumulative stake range [prefix_stake(id) - stake, prefix_stake(id)) holds the given point, in O(log N)."""
+        position = 0
+        remaining = point
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            next_position = position + step
+            if next_position < len(self._tree) and self._tree[next_position] <= remaining:
+                position = next_position
+                remaining -= self._tree[next_position]
+            step >>= 1
+        return position # the 1-based position of the last node whose prefix is <= point, i.e. the 0-based id of the next node
+
+    def draw(self, seed):
+        """
+        Elects a node with a chance proportional to its stake, deterministically for the given seed (a string, e.g. the hash of the previous block).
+        Returns the id of the elected node, or None if no node has any stake.
+        """
+        if self.total_stake <= 0:
+            return None
+        point = int.from_bytes(hashlib.sha256(seed.encode()).digest(), "big") % self.total_stake
+        return self.find(point)
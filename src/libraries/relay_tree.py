@@ -0,0 +1,55 @@
+import threading
+from collections import OrderedDict
+import config
+
+def relay_children(ring, root_id, node_id, fanout = None):
+    """
+    Returns the ring nodes to which the given node relays a message that the node with id root_id broadcasts.
+
+    The ring, in its order, is laid out as a complete {fanout}-ary tree rooted at the broadcasting node:
+    the node at distance d from the root along the ring relays to the nodes at distances d * fanout + 1, ..., d * fanout + fanout.
+    Every node knows the same ring, so every node computes the same tree without extra messages,
+    every node sends at most {fanout} requests per message and the message reaches all the nodes in O(log N) hops.
+    """
+    fanout = config.RELAY_FANOUT if fanout is None else fanout
+    positions = {ring_node["id"]: position for position, ring_node in enumerate(ring)}
+    if root_id not in positions or node_id not in positions:
+        return []
+    distance = (positions[node_id] - positions[root_id]) % len(ring)
+    first_child = distance * fanout + 1
+    return [ring[(positions[root_id] + child) % len(ring)] for child in range(first_child, min(first_child + fanout, len(ring)))]
+
+class SeenCache:
+    """
+    The hashes of the most recent transactions and blocks that the current node has received through the relay tree,
+    so that a message that arrives twice (e.g. after a retry of the peer client) is neither processed nor relayed again.
+
+    Attributes:
+        max_size (int): the maximum number of hashes kept; the least recently seen hashes are dropped first.
+    """
+
+    def __init__(self, max_size = None):
+        """Inits an empty cache."""
+        self.max_size = config.RELAY_SEEN_CACHE_SIZE if max_size is None else max_size
+        self._hashes = OrderedDict() # hash --> None, least recently seen first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of hashes in the cache."""
+        return len(self._hashes)
+
+    def __contains__(self, item_hash):
+        """Returns whether the given hash has been seen."""
+        with self._lock:
+            return item_hash in self._hashes
+
+    def add(self, item_hash):
+        """Marks the given hash as seen. Returns True if it had not been seen yet, else False."""
+        with self._lock:
+            if item_hash in self._hashes:
+                self._hashes.move_to_end(item_hash)
+                return False
+            self._hashes[item_hash] = None
+            if len(self._hashes) > self.max_size:
+                self._hashes.popitem(last = False)
+            return True
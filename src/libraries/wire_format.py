@@ -0,0 +1,193 @@
+import struct
+from libraries.custom_exceptions import WireFormatError
+
+# Every encoded object starts with a header of 2 magic bytes, that name the kind of the object,
+# and 1 version byte, so that the layout can change without breaking the nodes running an older version.
+WIRE_FORMAT_VERSION = 1
+TRANSACTION_MAGIC = b"BT"
+BLOCK_MAGIC = b"BB"
+BLOCK_STREAM_MAGIC = b"BS"
+TRANSACTION_BATCH_MAGIC = b"BX"
+# The hashed encodings of the transactions and the blocks, which are never sent over the network.
+TRANSACTION_HASH_MAGIC = b"HT"
+BLOCK_HASH_MAGIC = b"HB"
+
+_HEADER = struct.Struct("!2sB")
+_UINT8 = struct.Struct("!B")
+_UINT32 = struct.Struct("!I")
+_INT64 = struct.Struct("!q")
+_FLOAT64 = struct.Struct("!d")
+
+class WireWriter:
+    """
+    Builds the canonical binary encoding of an object, field by field.
+    All the numbers are big-endian and every variable-length field is prefixed by its length,
+    so the same object always produces the same bytes.
+    """
+
+    def __init__(self, magic):
+        """Inits the writer with the header of the given kind of object."""
+        self._parts = [_HEADER.pack(magic, WIRE_FORMAT_VERSION)]
+
+    def uint8(self, value):
+        """Writes an integer in [0, 255]."""
+        self._parts.append(_UINT8.pack(value))
+
+    def uint32(self, value):
+        """Writes an integer in [0, 2^32)."""
+        self._parts.append(_UINT32.pack(value))
+
+    def int64(self, value):
+        """Writes an integer that may be None."""
+        if value is None:
+            self._parts.append(_UINT8.pack(0))
+        else:
+            self._parts.append(_UINT8.pack(1) + _INT64.pack(value))
+
+    def float64(self, value):
+        """Writes a float that may be None."""
+        if value is None:
+            self._parts.append(_UINT8.pack(0))
+        else:
+            self._parts.append(_UINT8.pack(1) + _FLOAT64.pack(value))
+
+    def bytes(self, value):
+        """Writes a bytes object that may be None."""
+        if value is None:
+            self._parts.append(_UINT8.pack(0))
+        else:
+            self._parts.append(_UINT8.pack(1) + _UINT32.pack(len(value)))
+            self._parts.append(value)
+
+    def string(self, value):
+        """Writes a string that may be None."""
+        self.bytes(None if value is None else value.encode("utf-8"))
+
+    def raw(self, value):
+        """Writes a bytes object of a fixed, known length, without a length prefix."""
+        self._parts.append(value)
+
+    def to_bytes(self):
+        """Returns the encoded object."""
+        return b"".join(self._parts)
+
+class WireReader:
+    """
+    Reads back, in the same order, the fields written by a WireWriter.
+    Reads from a memoryview, so the nested objects are parsed without copying the buffer.
+    """
+
+    def __init__(self, data, magic):
+        """Inits the reader and checks the header of the encoded object."""
+        self._view = memoryview(data)
+        self._offset = 0
+        found_magic, version = self._unpack(_HEADER)
+        if found_magic != magic:
+            raise WireFormatError(f"Unexpected object kind {found_magic!r}, expected {magic!r}.")
+        if version != WIRE_FORMAT_VERSION:
+            raise WireFormatError(f"Unsupported wire format version {version}.")
+
+    def _unpack(self, layout):
+        """Reads a fixed-size group of fields."""
+        if self._offset + layout.size > len(self._view):
+            raise WireFormatError("Truncated object.")
+        values = layout.unpack_from(self._view, self._offset)
+        self._offset += layout.size
+        return values
+
+    def _is_present(self):
+        """Reads the flag that precedes every field that may be None."""
+        return self._unpack(_UINT8)[0] == 1
+
+    def uint8(self):
+        """Reads an integer in [0, 255]."""
+        return self._unpack(_UINT8)[0]
+
+    def uint32(self):
+        """Reads an integer in [0, 2^32)."""
+        return self._unpack(_UINT32)[0]
+
+    def int64(self):
+        """Reads an integer that may be None."""
+        return self._unpack(_INT64)[0] if self._is_present() else None
+
+    def float64(self):
+        """Reads a float that may be None."""
+        return self._unpack(_FLOAT64)[0] if self._is_present() else None
+
+    def view(self):
+        """Reads a bytes field that may be None and returns it as a memoryview over the buffer."""
+        if not self._is_present():
+            return None
+        length = self._unpack(_UINT32)[0]
+        if self._offset + length > len(self._view):
+            raise WireFormatError("Truncated object.")
+        value = self._view[self._offset:self._offset + length]
+        self._offset += length
+        return value
+
+    def bytes(self):
+        """Reads a bytes object that may be None."""
+        value = self.view()
+        return None if value is None else value.tobytes()
+
+    def nested(self):
+        """Reads an encoded object embedded in the self object, which must be present, and returns it as a memoryview over the buffer."""
+        value = self.view()
+        if value is None:
+            raise WireFormatError("Missing embedded object.")
+        return value
+
+    def string(self):
+        """Reads a string that may be None."""
+        value = self.view()
+        if value is None:
+            return None
+        try:
+            return str(value, "utf-8")
+        except UnicodeDecodeError as e:
+            raise WireFormatError(f"Invalid UTF-8 string: {e}")
+
+    def finish(self):
+        """Checks that the whole encoded object has been read."""
+        if self._offset != len(self._view):
+            raise WireFormatError("Unexpected trailing bytes.")
+
+def stream_header(magic):
+    """Returns the header that opens a stream of objects of the given kind."""
+    return _HEADER.pack(magic, WIRE_FORMAT_VERSION)
+
+def stream_frame(data):
+    """Returns the frame of an encoded object in a stream: the object prefixed by its length."""
+    return _UINT32.pack(len(data)) + data
+
+def stream_end():
+    """Returns the empty frame that closes a stream, so that the reader can tell a complete stream from a cut one."""
+    return _UINT32.pack(0)
+
+def _read_exactly(stream, size):
+    """Reads exactly size bytes from a binary file-like object into a new buffer. Raises WireFormatError if the stream ends first."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = stream.readinto(view[received:])
+        if not count:
+            raise WireFormatError("Truncated stream.")
+        received += count
+    return buffer
+
+def read_stream(stream, magic, max_frame_bytes):
+    """
+    Reads a stream of objects of the given kind from a binary file-like object, e.g. the body of an HTTP response,
+    and yields the encoded objects one at a time, as memoryviews over a buffer of their own, so only one object is held in memory at a time.
+    Raises WireFormatError if the stream is malformed, ends before its closing frame, or announces an object larger than max_frame_bytes.
+    """
+    WireReader(_read_exactly(stream, _HEADER.size), magic).finish()
+    while True:
+        size = _UINT32.unpack(_read_exactly(stream, _UINT32.size))[0]
+        if size == 0:
+            return
+        if size > max_frame_bytes:
+            raise WireFormatError(f"Object of {size} bytes exceeds the limit of {max_frame_bytes} bytes.")
+        yield memoryview(_read_exactly(stream, size))
@@ -0,0 +1,185 @@
+import heapq
+import threading
+from collections import deque
+from time import time
+import config
+
+class Mempool:
+    """
+    The transactions that have been validated by the network but have not entered a block yet.
+
+    The transactions are deduplicated by hash and kept per sender in nonce order,
+    since a transaction can only enter a block after all the previous transactions of its sender.
+    When the mempool is full, the transaction with the lowest fee among the last transactions of every sender is evicted,
+    so that the eviction never leaves a gap in the nonces of a sender.
+
+    Attributes:
+        max_size (int): the maximum number of transactions in the mempool.
+        transactions (dict): transaction hash --> (transaction, time of entry into the mempool).
+        senders (dict): sender public key --> {nonce: transaction hash}.
+    """
+
+    def __init__(self, max_size = None):
+        """Inits an empty mempool."""
+        self.max_size = config.MEMPOOL_MAX_SIZE if max_size is None else max_size
+        self.transactions = {}
+        self.senders = {}
+        self._pending_expenses = {} # sender public key --> total expenses of its transactions in the mempool
+        self._counters = {"added": 0, "duplicates": 0, "evicted": 0, "rejected_full": 0, "included": 0, "discarded": 0}
+        self._inclusion_times = deque(maxlen = config.MEMPOOL_INCLUSION_SAMPLES) # seconds from entry to inclusion in a block
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        """Returns a string representation of the mempool."""
+        return str(self.__class__) + ": " + str(self.metrics())
+
+    def __len__(self):
+        """Returns the number of transactions in the mempool."""
+        return len(self.transactions)
+
+    def __contains__(self, transaction_hash):
+        """Returns whether the transaction with the given hash is in the mempool."""
+        return transaction_hash in self.transactions
+
+    def pending_expenses(self, public_key):
+        """Returns the total expenses of the transactions of the given sender that are in the mempool."""
+        with self._lock:
+            return self._pending_expenses.get(public_key, 0)
+
+    def next_nonce(self, ledger, public_key):
+        """
+        Returns the nonce of the next transaction of the given sender:
+        the next nonce of the sender in the ledger, after the transactions of the sender that wait in the mempool.
+        """
+        with self._lock:
+            return ledger.next_nonce(public_key) + len(self.senders.get(public_key, ()))
+
+    def add(self, transaction):
+        """
+        Adds a validated transaction to the mempool.
+        Returns (True, description) or (False, reason) if the transaction is a duplicate or the mempool is full.
+        """
+        with self._lock:
+            sender_transactions = self.senders.get(transaction.sender_public_key, {})
+            if transaction.hash in self.transactions or transaction.nonce in sender_transactions:
+                self._counters["duplicates"] += 1
+                return False, "Duplicate transaction."
+
+            if len(self.transactions) >= self.max_size:
+                evicted_hash = self._eviction_candidate()
+                # Evicting the last transaction of the same sender would leave a gap before the new transaction.
+                if evicted_hash is None or self.transactions[evicted_hash][0].fee() >= transaction.fee() or self.transactions[evicted_hash][0].sender_public_key == transaction.sender_public_key:
+                    self._counters["rejected_full"] += 1
+                    return False, "Mempool full."
+                self._remove(evicted_hash)
+                self._counters["evicted"] += 1
+
+            self.transactions[transaction.hash] = (transaction, time())
+            self.senders.setdefault(transaction.sender_public_key, {})[transaction.nonce] = transaction.hash
+            self._pending_expenses[transaction.sender_public_key] = self._pending_expenses.get(transaction.sender_public_key, 0) + transaction.total_expenses()
+            self._counters["added"] += 1
+            return True, "Transaction added to the mempool."
+
+    def _eviction_candidate(self):
+        """Returns the hash of the lowest-fee transaction among the last transactions (highest nonce) of every sender."""
+        candidate_hash = None
+        candidate_fee = None
+        for sender_transactions in self.senders.values():
+            last_hash = sender_transactions[max(sender_transactions)]
+            fee = self.transactions[last_hash][0].fee()
+            if candidate_fee is None or fee < candidate_fee:
+                candidate_hash, candidate_fee = last_hash, fee
+        return candidate_hash
+
+    def _remove(self, transaction_hash):
+        """Removes a transaction from the mempool and returns the time it entered the mempool."""
+        transaction, entered_at = self.transactions.pop(transaction_hash)
+        sender_transactions = self.senders[transaction.sender_public_key]
+        del sender_transactions[transaction.nonce]
+        if sender_transactions:
+            self._pending_expenses[transaction.sender_public_key] -= transaction.total_expenses()
+        else:
+            del self.senders[transaction.sender_public_key]
+            del self._pending_expenses[transaction.sender_public_key]
+        return entered_at
+
+    def remove_included(self, transactions):
+        """Removes the transactions that have entered a block and records how long they waited in the mempool."""
+        with self._lock:
+            now = time()
+            for transaction in transactions:
+                if transaction.hash in self.transactions:
+                    self._inclusion_times.append(now - self._remove(transaction.hash))
+                    self._counters["included"] += 1
+
+    def discard(self, transactions):
+        """Removes the given transactions, e.g. those that turned out to be invalid, together with the later transactions of their senders."""
+        with self._lock:
+            for transaction in transactions:
+                sender_transactions = self.senders.get(transaction.sender_public_key, {})
+                for nonce in [nonce for nonce in sender_transactions if transaction.nonce is not None and nonce >= transaction.nonce]:
+                    self._remove(sender_transactions[nonce])
+                    self._counters["discarded"] += 1
+
+    def prune(self, ledger):
+        """Removes the transactions whose nonce has already been used according to the ledger, e.g. replaced by a transaction in a block."""
+        with self._lock:
+            for public_key in list(self.senders):
+                next_nonce = ledger.next_nonce(public_key)
+                for nonce in [nonce for nonce in self.senders[public_key] if nonce < next_nonce]:
+                    self._remove(self.senders[public_key][nonce])
+
+    def pack(self, ledger, capacity = None):
+        """
+        Selects the transactions of the next block, at most {capacity} of them, by fee priority:
+            - the transactions of every sender are taken in nonce order, starting from the next nonce of the sender in the ledger,
+            - among the next transactions of all the senders, the one with the highest fee (then the oldest) goes first,
+            - a sender whose confirmed balance cannot cover its next transaction contributes no more transactions.
+        The selected transactions stay in the mempool until the block is applied.
+        """
+        capacity = config.block_capacity if capacity is None else capacity
+        with self._lock:
+            balances = {}
+            heap = []
+            def push_next(public_key, nonce):
+                transaction_hash = self.senders[public_key].get(nonce)
+                if transaction_hash is not None:
+                    transaction, entered_at = self.transactions[transaction_hash]
+                    heapq.heappush(heap, (-transaction.fee(), entered_at, transaction_hash))
+
+            for public_key in self.senders:
+                balances[public_key] = ledger.balance(public_key)
+                push_next(public_key, ledger.next_nonce(public_key))
+
+            packed = []
+            while heap and len(packed) < capacity:
+                _, _, transaction_hash = heapq.heappop(heap)
+                transaction = self.transactions[transaction_hash][0]
+                if balances[transaction.sender_public_key] < transaction.total_expenses():
+                    continue
+                balances[transaction.sender_public_key] -= transaction.total_expenses()
+                packed.append(transaction)
+                push_next(transaction.sender_public_key, transaction.nonce + 1)
+            return packed
+
+    def metrics(self):
+        """Returns the depth of the mempool, its counters and the statistics of the time from entry to inclusion in a block."""
+        with self._lock:
+            now = time()
+            inclusion_times = sorted(self._inclusion_times)
+            def percentile(p):
+                return inclusion_times[min(len(inclusion_times) - 1, int(p * len(inclusion_times)))] if inclusion_times else None
+            return {
+                "depth": len(self.transactions),
+                "senders": len(self.senders),
+                "max_size": self.max_size,
+                "oldest_age": max((now - entered_at for _, entered_at in self.transactions.values()), default = None),
+                **self._counters,
+                "time_to_inclusion": {
+                    "samples": len(inclusion_times),
+                    "mean": sum(inclusion_times) / len(inclusion_times) if inclusion_times else None,
+                    "p50": percentile(0.50),
+                    "p95": percentile(0.95),
+                    "max": inclusion_times[-1] if inclusion_times else None
+                }
+            }
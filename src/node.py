@@ -1,65 +1,373 @@
 from wallet import Wallet
-from libraries.functions_library import make_post_request, transaction_total_expenses, calculate_hash, retrieve_from_ring_node
-import pickle
+from libraries.functions_library import make_get_request, make_post_request, transaction_total_expenses
 from transaction import Transaction
-from libraries.custom_exceptions import InsufficientBalanceError, TransactionValidationError
+from blockchain import Blockchain
+from block_store import open_block_store
+from keystore import open_keystore
+from ledger_state import LedgerState
+from mempool import Mempool
+from block import Block
+import config
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from libraries.custom_exceptions import InsufficientBalanceError, TransactionValidationError, ChainSyncError, LedgerError, WireFormatError
+from libraries.broadcast_engine import broadcast_engine
+from libraries.relay_tree import relay_children, SeenCache
 
 class Node:
+    """
+    A node in the network.
+
+    Attributes:
+        id (int): the id of the node in the ring.
+        ip (str): the ip address of the node.
+        port (int): the port of the node.
+        is_bootstrap (bool): whether the node is the bootstrap node.
+        wallet (Wallet object): the wallet of the node.
+        ring (list): the nodes in the network, as dictionaries with their id, ip, port and public key.
+        chain (Blockchain object): the blockchain of the node, None until the node loads it from its block store or synchronizes it.
+        ledger (LedgerState object): the balances and the nonces of all the nodes, as they result from the blocks of the chain.
+        mempool (Mempool object): the validated transactions that have not entered a block yet.
+        seen (SeenCache object): the hashes of the transactions and the blocks that the node has received through the relay tree.
+    """
+
+    def __init__(self):
+        """Inits a node. The id, the ip address and the port are set once the node enters the network."""
+        self.id = None
+        self.ip = None
+        self.port = None
+        self.is_bootstrap = False
+        self.wallet = Wallet()
+        self.ring = []
+        self.chain = None
+        self.ledger = LedgerState()
+        self.mempool = Mempool()
+        self.seen = SeenCache()
+        self._background = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "relay") # relays and seals in arrival order, after the request is answered
+        self._chain_lock = threading.RLock() # serializes the changes of the ring, the chain, the ledger, the mempool and the wallet balance
+        self._sender_lock = threading.Lock() # serializes the transactions that the self node creates, from their nonces until they are validated
+        self._in_flight_expenses = 0 # total expenses of the created transactions that are being validated by the network
+        self._validated_nonces = {} # sender public key --> (highest nonce that the self node has validated but may not be in the mempool yet, time until which it counts)
+
+    def register_node_to_ring(self, node_id, ip, port, public_key):
+        """Adds a node to the ring of the self node and registers its account in the ledger."""
+        with self._chain_lock:
+            self.ring.append({"id": node_id, "ip": ip, "port": port, "public_key": public_key})
+            self.ledger.register_account(node_id, public_key)
+
+    def set_ring(self, ring):
+        """Replaces the ring of the self node with the given ring, registers the accounts of its nodes and updates the ledger."""
+        with self._chain_lock:
+            self.ring = ring
+            for ring_node in ring:
+                self.ledger.register_account(ring_node["id"], ring_node["public_key"])
+            self.update_ledger()
+
+    def update_ledger(self):
+        """
+        Applies the blocks of the self chain that are not applied to the ledger yet,
+        drops the transactions of the mempool that the applied blocks made obsolete
+        and sets the balance of the self wallet to the confirmed balance of the self node minus its pending expenses.
+        """
+        with self._chain_lock:
+            # The accounts of the ledger are only known once the node knows the ring.
+            if self.chain is None or not self.ring:
+                return
+            try:
+                self.ledger.apply_chain(self.chain)
+            except LedgerError as e:
+                print(f"Ledger update of node {self.id} stopped at block {self.ledger.applied_height}: {e}")
+            self.mempool.prune(self.ledger)
+            self._refresh_wallet_balance()
+
+    def _refresh_wallet_balance(self):
+        """
+        Sets the balance of the self wallet to the confirmed balance of the self node
+        minus the expenses of its transactions in the mempool and of those that are still being validated.
+        The balance is always derived from the state of the self node under the chain lock, never adjusted in place,
+        so concurrent requests cannot lose an update of it.
+        """
+        with self._chain_lock:
+            public_key = self.wallet.public_key
+            self.wallet.balance = self.ledger.balance(public_key) - self.mempool.pending_expenses(public_key) - self._in_flight_expenses
+
+    def _reserve_expenses(self, amount):
+        """Counts the given expenses of created transactions as in flight (a negative amount releases them) and refreshes the wallet balance."""
+        with self._chain_lock:
+            self._in_flight_expenses += amount
+            self._refresh_wallet_balance()
+
+    def load_wallet_keys(self):
+        """
+        Loads the key pair of the self wallet from the keystore, under an identity named after the port of the self node,
+        so that a restarted node keeps its keys, e.g. those that its stored chain refers to.
+        Without a keystore, the wallet generates a new key pair.
+        """
+        keystore = open_keystore()
+        if keystore is not None:
+            self.wallet.load_key_pair(keystore, f"node_{self.port}")
+
+    def load_chain(self):
+        """
+        Inits the self chain on top of the block store of the self node, loading the blocks stored by a previous run, if any.
+        If the store is empty, the bootstrap node creates the genesis block, while any other node waits for a chain synchronization.
+        Only the stored blocks above the last checkpoint of the store are validated again.
+        """
+        self.chain = Blockchain(self if self.is_bootstrap else None, store = open_block_store(self.port))
+        if not self.chain.is_valid():
+            print(f"The stored chain of node {self.id} is valid only up to block {self.chain.validated_height}.")
+        self.update_ledger()
 
     def share_chain(self, requesting_node):
-        """The self node posts its chain to the requesting_node's chain."""
-        response = make_post_request(requesting_node["ip"], requesting_node["port"], endpoint = "post_chain", data = pickle.dumps(self.chain))
+        """The self node asks the requesting_node to synchronize its chain with the self node's chain."""
+        response = make_post_request(requesting_node["ip"], requesting_node["port"], endpoint = "sync_chain", data = {"ip": self.ip, "port": self.port})
         return response.json()["message"]
 
+    def sync_chain(self, peer_ip, peer_port):
+        """
+        Brings the self chain up to date with the chain of the given peer, or switches to the chain of the peer if the two chains have forked.
+        The self node sends the block locator of its chain and receives, as one stream, only the blocks of the peer
+        that follow the most recent block that both chains share (the fork point):
+            - if the fork point is the tip of the self chain, the blocks are appended to the self chain one by one as they arrive,
+            so the memory of a sync stays flat however many blocks it brings,
+            - otherwise the chains have forked, so the blocks of the peer above the fork point are collected
+            and the self node reorganizes its chain onto them if the chain of the peer is preferred (see _reorganize()).
+        The stream is read without holding the chain lock, so the cost of a sync grows with the depth of the fork, not the length of the chain.
+        Every block is checked against the chain and the ledger before it enters the self chain, and the sync stops with ChainSyncError
+        at the first block that is rejected, keeping the blocks received before it.
+        Returns the number of received blocks that entered the self chain.
+        """
+        if self.chain is None:
+            self.load_chain()
+        self.update_ledger()
+
+        fork_blocks = None # the blocks of the peer above the fork point, once the chains turn out to have forked
+        received_blocks = 0
+        response = make_get_request(peer_ip, peer_port, endpoint = f"get_blocks?locator={','.join(self.chain.locator())}", stream = True)
+        with response:
+            if response.status_code != 200:
+                raise ChainSyncError(response.json()["message"])
+            for block in Blockchain.read_block_stream(response.raw):
+                if fork_blocks is None and received_blocks == 0 and block.index <= self.chain.tip()[0]:
+                    fork_blocks = []
+                if fork_blocks is None:
+                    self._append_checked_block(block)
+                    received_blocks += 1
+                else:
+                    fork_blocks.append(block)
+        if fork_blocks:
+            received_blocks += self._reorganize(fork_blocks)
+        self.update_ledger()
+        return received_blocks
+
+    def _append_checked_block(self, block):
+        """
+        Appends a block that extends the tip of the self chain and applies it to the ledger, once the chain and the ledger both accept it,
+        so that the chain never holds a block that the ledger has not applied. Removes the transactions of the block from the mempool.
+        Raises ChainSyncError, leaving the chain and the ledger as they were, if the block is rejected.
+        """
+        with self._chain_lock:
+            tip_height = self.chain.tip()[0]
+            if self.ledger.applied_height != tip_height:
+                raise ChainSyncError(f"The ledger of node {self.id} is at block {self.ledger.applied_height}, behind the chain at block {tip_height}.")
+            self.chain.check_blocks_after(tip_height, [block])
+            try:
+                self.ledger.apply_block(block)
+            except LedgerError as e:
+                raise ChainSyncError(f"Block {block.index} does not apply to the ledger: {e}")
+            self.chain.append_synced_blocks([block])
+            self.mempool.remove_included(block.transactions)
+
+    def _reorganize(self, blocks):
+        """
+        Switches the self chain to the given blocks of another chain, which follow the block of the self chain at height blocks[0].index - 1 (the fork point),
+        if the other chain is preferred (see Blockchain.is_preferred_to()). Only the blocks above the fork point are touched:
+            - the ledger rolls back the blocks of the self chain above the fork point from its undo records and applies the new blocks,
+            - the chain replaces its blocks above the fork point with the new blocks,
+            - the transactions of the abandoned blocks that the new blocks do not hold return to the mempool.
+        Raises ChainSyncError, leaving the chain and the ledger as they were, if the new blocks are invalid, do not apply to the ledger,
+        or the fork is deeper than the ledger can roll back.
+        Returns the number of new blocks that entered the self chain, 0 if the self chain is preferred.
+        """
+        fork_height = blocks[0].index - 1
+        with self._chain_lock:
+            if self.chain.is_preferred_to(blocks[-1].index, blocks[-1].hash):
+                return 0
+            self.chain.check_blocks_after(fork_height, blocks)
+
+            # Every new block is checked by the ledger, which must therefore stand at the tip of the self chain.
+            tip_height = self.chain.tip()[0]
+            if self.ledger.applied_height != tip_height:
+                raise ChainSyncError(f"The ledger of node {self.id} is at block {self.ledger.applied_height}, behind the chain at block {tip_height}.")
+            rolled_back = tip_height - fork_height
+            try:
+                self.ledger.rollback(rolled_back)
+            except LedgerError as e:
+                raise ChainSyncError(f"The fork at block {fork_height} is too deep: {e}")
+            try:
+                for block in blocks:
+                    self.ledger.apply_block(block)
+            except LedgerError as e:
+                # Put the ledger back onto the self chain.
+                self.ledger.rollback(self.ledger.applied_height - fork_height)
+                for height in range(fork_height + 1, tip_height + 1):
+                    self.ledger.apply_block(self.chain.blocks[height])
+                raise ChainSyncError(f"The blocks above the fork at block {fork_height} do not apply to the ledger: {e}")
+
+            removed = self.chain.replace_blocks_after(fork_height, blocks)
+            new_transactions = {transaction.hash for block in blocks for transaction in block.transactions}
+            for block in removed:
+                for transaction in block.transactions:
+                    if transaction.hash not in new_transactions:
+                        self.mempool.add(transaction)
+            for block in blocks:
+                self.mempool.remove_included(block.transactions)
+            self.update_ledger()
+            print(f"Node {self.id} switched from block {fork_height + len(removed)} to block {blocks[-1].index} of another chain, forked at block {fork_height}.")
+            return len(blocks)
+
     def create_transaction(self, recipient_id, recipient_public_key, bcc = None, message = None):
         """
         Creates a new transaction.
         The sender is the self node and the recipient is defined by the method's arguments.
         """
-        # Get recipient ip address and port for future requests.
-        recipient_ip = retrieve_from_ring_node(self.ring, recipient_id, "ip")
-        recipient_port = retrieve_from_ring_node(self.ring, recipient_id, "port")
-
-        # Calculate the total expenses of the transaction (before actually creating the transaction).
-        total_expenses = transaction_total_expenses(bcc, message)
-
-        # Check that the sender node has sufficient balance to make the transaction.
-        if self.wallet.balance < total_expenses:
-            raise InsufficientBalanceError(f"Transaction of {bcc} bcc and message: '{message}' from node {self.id} to node {recipient_id} declined due to insufficient sender balance.")
-
-        # Create the transaction.
-        trans = Transaction(self, recipient_id, recipient_public_key, bcc, message)
-        # Make the total expenses of the transaction transaction specific.
-        total_expenses = trans.total_expenses()
-
-        # Subtract the total costs of the transaction from the sender's wallet.
-        self.wallet.update_balance(-total_expenses)
-
-        # Sign the transaction.
-        trans.get_signature()
-
-        # If the transaction is validated across all nodes in the network,
-        # give the transaction its nonce,
-        # add the transaction to the sender's wallet,
-        # and broadcast the transaction to all the nodes in the network
-        # to add the new transaction to their current_block.
-        if self.broadcast_transaction_to_validate(trans):
-            trans.update_nonce()
-            self.wallet.transactions.append(trans)
-            # Send the transaction bcc to the recipient node.
-            if bcc > 0:
-                send_recipient_bcc = make_post_request(recipient_ip, recipient_port, endpoint = "update_balance", data = {"amount": bcc})
-                print(send_recipient_bcc.json()["message"])
-            self.broadcast_transaction_to_block
-        else:
-        # If the transaction fails to validate,
-        # return the total costs of the transaction back to the sender's wallet,
-        # delete the created transaction,
-        # and raise a validation error.
-            self.wallet.update_balance(total_expenses)
-            del trans
-            raise TransactionValidationError("Τransaction of {bcc} bcc and message: '{message}' from node {self.id} to node {recipient_id} failed to validate across the nodes in the network.")
+        # The transactions of the self node are created one at a time, since each one takes the next nonce of the sender's wallet
+        # and the balance check must see the expenses of the previous ones.
+        with self._sender_lock:
+            # Calculate the total expenses of the transaction (before actually creating the transaction).
+            total_expenses = transaction_total_expenses(bcc, message)
+
+            # Check that the sender node has sufficient balance to make the transaction.
+            if self.wallet.balance < total_expenses:
+                raise InsufficientBalanceError(f"Transaction of {bcc} bcc and message: '{message}' from node {self.id} to node {recipient_id} declined due to insufficient sender balance.")
+
+            # Create the transaction with the next nonce of the sender's wallet.
+            # The nonce is consumed only if the transaction is validated.
+            trans = Transaction(self, recipient_id, recipient_public_key, bcc, message, nonce = self.wallet.last_nonce + 1)
+            # Make the total expenses of the transaction transaction specific.
+            total_expenses = trans.total_expenses()
+
+            # Subtract the total costs of the transaction from the sender's wallet while the network validates it.
+            self._reserve_expenses(total_expenses)
+
+            # Sign the transaction.
+            trans.get_signature()
+
+            # If the transaction is validated across all nodes in the network,
+            # consume its nonce,
+            # add the transaction to the sender's wallet,
+            # and broadcast the transaction to all the nodes in the network
+            # to add the new transaction to their mempool, from which the next blocks are packed.
+            # The coins reach the recipient once the transaction enters a block and the block is applied to the ledgers.
+            # Either way, the costs of the transaction stop being in flight: from then on, they are pending in the mempool or returned.
+            if self.broadcast_transaction_to_validate(trans):
+                self.wallet.get_next_nonce()
+                self.wallet.transactions.append(trans)
+                self.broadcast_transaction_to_block(trans)
+                self._reserve_expenses(-total_expenses)
+            else:
+            # If the transaction fails to validate,
+            # return the total costs of the transaction back to the sender's wallet,
+            # delete the created transaction,
+            # and raise a validation error.
+                self._reserve_expenses(-total_expenses)
+                del trans
+                raise TransactionValidationError(f"Transaction of {bcc} bcc and message: '{message}' from node {self.id} to node {recipient_id} failed to validate across the nodes in the network.")
+
+    def create_transactions(self, transaction_inputs, all_or_nothing = True):
+        """
+        Creates a batch of new transactions from the self node, given as a list of (recipient_id, recipient_public_key, bcc, message) tuples.
+        The transactions are signed together and sent for validation to every node in a single request per node.
+        Since the nonces of the self node must not have gaps, a transaction can only succeed if all the previous transactions of the batch succeed:
+            - with all_or_nothing = True, the batch succeeds only if every transaction is validated by every node, else no transaction is made,
+            - with all_or_nothing = False, the transactions up to the first one that fails are made.
+        Returns a list with one (True or False, description, transaction hash) tuple per transaction, in order.
+        """
+        # As for create_transaction(), the batches of the self node are created one at a time.
+        with self._sender_lock:
+            # Create the transactions with consecutive nonces, as long as the balance of the sender's wallet covers them.
+            transactions = []
+            total_expenses = 0
+            results = [None] * len(transaction_inputs)
+            for position, (recipient_id, recipient_public_key, bcc, message) in enumerate(transaction_inputs):
+                if self.wallet.balance - total_expenses < transaction_total_expenses(bcc, message):
+                    results[position] = (False, f"Transaction of {bcc} bcc and message: '{message}' from node {self.id} to node {recipient_id} declined due to insufficient sender balance.", None)
+                    break
+                trans = Transaction(self, recipient_id, recipient_public_key, bcc, message, nonce = self.wallet.last_nonce + len(transactions) + 1)
+                trans.get_signature()
+                transactions.append(trans)
+                total_expenses += trans.total_expenses()
+            if all_or_nothing and len(transactions) < len(transaction_inputs):
+                transactions = []
+
+            # Subtract the total costs of the transactions from the sender's wallet until the network has validated them.
+            in_flight_expenses = sum(trans.total_expenses() for trans in transactions)
+            self._reserve_expenses(in_flight_expenses)
+
+            # Validate the whole batch across the network and keep the transactions up to the first one that fails.
+            validated = self.broadcast_transactions_to_validate(transactions) if transactions else []
+            accepted = next((position for position, (result, _) in enumerate(validated) if not result), len(validated))
+            if all_or_nothing and accepted < len(transaction_inputs):
+                accepted = 0
+
+            # Consume the nonces of the accepted transactions, add them to the sender's wallet
+            # and send them to the mempools of all the nodes in a single request per node.
+            # Then the costs of the batch stop being in flight: the accepted transactions are pending in the mempool and the rest are returned.
+            for trans in transactions[:accepted]:
+                self.wallet.get_next_nonce()
+                self.wallet.transactions.append(trans)
+            if accepted:
+                self.broadcast_transactions_to_block(transactions[:accepted])
+            self._reserve_expenses(-in_flight_expenses)
+
+            for position in range(len(transaction_inputs)):
+                if position < accepted:
+                    results[position] = (True, "Transaction successful.", transactions[position].hash)
+                elif position < len(validated) and not validated[position][0]:
+                    results[position] = (False, f"Transaction failed to validate across the nodes in the network: {validated[position][1]}", transactions[position].hash)
+                elif results[position] is None:
+                    results[position] = (False, "Transaction not made, since another transaction of the batch failed.", None)
+            return results
+
+    def broadcast_transactions_to_validate(self, transactions):
+        """
+        Asks all the nodes in the network to validate a batch of transactions, through the relay tree rooted at the self node,
+        so that the self node sends the batch to at most config.RELAY_FANOUT nodes, whatever the size of the network.
+        Returns a list with one (True or False, description) tuple per transaction, in order.
+        A transaction is validated only if every node validates it; a node that fails to answer validates none of them.
+        """
+        return self.relay_validate_transactions(transactions, self.id)
+
+    def relay_validate_transactions(self, transactions, root_id, deadline = None):
+        """
+        Validates a batch of transactions on behalf of the self node and of its subtree in the relay tree of the node root_id:
+        the self node validates the batch itself and relays it to its children, each of which answers for its own subtree.
+        The children must answer within {deadline} seconds (config.BROADCAST_DEADLINE at the root),
+        and each of them gets config.RELAY_DEADLINE_FACTOR of that time for its own children,
+        so that a subtree always answers before its parent gives up on it.
+        Returns a list with one (True or False, description) tuple per transaction, in order.
+        """
+        own_results = self.validate_transactions(transactions)
+        validated = [(result, description if result else f"Node {self.id}: {description}") for result, description in own_results]
+        children = relay_children(self.ring, root_id, self.id)
+        if not children:
+            return validated
+
+        deadline = config.BROADCAST_DEADLINE if deadline is None else deadline
+        endpoint = f"validate_transactions?relay_root={root_id}&deadline={deadline * config.RELAY_DEADLINE_FACTOR:.3f}"
+        result = broadcast_engine.broadcast(children, endpoint = endpoint, data = Transaction.batch_to_bytes(transactions), deadline = deadline, stop_on_rejection = False)
+        for peer_result in result.results:
+            peer_validated = peer_result.data.get("results") if isinstance(peer_result.data, dict) else None
+            if peer_validated is None or len(peer_validated) != len(transactions):
+                print(f"Batch validation by node {peer_result.node_id}: {peer_result.outcome} after {peer_result.elapsed:.3f}s. {peer_result.message or ''}")
+                peer_validated = [{"result": False, "message": f"No answer from node {peer_result.node_id} and the nodes it relays to."}] * len(transactions)
+            for position, peer_transaction_result in enumerate(peer_validated):
+                if validated[position][0] and not peer_transaction_result["result"]:
+                    validated[position] = (False, peer_transaction_result["message"])
+        # The transactions that the subtree rejected never reach the mempool, so their nonces must not let the next ones validate.
+        self._release_validated_nonces([transaction for transaction, (own_result, _), (result, _) in zip(transactions, own_results, validated) if own_result and not result])
+        return validated
 
     def broadcast_transaction_to_validate(self, transaction):
         """
@@ -68,50 +376,331 @@ class Node:
         Returns True if all nodes validate the transaction,
         else returns False.
         """
-        # To broadcast the transaction to all the nodes in the network at the same time,
-        # we will create a distinct thread for every node in the network.
-        def thread_function(ring_node, responses):
-            validation_response = make_post_request(ring_node["ip"], ring_node["port"], endpoint = "validate_transaction", data = pickle.dumps(transaction))
-            responses.append(validation_response)
-
-        threads = [] # list to hold the threads
-        responses = [] # list to store the responses from the /validate_transaction requests
+        # The transaction travels through the relay tree as a batch of one.
+        validation_result, validation_description = self.broadcast_transactions_to_validate([transaction])[0]
 
-        for ring_node in self.ring:
-            # if ring_node["id"] != self.id: # exclude the sender node of the transaction
-            thread = threading.Thread(target = thread_function, args = (ring_node, responses))
-            threads.append(thread)
-            thread.start()
+        # Report the node that did not accept the transaction.
+        if not validation_result:
+            print(f"Transaction validation failed: {validation_description}")
 
-        # Wait for all the generated subthreads to complete.
-        # It is very important to collect the responses from all the nodes before proceeding.
-        for thread in threads:
-            thread.join()
-
-        # If any node rejects the transaction, return False.
-        for response in responses:
-            if response.status_code < 200 or response.status_code >= 300:
-                return False
-
-        # At this point all nodes have validated the transaction.
-        # Return True.
-        return True
+        return validation_result
 
     def validate_transaction(self, transaction):
         """
         Validates an incoming transaction on behalf of the self node:
             - verify the signature of the transaction,
-            - check whether the sender node has sufficient balance to make the transaction.
+            - check the transaction against the ledger of the self node: valid amount, known accounts, next nonce and sufficient balance of the sender.
         """
         # Recalculate the hash of the transaction
         # and verify the signature of the transaction against this hash.
         # This ensures that the signature corresponds to the specific transaction data and hasn't been tampered with.
-        recalculated_hash = calculate_hash(transaction.to_dict())
+        recalculated_hash = transaction.get_hash()
         if not transaction.verify_signature(recalculated_hash):
         # if not self.wallet.verify_signature(recalculated_hash, transaction.signature, transaction.sender.public_key):
             return False, "Invalid signature."
 
-        if transaction.sender.wallet.balance < 0: # the total expenses of the transaction have already been subtracted from the sender's balance in the create_transaction() method
-            return False, "Insufficient balance."
+        # The balance and the nonce of the sender come from the ledger of the self node,
+        # never from data sent along with the transaction.
+        # The expenses of the sender's transactions that are still in the mempool are already committed.
+        # The signature is verified outside the chain lock, so that concurrent validations only serialize on the ledger check.
+        with self._chain_lock:
+            ledger_result, ledger_description = self._check_transaction(transaction, self.mempool.pending_expenses(transaction.sender_public_key))
+        if not ledger_result:
+            return False, ledger_description
 
         return True, "Transaction validation successful."
+
+    def validate_transactions(self, transactions):
+        """
+        Validates a batch of incoming transactions on behalf of the self node, in order, as validate_transaction() does.
+        The expenses of the earlier transactions of the batch count as pending expenses of their senders.
+        Since the transactions of a sender cannot skip a nonce, the transactions after the first invalid one are not validated.
+        Returns a list with one (True or False, description) tuple per transaction.
+        """
+        results = []
+        batch_expenses = {} # sender public key --> total expenses of its earlier transactions in the batch
+        for transaction in transactions:
+            if results and not results[-1][0]:
+                results.append((False, "Not validated, since a previous transaction of the batch is invalid."))
+                continue
+            if not transaction.verify_signature(transaction.get_hash()):
+                results.append((False, "Invalid signature."))
+                continue
+            with self._chain_lock:
+                pending_expenses = self.mempool.pending_expenses(transaction.sender_public_key) + batch_expenses.get(transaction.sender_public_key, 0)
+                results.append(self._check_transaction(transaction, pending_expenses))
+            batch_expenses[transaction.sender_public_key] = batch_expenses.get(transaction.sender_public_key, 0) + transaction.total_expenses()
+        return results
+
+    def _check_transaction(self, transaction, pending_expenses):
+        """
+        Checks a transaction against the ledger of the self node, with the given expenses of the sender that are not in a block yet.
+        The nonce must follow the last transaction of the sender in the mempool, with no gap,
+        or the last one that the self node has validated, which may not have reached the mempool yet, since the relays run in the background.
+        A validated nonce is only recorded tentatively, since the other nodes may still reject the transaction:
+        it is released as soon as the self node learns of the rejection, and otherwise counts for config.VALIDATED_NONCE_TIMEOUT seconds.
+        Returns (True, description) or (False, reason).
+        """
+        with self._chain_lock:
+            public_key = transaction.sender_public_key
+            next_nonce = self.mempool.next_nonce(self.ledger, public_key)
+            validated_nonce = self._validated_nonce(public_key)
+            last_nonce = max(next_nonce, validated_nonce + 1)
+            result, description = self.ledger.check_transaction(transaction, pending_expenses, next_nonce, last_nonce)
+            if result:
+                self._validated_nonces[public_key] = (max(validated_nonce, transaction.nonce), time.monotonic() + config.VALIDATED_NONCE_TIMEOUT)
+            return result, description
+
+    def _validated_nonce(self, public_key):
+        """Returns the highest nonce of the sender that the self node has validated and that may still reach the mempool, or 0 if none."""
+        nonce, valid_until = self._validated_nonces.get(public_key, (0, 0))
+        if valid_until <= time.monotonic():
+            self._validated_nonces.pop(public_key, None)
+            return 0
+        return nonce
+
+    def _release_validated_nonces(self, transactions):
+        """Forgets that the self node validated the given transactions, which the network rejected, and the later nonces of their senders."""
+        if not transactions:
+            return
+        with self._chain_lock:
+            for transaction in transactions:
+                nonce, valid_until = self._validated_nonces.get(transaction.sender_public_key, (0, 0))
+                if nonce >= transaction.nonce:
+                    self._validated_nonces[transaction.sender_public_key] = (transaction.nonce - 1, valid_until)
+
+# ======================================================================================================================================================
+# Mempool and Block Production
+# ======================================================================================================================================================
+
+    def broadcast_transaction_to_block(self, transaction):
+        """
+        Broadcasts the validated transaction to all the nodes in the network,
+        so that they add it to their mempool and eventually to a block.
+        """
+        self.broadcast_transactions_to_block([transaction])
+
+    def broadcast_transactions_to_block(self, transactions):
+        """
+        Broadcasts a batch of validated transactions to all the nodes in the network through the relay tree rooted at the self node,
+        so that they add them to their mempool and eventually to a block.
+        """
+        self.relay_transactions(transactions, self.id)
+
+    def relay_transactions(self, transactions, root_id):
+        """
+        Adds a batch of validated transactions to the mempool of the self node, as receive_transactions() does,
+        and relays the accepted ones to the children of the self node in the relay tree of the node root_id, in the background,
+        so that the request is answered without waiting for the subtree.
+        A transaction is marked as seen only once it is accepted, so a transaction that failed may arrive and be relayed again;
+        the transactions that have been seen are neither added nor relayed again.
+        Returns a list with one (True or False, description) tuple per transaction.
+        """
+        new_transactions = [transaction for transaction in transactions if transaction.hash not in self.seen]
+        new_results = dict(zip((transaction.hash for transaction in new_transactions), self.receive_transactions(new_transactions) if new_transactions else []))
+        accepted = [transaction for transaction in new_transactions if new_results[transaction.hash][0] and self.seen.add(transaction.hash)]
+        if accepted:
+            self._in_background(self._relay_transactions_to_children, accepted, root_id)
+        return [new_results.get(transaction.hash, (True, "Transaction already received.")) for transaction in transactions]
+
+    def _relay_transactions_to_children(self, transactions, root_id):
+        """Sends a batch of transactions to the children of the self node in the relay tree of the node root_id."""
+        children = relay_children(self.ring, root_id, self.id)
+        if not children:
+            return
+        result = broadcast_engine.broadcast(children, endpoint = f"receive_transactions?relay_root={root_id}", data = Transaction.batch_to_bytes(transactions), stop_on_rejection = False)
+        for peer_result in result.rejections():
+            print(f"Batch of {len(transactions)} transactions not added to the mempool of node {peer_result.node_id}: {peer_result.outcome}. {peer_result.message or ''}")
+
+    def _in_background(self, function, *args):
+        """
+        Runs the function on the background thread of the self node, after the functions scheduled before it.
+        The relays and the block seals run there, so that no request handler waits for other nodes to receive a message.
+        """
+        def run():
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Background {function.__name__} of node {self.id} failed: {e}")
+        self._background.submit(run)
+
+    def receive_transaction(self, transaction):
+        """
+        Adds a transaction, validated by the whole network, to the mempool of the self node
+        and, in the background, seals a new block if the self node is the validator of the next block and enough transactions are ready.
+        Returns (True, description) or (False, reason).
+        """
+        result, description = self._add_to_mempool(transaction)
+        if result:
+            self._in_background(self.seal_block_if_ready)
+        return result, description
+
+    def receive_transactions(self, transactions):
+        """
+        Adds a batch of transactions, validated by the whole network, to the mempool of the self node, as receive_transaction() does,
+        and seals a new block in the background once the whole batch is in the mempool.
+        Returns a list with one (True or False, description) tuple per transaction.
+        """
+        results = [self._add_to_mempool(transaction) for transaction in transactions]
+        if any(result for result, _ in results):
+            self._in_background(self.seal_block_if_ready)
+        return results
+
+    def _add_to_mempool(self, transaction):
+        """
+        Adds a transaction, validated by the whole network, to the mempool of the self node,
+        once its signature is verified and the ledger accepts it after the transactions of its sender that are already in the mempool.
+        Returns (True, description) or (False, reason).
+        """
+        if not transaction.verify_signature(transaction.get_hash()):
+            return False, "Invalid signature."
+        with self._chain_lock:
+            public_key = transaction.sender_public_key
+            # The transaction may have entered a block before it reached the self node.
+            if isinstance(transaction.nonce, int) and transaction.nonce < self.ledger.next_nonce(public_key):
+                return True, "Transaction already in a block."
+            result, description = self.ledger.check_transaction(transaction, self.mempool.pending_expenses(public_key), self.mempool.next_nonce(self.ledger, public_key))
+            if not result:
+                return result, description
+            result, description = self.mempool.add(transaction)
+            if result:
+                self._refresh_wallet_balance()
+        return result, description
+
+    def next_validator_id(self):
+        """
+        Returns the id of the node that builds the next block, elected by the stake lottery of the ledger
+        with the hash of the last block as its seed, so every node reaches the same choice without extra messages.
+        """
+        with self._chain_lock:
+            next_height = len(self.chain.blocks)
+            return self.ledger.elected_validator(next_height, self.chain.blocks[-1].hash)
+
+    def seal_block_if_ready(self):
+        """
+        If the self node is the validator of the next block and the mempool holds a full block of ready transactions,
+        packs them by fee priority into a new block, adds it to the self chain and relays it to the other nodes in the background.
+        Returns the new block, or None.
+        """
+        with self._chain_lock:
+            if self.chain is None or not self.ring or self.next_validator_id() != self.id:
+                return None
+            transactions = self.mempool.pack(self.ledger, config.block_capacity)
+            if len(transactions) < config.block_capacity:
+                return None
+
+            block = Block(validator = self)
+            for transaction in transactions:
+                block.add_transaction(transaction)
+            block.update_index(self.chain.blocks[-1])
+            block.update_previous_hash(self.chain.blocks[-1])
+            block.get_new_hash()
+            ledger_result, ledger_description = self.ledger.check_block(block)
+            if ledger_result:
+                self.chain.add_block(block)
+                if block.index is None: # add_block() resets the index of a block that fails to validate
+                    ledger_result, ledger_description = False, "Invalid block."
+            if not ledger_result:
+                print(f"Node {self.id} failed to seal a block: {ledger_description}")
+                # Drop the transactions that made the block fail, so that they are not packed again, and try again without them.
+                if self._discard_invalid_transactions(transactions):
+                    self._in_background(self.seal_block_if_ready)
+                return None
+            self.mempool.remove_included(block.transactions)
+            self.update_ledger()
+
+        # The block reaches the other nodes through the relay tree rooted at the self node, its validator.
+        self.seen.add(block.hash)
+        self._in_background(self._relay_block_to_children, block)
+        # The lottery may elect the self node again for the next block.
+        self._in_background(self.seal_block_if_ready)
+        return block
+
+    def _discard_invalid_transactions(self, transactions):
+        """
+        Removes from the mempool the given transactions whose signature is invalid or that the ledger rejects, in their order,
+        together with the later transactions of their senders, which can no longer follow them. Returns the number of removed transactions.
+        """
+        with self._chain_lock:
+            invalid = []
+            pending_expenses = {} # sender public key --> total expenses of its earlier valid transactions
+            next_nonces = {} # sender public key --> nonce that its next transaction must carry
+            for transaction in transactions:
+                public_key = transaction.sender_public_key
+                if any(invalid_transaction.sender_public_key == public_key for invalid_transaction in invalid):
+                    continue # mempool.discard() removes the later transactions of the sender of an invalid transaction
+                next_nonce = next_nonces.get(public_key, self.ledger.next_nonce(public_key))
+                if transaction.verify_signature(transaction.get_hash()) and self.ledger.check_transaction(transaction, pending_expenses.get(public_key, 0), next_nonce)[0]:
+                    pending_expenses[public_key] = pending_expenses.get(public_key, 0) + transaction.total_expenses()
+                    next_nonces[public_key] = transaction.nonce + 1
+                else:
+                    invalid.append(transaction)
+            self.mempool.discard(invalid)
+            self._refresh_wallet_balance()
+            return len(invalid)
+
+    def _relay_block_to_children(self, block):
+        """Sends a block to the children of the self node in the relay tree rooted at the validator of the block."""
+        children = relay_children(self.ring, block.validator_id, self.id)
+        if not children:
+            return
+        result = broadcast_engine.broadcast(children, endpoint = f"receive_block?relay_root={block.validator_id}", data = block.to_bytes(), stop_on_rejection = False)
+        for peer_result in result.rejections():
+            print(f"Block {block.index} not accepted by node {peer_result.node_id} and the nodes it relays to: {peer_result.outcome}. {peer_result.message or ''}")
+
+    def relay_block(self, block):
+        """
+        Adds a block sealed by another node to the self chain, as receive_block() does,
+        and relays it in the background to the children of the self node in the relay tree rooted at the validator of the block.
+        The block is relayed only once it is in the self chain, so that an invalid block goes no further,
+        and it is marked as seen only then, so that a block that failed may arrive and be relayed again.
+        Returns (True, description) or (False, reason).
+        """
+        if block.hash in self.seen:
+            return True, f"Block {block.index} already received."
+        result, description = self.receive_block(block, seal_next = False)
+        if result and self.seen.add(block.hash):
+            self._in_background(self._relay_block_to_children, block)
+        if result:
+            # The next block may be the self node's turn, once the subtree has the current one.
+            self._in_background(self.seal_block_if_ready)
+        return result, description
+
+    def receive_block(self, block, seal_next = True):
+        """
+        Adds a block sealed by another node to the self chain, applies it to the ledger and removes its transactions from the mempool.
+        If the block is ahead of the self chain or on a fork of it, the chain is synchronized from its validator instead,
+        which switches to the chain of the validator if it is preferred, without holding the chain lock while the blocks are fetched.
+        Returns (True, description) or (False, reason).
+        """
+        with self._chain_lock:
+            tip_height, tip_hash = self.chain.tip()
+            if block.index <= tip_height and self.chain.blocks[block.index].hash == block.hash:
+                return True, f"Block {block.index} already in the chain."
+            extends_tip = block.index == tip_height + 1 and block.previous_hash == tip_hash
+            if extends_tip:
+                if block.validator_id != self.next_validator_id():
+                    return False, f"Node {block.validator_id} is not the validator of block {block.index}."
+                try:
+                    self._append_checked_block(block)
+                except ChainSyncError as e:
+                    return False, f"{e}"
+                self.update_ledger()
+            validator = next((ring_node for ring_node in self.ring if ring_node["id"] == block.validator_id), None)
+
+        # The block is ahead of the self chain or on a fork of it: the chain of its validator decides which chain the self node keeps.
+        if not extends_tip:
+            if validator is None:
+                return False, f"Unknown validator of block {block.index}."
+            try:
+                self.sync_chain(validator["ip"], validator["port"])
+            except (ChainSyncError, WireFormatError) as e:
+                return False, f"{e}"
+            if self.chain.fork_point([block.hash]) is None:
+                return False, f"Block {block.index} is on a fork that is not preferred to the chain."
+            return True, f"Chain synchronized up to block {self.chain.tip()[0]}."
+
+        # The next block may be the self node's turn.
+        if seal_next:
+            self._in_background(self.seal_block_if_ready)
+        return True, f"Block {block.index} added to the chain."
@@ -1,6 +1,14 @@
-from libraries.functions_library import calculate_hash, transaction_total_expenses
+from libraries.functions_library import calculate_digest, key_fingerprint, transaction_total_expenses, transaction_fee
+from libraries.wire_format import WireWriter, WireReader, TRANSACTION_MAGIC, TRANSACTION_BATCH_MAGIC, TRANSACTION_HASH_MAGIC
+from libraries.custom_exceptions import WireFormatError
+from libraries.crypto_engine import crypto_engine, verified_signatures
+from libraries.metrics import timed, HASH_LATENCY, SERIALIZATION_LATENCY
 from time import time
-import rsa
+
+# The type of the transaction as a single byte on the wire.
+TRANSACTION_TYPES = ["coins", "message"]
+# The attributes that the hash of the transaction covers. Changing any of them drops the memoised hash.
+HASHED_FIELDS = frozenset(["sender_public_key", "recipient_public_key", "type", "bcc", "message", "timestamp", "nonce"])
 
 class Transaction:
     """
@@ -8,8 +16,10 @@ class Transaction:
 
     Attributes:
         hash (str): the hash of the transaction.
-        sender (Node object): the sender node object.
-        nonce (int): the nonce of the transaction - number used only once - comes from the wallet of the sender node.
+        sender (Node object): the sender node object. It is None for a transaction received from another node.
+        sender_id (int): the id of the sender node.
+        sender_public_key (str): the public key of the sender node.
+        nonce (int): the nonce of the transaction - number used only once - comes from the wallet of the sender node. It is signed along with the transaction, so that the transaction cannot be replayed.
         recipient_id (int): the id of the recipient node.
         recipient_public_key (str): the public key of the recipient node.
         bcc (int): the amount of coins to transfer.
@@ -19,13 +29,15 @@ class Transaction:
         timestamp (float): the timestamp when the transaction was created.
     """
 
-    def __init__(self, sender, recipient_id, recipient_public_key, bcc = None, message = None):
+    def __init__(self, sender, recipient_id, recipient_public_key, bcc = None, message = None, nonce = None):
         """Initiates a transaction."""
         self.sender = sender # sender node
-        self.nonce = None
+        self.sender_id = sender.id
+        self.sender_public_key = sender.wallet.public_key
+        self.nonce = nonce
         self.recipient_id = recipient_id
         self.recipient_public_key = recipient_public_key
-        self.bcc = bcc
+        self.bcc = 0 if bcc is None else bcc # a message-only transaction transfers 0 bcc, so the amount is never absent on the wire
         self.message = message
         if self.bcc:
             self.type = "coins"
@@ -41,22 +53,52 @@ class Transaction:
         """Returns a string representation of the transaction."""
         return str(self.__class__) + ": " + str(self.__dict__)
 
+    def __setattr__(self, name, value):
+        """Sets an attribute and drops the memoised hash if the attribute is hashed."""
+        if name in HASHED_FIELDS:
+            self.__dict__.pop("_digest", None)
+        object.__setattr__(self, name, value)
+
     def to_dict(self):
-        """Converts the self transaction object to dict for the get_hash() function."""
+        """Converts the self transaction object to dict."""
         # We don't calculate the hash using the entire transaction object.
         # We merely include the attributes that uniquely identify the transaction and are not expected to change once the transaction is created.
         return {
-            "sender_public_key": self.sender.wallet.public_key,
+            "sender_public_key": self.sender_public_key,
             "recipient_public_key": self.recipient_public_key,
             "type": self.type,
             "bcc": self.bcc,
             "message": self.message,
             "timestamp": self.timestamp,
+            "nonce": self.nonce
         }
 
+    def hashed_bytes(self):
+        """
+        Returns the canonical binary encoding of the hashed attributes of the transaction, in a fixed order.
+        The public keys are represented by their fingerprints, so the hashed data does not grow with the size of the keys.
+        """
+        writer = WireWriter(TRANSACTION_HASH_MAGIC)
+        writer.raw(key_fingerprint(self.sender_public_key))
+        writer.raw(key_fingerprint(self.recipient_public_key))
+        writer.uint8(TRANSACTION_TYPES.index(self.type))
+        writer.int64(self.bcc)
+        writer.string(self.message)
+        writer.float64(self.timestamp)
+        writer.int64(self.nonce)
+        return writer.to_bytes()
+
     def get_hash(self):
-        """Calculates the hash of the transaction."""
-        return calculate_hash(self.to_dict())
+        """
+        Calculates the hash of the transaction from its hashed attributes.
+        The hash is memoised and only calculated again after a hashed attribute changes.
+        """
+        digest = self.__dict__.get("_digest")
+        if digest is None:
+            with HASH_LATENCY.time(object = "transaction"):
+                digest = calculate_digest(self.hashed_bytes())
+            self.__dict__["_digest"] = digest
+        return digest
 
     def get_signature(self):
         """Signs the hash of the self transaction using the private key of the sender node (the private key of the wallet of the sender node)."""
@@ -64,22 +106,90 @@ class Transaction:
             self.signature = self.sender.wallet.sign_data(self.hash)
 
     def verify_signature(self, data):
-        """Verifies the signature of the transaction."""
-        try:
-            rsa.verify(data.encode(), self.signature, rsa.PublicKey.load_pkcs1(self.sender.wallet.public_key))
-            return True
-        except rsa.VerificationError:
-            return False
-
-    def update_nonce(self):
         """
-        Updates the nonce of the transaction.
-        It is called once the transaction is validated by all the nodes in the network
-        and the transaction is ready to be added to the sender's wallet.
+        Verifies the signature of the transaction against the given data, the recalculated hash of the transaction.
+        A signature that the current node has already verified against the same hash is not verified again.
         """
-        if self.nonce is None:
-            self.nonce = self.sender.wallet.get_next_nonce()
+        if verified_signatures.is_verified(data, self.signature):
+            return True
+        # The crypto engine keeps the public keys of the senders parsed, so the PEM is not parsed on every verification.
+        is_verified = crypto_engine.verify(data, self.signature, self.sender_public_key)
+        if is_verified:
+            verified_signatures.add(data, self.signature)
+        return is_verified
 
     def total_expenses(self):
         """Returns the total expenses of the transaction."""
         return transaction_total_expenses(self.bcc, self.message)
+
+    def fee(self):
+        """Returns the fee of the transaction, which the validator of its block collects."""
+        return transaction_fee(self.bcc, self.message)
+
+    @timed(SERIALIZATION_LATENCY, object = "transaction", operation = "encode")
+    def to_bytes(self):
+        """
+        Encodes the self transaction in the wire format that is sent to the other nodes.
+        Only the id and the public key of the sender travel with the transaction, not the whole sender node.
+        """
+        writer = WireWriter(TRANSACTION_MAGIC)
+        writer.int64(self.sender_id)
+        writer.string(self.sender_public_key)
+        writer.int64(self.recipient_id)
+        writer.string(self.recipient_public_key)
+        writer.uint8(TRANSACTION_TYPES.index(self.type))
+        writer.int64(self.bcc)
+        writer.string(self.message)
+        writer.float64(self.timestamp)
+        writer.int64(self.nonce)
+        writer.bytes(self.signature)
+        return writer.to_bytes()
+
+    @classmethod
+    @timed(SERIALIZATION_LATENCY, object = "transaction", operation = "decode")
+    def from_bytes(cls, data):
+        """
+        Decodes a transaction received from another node.
+        The hash is recalculated from the decoded fields, and the sender of the decoded transaction is None.
+        """
+        reader = WireReader(data, TRANSACTION_MAGIC)
+        transaction = cls.__new__(cls)
+        transaction.sender = None
+        transaction.sender_id = reader.int64()
+        transaction.sender_public_key = reader.string()
+        transaction.recipient_id = reader.int64()
+        transaction.recipient_public_key = reader.string()
+        type_index = reader.uint8()
+        if type_index >= len(TRANSACTION_TYPES):
+            raise WireFormatError(f"Unknown transaction type {type_index}.")
+        transaction.type = TRANSACTION_TYPES[type_index]
+        transaction.bcc = reader.int64()
+        transaction.message = reader.string()
+        transaction.timestamp = reader.float64()
+        transaction.nonce = reader.int64()
+        transaction.signature = reader.bytes()
+        reader.finish()
+        for field in ("sender_id", "sender_public_key", "recipient_id", "recipient_public_key", "bcc", "timestamp", "nonce", "signature"):
+            if getattr(transaction, field) is None:
+                raise WireFormatError(f"Missing transaction field {field}.")
+        transaction.hash = transaction.get_hash()
+        return transaction
+
+    @staticmethod
+    @timed(SERIALIZATION_LATENCY, object = "transaction_batch", operation = "encode")
+    def batch_to_bytes(transactions):
+        """Encodes a batch of transactions in the wire format, so that the whole batch travels in a single request."""
+        writer = WireWriter(TRANSACTION_BATCH_MAGIC)
+        writer.uint32(len(transactions))
+        for transaction in transactions:
+            writer.bytes(transaction.to_bytes())
+        return writer.to_bytes()
+
+    @classmethod
+    @timed(SERIALIZATION_LATENCY, object = "transaction_batch", operation = "decode")
+    def batch_from_bytes(cls, data):
+        """Decodes a batch of transactions made by batch_to_bytes() and returns the list of its transactions, in order."""
+        reader = WireReader(data, TRANSACTION_BATCH_MAGIC)
+        transactions = [cls.from_bytes(reader.nested()) for _ in range(reader.uint32())]
+        reader.finish()
+        return transactions
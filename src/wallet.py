@@ -1,5 +1,7 @@
-import rsa
+import threading
+from keystore import generate_key_pair
 from libraries.custom_exceptions import InsufficientBalanceError
+from libraries.crypto_engine import crypto_engine
 
 class Wallet:
     """
@@ -9,16 +11,21 @@ class Wallet:
         public_key (str): the public key of the wallet (also serves as the address of the wallet).
         private_key (str): the private key of the wallet.
         last_nonce (int): a counter that maintains the total number of the distinct transactions that the wallet has created as a sender.
-        balance (int): the total balance of the wallet.
+        balance (int): the total balance of the wallet, in cents of BCC.
         transactions (list): the transactions of the wallet.
     """
 
-    def __init__(self, initial_balance = 0):
-        """Inits a wallet."""
-        self._public_key, self._private_key = self.generate_key_pair()
+    def __init__(self, initial_balance = 0, key_pair = None):
+        """
+        Inits a wallet with the given (public key, private key) key pair.
+        Without a key pair, the wallet generates one the first time a key is needed,
+        unless the node loads its key pair from the keystore first, so creating a wallet costs nothing.
+        """
+        self._key_pair = key_pair
         self.last_nonce = 0
         self.balance = initial_balance
         self.transactions = []
+        self._lock = threading.RLock() # makes the lazy key generation, the nonce counter and the balance updates atomic
 
     def __str__(self):
         """Returns a string representation of the wallet."""
@@ -27,19 +34,35 @@ class Wallet:
     @property
     def public_key(self):
         """So that the public key of the wallet does not change externally."""
-        return self._public_key
+        return self._get_key_pair()[0]
 
     @property
     def private_key(self):
         """So that the private key of the wallet does not change externally."""
-        return self._private_key
+        return self._get_key_pair()[1]
+
+    def _get_key_pair(self):
+        """Returns the key pair of the wallet, generating it on first use if the wallet has none."""
+        with self._lock:
+            if self._key_pair is None:
+                self._key_pair = self.generate_key_pair()
+            return self._key_pair
+
+    def load_key_pair(self, keystore, name):
+        """
+        Loads the key pair of the wallet from the given keystore, under the given identity name,
+        so that the node keeps the same keys across restarts. A new identity is created in the keystore if needed.
+        """
+        with self._lock:
+            self._key_pair = keystore.load_or_create(name)
 
     def get_next_nonce(self):
         """Returns the nonce to every new transaction created by the self sender wallet."""
-        # Called by class transaction to update sender_node.wallet.transaction.nonce
-        # every time the self sender wallet creates a new transaction.
-        self.last_nonce += 1
-        return self.last_nonce
+        # Called by Node.create_transaction() to consume the nonce of a new transaction
+        # once the transaction is validated by all the nodes in the network.
+        with self._lock:
+            self.last_nonce += 1
+            return self.last_nonce
 
     def update_balance(self, amount):
         """
@@ -47,10 +70,11 @@ class Wallet:
         If you wish to subtract the amount from the balance,
         pass a negative value for the amount parameter.
         """
-        if self.balance + amount >= 0:
-            self.balance += amount
-        else:
-            raise InsufficientBalanceError("The projected balance is negative. Balance update rejected.")
+        with self._lock:
+            if self.balance + amount >= 0:
+                self.balance += amount
+            else:
+                raise InsufficientBalanceError("The projected balance is negative. Balance update rejected.")
 
 # ======================================================================================================================================================
 # Wallet's Cryptographic Operations
@@ -58,12 +82,12 @@ class Wallet:
 
     def generate_key_pair(self):
         """Generates the public - private key pair of the wallet using the rsa module."""
-        public_key, private_key = rsa.newkeys(2048) # You can adjust the key size for better key generation timing (i.e. 1024).
-        return public_key.save_pkcs1().decode(), private_key.save_pkcs1().decode()
+        return generate_key_pair() # You can adjust config.KEY_SIZE for better key generation timing (i.e. 1024).
 
     def sign_data(self, data):
         """Returns the digital signature for the given piece of data using the private key of the wallet."""
-        signature = rsa.sign(data.encode(), rsa.PrivateKey.load_pkcs1(self.private_key), "SHA-256")
+        # The crypto engine parses the private key only once and signs with its configured backend.
+        signature = crypto_engine.sign(data, self.private_key)
         return signature
 
     #def verify_signature(self, data, signature, public_key):
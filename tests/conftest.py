@@ -0,0 +1,30 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The modules of the node import each other from the source directory, as app.py runs them.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from keystore import generate_key_pair
+from wallet import Wallet
+
+@pytest.fixture(scope = "session")
+def key_pairs():
+    """Two small RSA key pairs, enough to sign transactions in the tests without the cost of full-size keys."""
+    return [generate_key_pair(key_size = 1024) for _ in range(2)]
+
+@pytest.fixture
+def nodes(key_pairs):
+    """Two nodes with signing wallets, as the senders, recipients and validators of the transactions and blocks of the tests."""
+    return [SimpleNamespace(id = node_id, wallet = Wallet(key_pair = key_pair)) for node_id, key_pair in enumerate(key_pairs)]
+
+@pytest.fixture
+def client():
+    """A test client of the endpoints of the node of the current process, served under /blockchat as app.py serves them."""
+    from flask import Flask
+    from endpoints import blockchat_bp
+    app = Flask(__name__)
+    app.register_blueprint(blockchat_bp, url_prefix = "/blockchat")
+    return app.test_client()
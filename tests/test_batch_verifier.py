@@ -0,0 +1,58 @@
+import pytest
+
+import transaction as transaction_module
+from libraries import batch_verifier as batch_verifier_module
+from libraries.batch_verifier import BatchVerifier
+from libraries.crypto_engine import VerifiedSignatureCache
+from transaction import Transaction
+
+def empty_cache(monkeypatch):
+    """Installs an empty cache of verified signatures, so that every signature is really verified, and returns it."""
+    cache = VerifiedSignatureCache(max_size = 100)
+    monkeypatch.setattr(transaction_module, "verified_signatures", cache)
+    monkeypatch.setattr(batch_verifier_module, "verified_signatures", cache)
+    return cache
+
+@pytest.fixture(autouse = True)
+def cache(monkeypatch):
+    return empty_cache(monkeypatch)
+
+@pytest.fixture
+def pooled_verifier():
+    verifier = BatchVerifier(max_workers = 2, min_parallel = 2)
+    yield verifier
+    verifier.close()
+
+def signed_transactions(nodes, count, bad = ()):
+    """Signed transactions of node 0, with an invalid signature at the given positions."""
+    transactions = []
+    for position in range(count):
+        transaction = Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 1, nonce = position + 1)
+        transaction.get_signature()
+        if position in bad:
+            transaction.signature = bytes(len(transaction.signature))
+        transactions.append(transaction)
+    return transactions
+
+def test_bad_signature_in_the_middle_of_a_batch(nodes, pooled_verifier):
+    transactions = signed_transactions(nodes, 5, bad = {2})
+    assert pooled_verifier.verify_transactions(transactions) == [True, True, False, True, True]
+    assert pooled_verifier._pool is not None
+
+def test_batch_below_min_parallel_is_verified_inline(nodes, monkeypatch):
+    verifier = BatchVerifier(max_workers = 2, min_parallel = 3)
+    monkeypatch.setattr(verifier, "_get_pool", lambda: pytest.fail("a batch below min_parallel must not start the pool"))
+    assert verifier.verify_transactions(signed_transactions(nodes, 2, bad = {0})) == [False, True]
+    assert verifier._pool is None
+
+def test_pool_and_inline_results_match(nodes, pooled_verifier, monkeypatch):
+    transactions = signed_transactions(nodes, 6, bad = {0, 3, 5})
+    pooled = pooled_verifier.verify_transactions(transactions)
+    empty_cache(monkeypatch)
+    inline = BatchVerifier(min_parallel = len(transactions) + 1).verify_transactions(transactions)
+    assert pooled == inline == [False, True, True, False, True, False]
+
+def test_only_valid_signatures_enter_the_cache(nodes, cache):
+    transactions = signed_transactions(nodes, 3, bad = {1})
+    BatchVerifier(min_parallel = 10).verify_transactions(transactions)
+    assert [cache.is_verified(transaction.get_hash(), transaction.signature) for transaction in transactions] == [True, False, True]
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import config
+from block_store import BlockStore
+from blockchain import Blockchain
+from test_blockchain import branch
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "store")
+
+@pytest.fixture
+def stored_blocks(nodes, directory, monkeypatch):
+    """Stores a chain of 10 blocks with transactions, validated with a checkpoint every 4 blocks, and returns its blocks."""
+    monkeypatch.setattr(config, "CHECKPOINT_INTERVAL", 4)
+    store = BlockStore(directory)
+    chain = Blockchain(nodes[0], store = store)
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 9, transactions = 2))
+    blocks = list(chain.blocks)
+    store.close()
+    return blocks
+
+def reopen(directory):
+    store = BlockStore(directory)
+    return store, [store.read(height) for height in range(len(store))]
+
+def test_reopened_store_holds_the_same_blocks_and_checkpoints(stored_blocks, directory):
+    store, blocks = reopen(directory)
+    assert [block.hash for block in blocks] == [block.hash for block in stored_blocks]
+    assert [len(block.transactions) for block in blocks] == [len(block.transactions) for block in stored_blocks]
+    assert all(store.height_of(block.hash) == height for height, block in enumerate(stored_blocks))
+    assert [height for height, _, _ in store.read_checkpoints()] == [4, 8]
+    chain = Blockchain(store = store)
+    # Only the blocks above the last checkpoint are validated again.
+    assert chain.validated_height == 8 and chain.is_valid() and chain.validated_height == 9
+    store.close()
+
+def test_partial_block_at_the_end_of_the_segment_is_dropped(stored_blocks, directory):
+    with open(os.path.join(directory, "blocks.dat"), "ab") as segment:
+        segment.write(b"\x00\x00\x10\x00partial")
+    store, blocks = reopen(directory)
+    assert [block.hash for block in blocks] == [block.hash for block in stored_blocks]
+    store.close()
+
+def test_cut_block_and_index_are_repaired(stored_blocks, directory):
+    # A crash in the middle of the last append: the block is cut and its index entry half written.
+    segment_path, index_path = os.path.join(directory, "blocks.dat"), os.path.join(directory, "blocks.idx")
+    os.truncate(segment_path, os.path.getsize(segment_path) - 5)
+    os.truncate(index_path, os.path.getsize(index_path) - 3)
+    store, blocks = reopen(directory)
+    assert [block.hash for block in blocks] == [block.hash for block in stored_blocks[:-1]]
+    store.append(stored_blocks[-1])
+    store.close()
+    store, blocks = reopen(directory)
+    assert [block.hash for block in blocks] == [block.hash for block in stored_blocks]
+    store.close()
+
+def test_lost_index_is_rebuilt_from_the_segment(stored_blocks, directory):
+    os.remove(os.path.join(directory, "blocks.idx"))
+    store, blocks = reopen(directory)
+    assert [block.hash for block in blocks] == [block.hash for block in stored_blocks]
+    assert store.height_of(stored_blocks[7].hash) == 7
+    store.close()
+
+def test_partial_checkpoint_is_dropped(stored_blocks, directory):
+    with open(os.path.join(directory, "checkpoints.dat"), "ab") as checkpoints:
+        checkpoints.write(b"\x01\x02\x03")
+    store = BlockStore(directory)
+    assert [height for height, _, _ in store.read_checkpoints()] == [4, 8]
+    store.close()
+
+def test_truncation_survives_a_reopen(stored_blocks, directory):
+    store = BlockStore(directory)
+    store.truncate(6)
+    assert len(store) == 6 and store.height_of(stored_blocks[7].hash) is None
+    store.append(stored_blocks[6])
+    store.close()
+    store, blocks = reopen(directory)
+    assert [block.hash for block in blocks] == [block.hash for block in stored_blocks[:7]]
+    assert [height for height, _, _ in store.read_checkpoints()] == [4]
+    store.close()
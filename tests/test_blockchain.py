@@ -0,0 +1,253 @@
+import io
+
+import pytest
+
+import config
+from block import Block
+from block_store import BlockStore
+from blockchain import Blockchain
+from libraries.custom_exceptions import ChainSyncError, WireFormatError
+from transaction import Transaction
+
+def next_block(nodes, previous_block, transactions = 0, nonce = 1, salt = 0):
+    """Returns a block on top of the given block, sealed by node 0, with the given number of transactions of node 0 to node 1."""
+    block = Block(validator = nodes[0])
+    block.timestamp += salt
+    for offset in range(transactions):
+        transaction = Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 1, nonce = nonce + offset)
+        transaction.get_signature()
+        block.add_transaction(transaction)
+    block.update_index(previous_block)
+    block.update_previous_hash(previous_block)
+    block.get_new_hash()
+    return block
+
+def branch(nodes, previous_block, length, transactions = 0, salt = 0):
+    """Returns {length} blocks, one on top of the other, starting on top of the given block."""
+    blocks = []
+    for _ in range(length):
+        blocks.append(next_block(nodes, previous_block, transactions, nonce = previous_block.index * transactions + 1, salt = salt))
+        previous_block = blocks[-1]
+    return blocks
+
+@pytest.fixture(params = ["memory", "store"])
+def chain(request, nodes, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CHECKPOINT_INTERVAL", 4)
+    store = BlockStore(str(tmp_path / "store")) if request.param == "store" else None
+    chain = Blockchain(nodes[0], store = store)
+    yield chain
+    if store is not None:
+        store.close()
+
+def test_locator_is_dense_at_the_tip_and_sparse_below(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 60))
+    locator = chain.locator()
+    heights = [chain.block_heights[block_hash] for block_hash in locator]
+    assert heights[:config.SYNC_LOCATOR_DENSE_BLOCKS] == list(range(60, 60 - config.SYNC_LOCATOR_DENSE_BLOCKS, -1))
+    assert heights[-1] == 0
+    assert len(locator) < 20
+    assert all(later > earlier for earlier, later in zip(heights[1:], heights))
+
+def test_fork_point_is_the_most_recent_shared_block(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 30))
+    other = Blockchain(nodes[0])
+    other.blocks[0] = chain.blocks[0]
+    other.append_synced_blocks(chain.blocks[1:21])
+    other.append_synced_blocks(branch(nodes, other.blocks[-1], 15, salt = 1))
+
+    fork_height = chain.fork_point(other.locator())
+    assert fork_height is not None and fork_height <= 20
+    assert chain.blocks[fork_height].hash == other.blocks[fork_height].hash
+    assert chain.fork_point([]) == -1
+    assert chain.fork_point(["f" * 64]) is None
+
+def read(stream):
+    """Returns the blocks of a stream made by the chain."""
+    return list(Blockchain.read_block_stream(io.BytesIO(b"".join(stream))))
+
+def test_stream_after_a_locator_starts_above_the_fork_point(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 12))
+    blocks = read(chain.stream_blocks_after_locator([chain.blocks[7].hash, chain.blocks[3].hash]))
+    assert [block.hash for block in blocks] == [block.hash for block in chain.blocks[8:]]
+    assert [block.index for block in read(chain.stream_blocks_after_locator([]))] == list(range(13))
+    with pytest.raises(ChainSyncError):
+        chain.stream_blocks_after_locator(["f" * 64])
+    with pytest.raises(ChainSyncError):
+        chain.stream_blocks_after(5, "f" * 64)
+
+def test_stream_stops_where_the_chain_is_reorganized_while_it_is_sent(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 6))
+    stream = chain.stream_blocks_after(0, chain.blocks[0].hash)
+    sent = [next(stream), next(stream), next(stream)] # the header and blocks 1 and 2
+    chain.replace_blocks_after(1, branch(nodes, chain.blocks[1], 6, salt = 1))
+    blocks = read(sent + list(stream))
+    assert [block.index for block in blocks] == [1, 2]
+
+def test_cut_or_oversized_stream_is_rejected(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 3, transactions = 2))
+    data = b"".join(chain.stream_blocks_after(-1, None))
+    with pytest.raises(WireFormatError):
+        list(Blockchain.read_block_stream(io.BytesIO(data[:-4])))
+    with pytest.raises(WireFormatError):
+        list(Blockchain.read_block_stream(io.BytesIO(data), max_block_bytes = 64))
+
+def test_longer_chain_and_then_lower_tip_hash_is_preferred(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 3))
+    tip_height, tip_hash = chain.tip()
+    assert chain.is_preferred_to(tip_height - 1, "0" * 64)
+    assert not chain.is_preferred_to(tip_height + 1, "f" * 64)
+    assert chain.is_preferred_to(tip_height, "f" * 64) == (tip_hash <= "f" * 64)
+    assert not chain.is_preferred_to(tip_height, "0" * 64)
+    assert chain.is_preferred_to(tip_height, tip_hash)
+
+def test_truncate_drops_blocks_indexes_and_checkpoints(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 10, transactions = 2))
+    kept_transaction = chain.blocks[5].transactions[0]
+    removed = chain.truncate(5)
+
+    assert [block.index for block in removed] == list(range(6, 11))
+    assert chain.tip() == (5, chain.blocks[5].hash)
+    assert all(chain.get_block(block.hash) is None for block in removed)
+    assert all(chain.find_transaction(transaction.hash) is None for block in removed for transaction in block.transactions)
+    assert chain.find_transaction(kept_transaction.hash)[1] == 5
+    total, history = chain.account_history(nodes[1].wallet.public_key)
+    assert total == 10 and all(height <= 5 for _, height, _ in history)
+    assert [checkpoint.height for checkpoint in chain.checkpoints] == [4]
+    assert chain.validated_height == 5
+
+def test_replace_blocks_after_switches_to_the_other_branch(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 9))
+    other_branch = branch(nodes, chain.blocks[6], 5, salt = 1)
+    chain.check_blocks_after(6, other_branch)
+    removed = chain.replace_blocks_after(6, other_branch)
+
+    assert [block.index for block in removed] == [7, 8, 9]
+    assert chain.tip() == (11, other_branch[-1].hash)
+    assert chain.validated_height == 11
+    # The checkpoint at block 8 now covers the new branch, so a full audit of the chain agrees with it.
+    assert [checkpoint.block_hash for checkpoint in chain.checkpoints] == [chain.blocks[4].hash, chain.blocks[8].hash]
+    assert chain.audit(from_checkpoint = False)
+
+def test_blocks_that_do_not_extend_the_fork_point_are_rejected(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 5))
+    other_branch = branch(nodes, chain.blocks[3], 2, salt = 1)
+    with pytest.raises(ChainSyncError):
+        chain.check_blocks_after(2, other_branch)
+    assert chain.tip()[0] == 5
+
+def test_watermark_moves_forward_over_the_blocks_checked_once(nodes, chain, monkeypatch):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 3))
+    assert chain.validated_height == 3
+    for block in branch(nodes, chain.blocks[-1], 3):
+        chain._append_block(block) # as the blocks loaded from a store, not checked yet
+    assert chain.validated_height == 3
+
+    checked = []
+    is_valid_block = chain._is_valid_block
+    monkeypatch.setattr(chain, "_is_valid_block", lambda height: checked.append(height) or is_valid_block(height))
+    assert chain.is_valid()
+    assert checked == [4, 5, 6] and chain.validated_height == 6
+    assert chain.is_valid()
+    assert checked == [4, 5, 6]
+    assert [checkpoint.height for checkpoint in chain.checkpoints] == [4]
+
+def test_watermark_stops_below_an_invalid_block(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 2))
+    for block in branch(nodes, chain.blocks[-1], 3):
+        chain._append_block(block)
+    chain.blocks[4].timestamp += 1 # tampered with, so its hash no longer matches
+    assert not chain.is_valid()
+    assert chain.validated_height == 3
+
+def test_audit_finds_a_tampered_block_below_the_watermark(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 10, transactions = 1))
+    chain.blocks[2].transactions[0].bcc += 1 # tampered with below the watermark and below the checkpoints
+    assert chain.is_valid() # the blocks below the watermark are not checked again
+    assert chain.audit() # nor above the last checkpoint
+    assert not chain.audit(from_checkpoint = False)
+    assert chain.validated_height == 1
+
+def test_audit_resumes_from_the_last_checkpoint_still_in_the_chain(nodes, chain, monkeypatch):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 10))
+    checked = []
+    is_valid_block = chain._is_valid_block
+    monkeypatch.setattr(chain, "_is_valid_block", lambda height: checked.append(height) or is_valid_block(height))
+    assert chain.audit()
+    assert checked == [9, 10]
+
+    # The block of the last checkpoint is replaced and hashed again, so the audit resumes from the checkpoint below it.
+    chain.blocks[8].timestamp += 1
+    chain.blocks[8].get_new_hash()
+    checked.clear()
+    assert not chain.audit()
+    assert checked == [5, 6, 7, 8] and chain.validated_height == 7
+
+def test_checkpoints_follow_the_chain_through_truncate(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 10))
+    chain.truncate(8) # down to a checkpoint, which is kept
+    assert [checkpoint.height for checkpoint in chain.checkpoints] == [4, 8]
+    assert chain.validated_height == 8
+    chain.truncate(6)
+    assert [checkpoint.height for checkpoint in chain.checkpoints] == [4]
+    assert chain.validated_height == 6
+    assert chain.audit()
+
+    # The checkpoint at block 8 is recorded again for the new branch, and a full audit agrees with the checkpoints.
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 4, salt = 1))
+    assert [checkpoint.block_hash for checkpoint in chain.checkpoints] == [chain.blocks[4].hash, chain.blocks[8].hash]
+    assert chain.audit(from_checkpoint = False)
+    if chain._store is not None:
+        assert [checkpoint[1] for checkpoint in chain._store.read_checkpoints()] == [chain.blocks[4].hash, chain.blocks[8].hash]
+
+def test_truncate_keeps_the_watermark_below_the_height(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 2))
+    for block in branch(nodes, chain.blocks[-1], 6):
+        chain._append_block(block)
+    chain.truncate(5)
+    assert chain.validated_height == 2 and chain.checkpoints == []
+    assert chain.is_valid() and chain.validated_height == 5
+    assert [checkpoint.height for checkpoint in chain.checkpoints] == [4]
+
+def test_account_history_pages_from_the_most_recent_transaction(nodes, chain):
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 4, transactions = 2))
+    sender_key, recipient_key = nodes[0].wallet.public_key, nodes[1].wallet.public_key
+    total, history = chain.account_history(sender_key)
+    assert total == 8
+    assert [(height, position) for _, height, position in history] == [(4, 1), (4, 0), (3, 1), (3, 0), (2, 1), (2, 0), (1, 1), (1, 0)]
+    assert [transaction.nonce for transaction, _, _ in history] == list(range(8, 0, -1))
+    assert chain.account_history(recipient_key)[1] == history
+
+    _, page = chain.account_history(sender_key, offset = 3, limit = 2)
+    assert [(height, position) for _, height, position in page] == [(3, 0), (2, 1)]
+    _, page = chain.account_history(sender_key, offset = 7, limit = 5)
+    assert [(height, position) for _, height, position in page] == [(1, 0)]
+    assert chain.account_history(sender_key, offset = 8) == (8, [])
+    assert chain.account_history(sender_key, limit = 0) == (8, [])
+    assert chain.account_history("unknown key") == (0, [])
+
+def test_transfer_to_self_is_in_the_account_history_once(nodes, chain):
+    block = Block(validator = nodes[0])
+    transaction = Transaction(nodes[0], 0, nodes[0].wallet.public_key, bcc = 1, nonce = 1)
+    transaction.get_signature()
+    block.add_transaction(transaction)
+    block.update_index(chain.blocks[-1])
+    block.update_previous_hash(chain.blocks[-1])
+    block.get_new_hash()
+    chain.append_synced_blocks([block])
+    assert chain.account_history(nodes[0].wallet.public_key) == (1, [(transaction, 1, 0)])
+
+def test_indexes_of_a_reopened_store_are_built_on_the_first_query(nodes, tmp_path):
+    store = BlockStore(str(tmp_path / "store"))
+    chain = Blockchain(nodes[0], store = store)
+    chain.append_synced_blocks(branch(nodes, chain.blocks[-1], 3, transactions = 2))
+    block_hash, transaction = chain.blocks[2].hash, chain.blocks[3].transactions[1]
+    store.close()
+
+    store = BlockStore(str(tmp_path / "store"))
+    reopened = Blockchain(nodes[0], store = store)
+    assert reopened.block_heights == {} and reopened.account_transactions == {}
+    assert reopened.get_block(block_hash).index == 2
+    assert reopened.find_transaction(transaction.hash)[1:] == (3, 1)
+    assert reopened.account_history(nodes[1].wallet.public_key)[0] == 6
+    assert len(reopened.block_heights) == 4
+    store.close()
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from libraries.broadcast_engine import BroadcastEngine
+
+class StubResponse:
+    """The parts of a requests response that the broadcast engine reads."""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {"message": self.text}
+
+class StubClient:
+    """A peer client that answers every port with the behavior assigned to it, without any HTTP request."""
+
+    def __init__(self, behaviors):
+        self.behaviors = behaviors
+        self.released = threading.Event() # unblocks the peers that hang
+        self.posted = []
+
+    def post(self, ip, port, endpoint, data = None):
+        self.posted.append(port)
+        behavior = self.behaviors[port]
+        if behavior == "hang":
+            self.released.wait(5)
+            return StubResponse(200, "late")
+        if behavior == "fail":
+            raise requests.exceptions.ConnectionError("refused")
+        return StubResponse(behavior, "ok" if behavior == 200 else "no")
+
+def ring(count):
+    return [{"id": node_id, "ip": "127.0.0.1", "port": 5000 + node_id} for node_id in range(count)]
+
+@pytest.fixture
+def engine_for():
+    clients = []
+
+    def engine_for(*behaviors, deadline = 5):
+        client = StubClient({5000 + node_id: behavior for node_id, behavior in enumerate(behaviors)})
+        clients.append(client)
+        return BroadcastEngine(client = client, deadline = deadline, max_workers = len(behaviors))
+
+    yield engine_for
+    for client in clients:
+        client.released.set()
+
+def test_broadcast_is_accepted_when_every_peer_accepts(engine_for):
+    result = engine_for(200, 201, 200).broadcast(ring(3), "receive_transaction", data = {})
+    assert result.accepted
+    assert [peer.outcome for peer in result.results] == ["accepted"] * 3
+    assert [peer.node_id for peer in result.results] == [0, 1, 2]
+    assert result.rejections() == []
+
+def test_rejection_cancels_the_requests_still_in_flight(engine_for):
+    start = time.perf_counter()
+    result = engine_for(400, "hang", "hang").broadcast(ring(3), "receive_transaction")
+    assert time.perf_counter() - start < 2
+    assert not result.accepted
+    assert [peer.outcome for peer in result.results] == ["rejected", "cancelled", "cancelled"]
+    assert result.results[0].status_code == 400 and result.results[0].message == "no"
+
+def test_peers_that_miss_the_deadline_time_out(engine_for):
+    start = time.perf_counter()
+    result = engine_for(200, "hang").broadcast(ring(2), "receive_block", deadline = 0.2)
+    assert 0.2 <= time.perf_counter() - start < 2
+    assert not result.accepted
+    assert [peer.outcome for peer in result.results] == ["accepted", "timeout"]
+
+def test_failing_peer_does_not_block_the_others(engine_for):
+    engine = engine_for("fail", 200, 200)
+    result = engine.broadcast(ring(3), "receive_block", stop_on_rejection = False)
+    assert not result.accepted
+    assert [peer.outcome for peer in result.results] == ["error", "accepted", "accepted"]
+    assert "refused" in result.results[0].message
+    assert sorted(engine.client.posted) == [5000, 5001, 5002]
+
+def test_rejection_waits_for_the_other_peers_without_stop_on_rejection(engine_for):
+    engine = engine_for(400, "hang")
+    threading.Timer(0.1, engine.client.released.set).start()
+    result = engine.broadcast(ring(2), "receive_block", stop_on_rejection = False)
+    assert [peer.outcome for peer in result.results] == ["rejected", "accepted"]
+    assert result.results[1].message == "late"
@@ -0,0 +1,135 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import endpoints
+
+@pytest.fixture
+def ring_node(monkeypatch):
+    """The node behind the endpoints, with the ring updates recorded instead of applied."""
+    received_rings = []
+    monkeypatch.setattr(endpoints.node, "set_ring", received_rings.append)
+    return received_rings
+
+def test_post_ring_takes_the_ring_as_json(client, ring_node):
+    ring = [{"id": 0, "ip": "127.0.0.1", "port": "5000", "public_key": "key 0"}, {"id": 1, "ip": "127.0.0.1", "port": "5001", "public_key": "key 1"}]
+    response = client.post("/blockchat/post_ring", data = json.dumps({"ring": ring}))
+    assert response.status_code == 200 and ring_node == [ring]
+
+@pytest.mark.parametrize("data", [b"\x80\x04K\x01.", b"[]", json.dumps({"ring": [{"id": "0", "public_key": "key"}]}), json.dumps({"ring": {"id": 0}})])
+def test_post_ring_rejects_anything_else(client, ring_node, data):
+    response = client.post("/blockchat/post_ring", data = data)
+    assert response.status_code == 400 and ring_node == []
+
+@pytest.fixture
+def sender(monkeypatch):
+    """The node behind the endpoints, in a ring of two nodes, with the transactions that it is asked to make recorded instead of made."""
+    made_batches = []
+    monkeypatch.setattr(endpoints.node, "ring", [{"id": 0, "ip": "127.0.0.1", "port": "5000", "public_key": "key 0"}, {"id": 1, "ip": "127.0.0.1", "port": "5001", "public_key": "key 1"}])
+    monkeypatch.setattr(endpoints.node, "create_transactions", lambda inputs, all_or_nothing: made_batches.append(inputs) or [(True, "ok", "hash")] * len(inputs))
+    return made_batches
+
+def test_make_transactions_parses_every_transaction(client, sender):
+    response = client.post("/blockchat/make_transactions", json = {"transactions": [{"recipient_id": 1, "bcc": 5}, {"recipient_id": 0, "bcc": 2.0, "message": "hi"}, {"recipient_id": 1, "message": "hello"}]})
+    assert response.status_code == 200
+    assert sender == [[(1, "key 1", 5, None), (0, "key 0", 2, "hi"), (1, "key 1", 0, "hello")]]
+
+@pytest.mark.parametrize("transaction_input", [
+    {"recipient_id": 7, "bcc": 1},
+    {"recipient_id": "1", "bcc": 1},
+    {"recipient_id": True, "bcc": 1},
+    {"recipient_id": 1, "bcc": "5"},
+    {"recipient_id": 1, "bcc": -1},
+    {"recipient_id": 1, "bcc": 1.5},
+    {"recipient_id": 1, "bcc": False},
+    {"recipient_id": 1, "message": 5},
+    {"recipient_id": 1},
+    {"recipient_id": 1, "bcc": 0, "message": ""},
+    [1, 5],
+])
+def test_make_transactions_rejects_the_batch_with_the_index_of_a_malformed_transaction(client, sender, transaction_input):
+    response = client.post("/blockchat/make_transactions", json = {"transactions": [{"recipient_id": 1, "bcc": 1}, transaction_input]})
+    assert response.status_code == 400 and response.get_json()["index"] == 1
+    assert sender == []
+
+@pytest.fixture
+def single_sender(sender, monkeypatch):
+    """The node behind the endpoints, with the single transactions that it is asked to make recorded instead of made."""
+    made_transactions = []
+    monkeypatch.setattr(endpoints.node, "create_transaction", lambda *inputs: made_transactions.append(inputs))
+    return made_transactions
+
+def test_make_transaction_parses_the_form(client, single_sender):
+    response = client.post("/blockchat/make_transaction", data = {"recipient_id": "1", "bcc": "5", "message": "hi"})
+    assert response.status_code == 200 and single_sender == [(1, "key 1", 5, "hi")]
+
+@pytest.mark.parametrize("form", [
+    {"recipient_id": "one", "bcc": "5"},
+    {"bcc": "5"},
+    {"recipient_id": "7", "bcc": "5"},
+    {"recipient_id": "1", "bcc": "-5"},
+    {"recipient_id": "1"},
+    {"recipient_id": "1", "bcc": "0", "message": ""},
+])
+def test_make_transaction_answers_400_to_invalid_input(client, single_sender, form):
+    response = client.post("/blockchat/make_transaction", data = form)
+    assert response.status_code == 400 and single_sender == []
+
+@pytest.fixture
+def history_chain(nodes, monkeypatch):
+    """The node behind the endpoints, with a chain of 3 blocks holding 2 transactions of node 0 to node 1 each."""
+    from block import Block
+    from blockchain import Blockchain
+    from transaction import Transaction
+    chain = Blockchain(nodes[0])
+    for height in range(1, 4):
+        block = Block(validator = nodes[0])
+        for nonce in (2 * height - 1, 2 * height):
+            transaction = Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 1, nonce = nonce)
+            transaction.get_signature()
+            block.add_transaction(transaction)
+        block.update_index(chain.blocks[-1])
+        block.update_previous_hash(chain.blocks[-1])
+        block.get_new_hash()
+        chain.append_synced_blocks([block])
+    monkeypatch.setattr(endpoints.node, "chain", chain)
+    monkeypatch.setattr(endpoints.node, "ledger", SimpleNamespace(public_key_of = {node.id: node.wallet.public_key for node in nodes}.get))
+    return chain
+
+def test_account_history_by_node_id(client, nodes, history_chain):
+    response = client.get("/blockchat/get_account_history", query_string = {"node_id": 0, "offset": 1, "limit": 2})
+    assert response.status_code == 200
+    page = response.get_json()
+    assert (page["total"], page["offset"], page["limit"]) == (6, 1, 2)
+    assert [(item["block_height"], item["position"], item["nonce"], item["direction"]) for item in page["transactions"]] == [(3, 0, 5, "sent"), (2, 1, 4, "sent")]
+    assert page["transactions"][0]["hash"] == history_chain.blocks[3].transactions[0].hash
+
+def test_account_history_by_public_key(client, nodes, history_chain):
+    response = client.get("/blockchat/get_account_history", query_string = {"public_key": nodes[1].wallet.public_key})
+    page = response.get_json()
+    assert response.status_code == 200 and page["total"] == 6 and page["limit"] == config.HISTORY_PAGE_SIZE
+    assert [item["direction"] for item in page["transactions"]] == ["received"] * 6
+    assert [item["nonce"] for item in page["transactions"]] == [6, 5, 4, 3, 2, 1]
+
+def test_account_history_of_an_account_without_transactions_is_empty(client, history_chain):
+    response = client.get("/blockchat/get_account_history", query_string = {"public_key": "unknown key"})
+    assert response.status_code == 200 and response.get_json()["total"] == 0 and response.get_json()["transactions"] == []
+
+@pytest.mark.parametrize("query", [
+    {},
+    {"node_id": 7},
+    {"node_id": "one"},
+    {"node_id": 0, "offset": -1},
+    {"node_id": 0, "limit": 0},
+    {"node_id": 0, "limit": 10 ** 6},
+])
+def test_account_history_answers_400_to_invalid_arguments(client, history_chain, query):
+    response = client.get("/blockchat/get_account_history", query_string = query)
+    assert response.status_code == 400
+
+def test_account_history_answers_404_without_a_chain(client, nodes, history_chain, monkeypatch):
+    monkeypatch.setattr(endpoints.node, "chain", None)
+    response = client.get("/blockchat/get_account_history", query_string = {"node_id": 0})
+    assert response.status_code == 404
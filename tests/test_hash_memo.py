@@ -0,0 +1,81 @@
+import pytest
+
+from block import Block
+from transaction import Transaction
+import block as block_module
+import transaction as transaction_module
+
+def new_transaction(nodes, nonce = 1):
+    return Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 5, message = "hello", nonce = nonce)
+
+def new_block(nodes, transactions = 2):
+    block = Block(validator = nodes[0], index = 1, previous_hash = "1")
+    for nonce in range(1, transactions + 1):
+        block.add_transaction(new_transaction(nodes, nonce))
+    block.get_new_hash()
+    return block
+
+def new_block_with(nodes, transactions):
+    """A block built from scratch with the given transactions, whose Merkle tree was never memoised before."""
+    block = Block(validator = nodes[0], index = 1, previous_hash = "1")
+    block.transactions = list(transactions)
+    return block
+
+TRANSACTION_CHANGES = {
+    "sender_public_key": lambda transaction, nodes: nodes[1].wallet.public_key,
+    "recipient_public_key": lambda transaction, nodes: nodes[0].wallet.public_key,
+    "type": lambda transaction, nodes: "message",
+    "bcc": lambda transaction, nodes: transaction.bcc + 1,
+    "message": lambda transaction, nodes: transaction.message + "!",
+    "timestamp": lambda transaction, nodes: transaction.timestamp + 1,
+    "nonce": lambda transaction, nodes: transaction.nonce + 1,
+}
+
+BLOCK_CHANGES = {
+    "index": lambda block, nodes: block.index + 1,
+    "previous_hash": lambda block, nodes: "2",
+    "transactions": lambda block, nodes: block.transactions[:1],
+    "validator_id": lambda block, nodes: block.validator_id + 1,
+    "timestamp": lambda block, nodes: block.timestamp + 1,
+}
+
+def test_every_hashed_field_is_changed_by_a_test():
+    assert set(TRANSACTION_CHANGES) == transaction_module.HASHED_FIELDS
+    assert set(BLOCK_CHANGES) == block_module.HASHED_FIELDS
+
+@pytest.mark.parametrize("field", sorted(TRANSACTION_CHANGES))
+def test_changing_a_hashed_field_changes_the_transaction_hash(nodes, field):
+    transaction = new_transaction(nodes)
+    memoised = transaction.get_hash()
+    setattr(transaction, field, TRANSACTION_CHANGES[field](transaction, nodes))
+    assert transaction.get_hash() != memoised
+    assert transaction.get_hash() == Transaction.from_bytes(transaction.to_bytes()).get_hash()
+
+def test_changing_an_unhashed_field_keeps_the_memoised_transaction_hash(nodes):
+    transaction = new_transaction(nodes)
+    memoised = transaction.get_hash()
+    transaction.signature = b"signature"
+    transaction.recipient_id = 0
+    assert transaction.get_hash() == memoised
+
+@pytest.mark.parametrize("field", sorted(BLOCK_CHANGES))
+def test_changing_a_hashed_field_changes_the_block_hash(nodes, field):
+    block = new_block(nodes)
+    memoised = block.calculate_hash()
+    setattr(block, field, BLOCK_CHANGES[field](block, nodes))
+    assert block.calculate_hash() != memoised
+    assert block.calculate_hash() == Block.from_bytes(block.to_bytes()).calculate_hash()
+
+def test_replacing_the_transactions_changes_the_merkle_root(nodes):
+    block = new_block(nodes)
+    root = block.merkle_root()
+    block.transactions = [new_transaction(nodes, 5), new_transaction(nodes, 6)]
+    assert block.merkle_root() != root
+    assert block.merkle_root() == new_block_with(nodes, block.transactions).merkle_root()
+
+def test_adding_a_transaction_changes_the_merkle_root_and_the_hash(nodes):
+    block = new_block(nodes)
+    root, memoised = block.merkle_root(), block.calculate_hash()
+    assert block.add_transaction(new_transaction(nodes, 3))
+    assert block.merkle_root() != root
+    assert block.calculate_hash() != memoised
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from ledger_state import LedgerState
+from libraries.custom_exceptions import LedgerError
+from libraries.functions_library import parse_bcc, transaction_total_expenses
+from transaction import Transaction
+
+def sender_node(node_id):
+    return SimpleNamespace(id = node_id, wallet = SimpleNamespace(public_key = f"key{node_id}"))
+
+def make_ledger(balances, backend = "python"):
+    ledger = LedgerState(backend = backend)
+    for node_id, balance in enumerate(balances):
+        ledger.register_account(node_id, f"key{node_id}")
+        ledger.balances.commit(ledger.balances.stage([node_id], [balance * config.BCC_CENTS]))
+        ledger.stakes.set_stake(node_id, balance)
+    return ledger
+
+def make_transaction(sender_id, recipient_id, bcc = None, message = None, nonce = 1):
+    return Transaction(sender_node(sender_id), recipient_id, f"key{recipient_id}", bcc, message, nonce = nonce)
+
+def block_of(ledger, transactions):
+    return SimpleNamespace(index = ledger.applied_height + 1, validator_id = 0, previous_hash = "hash", transactions = transactions)
+
+@pytest.fixture(params = ["python", "numpy"])
+def ledger(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy", reason = "the numpy ledger backend is untested without the numpy package")
+    # Every block of these tests is sealed by node 0, the only node with a stake.
+    ledger = make_ledger([100, 0], backend = request.param)
+    ledger.applied_height = 0
+    monkeypatch.setattr(ledger, "elected_validator", lambda height, previous_hash: 0)
+    return ledger
+
+def test_fees_are_exact_in_cents():
+    assert transaction_total_expenses(bcc = 10) == 1030
+    assert transaction_total_expenses(bcc = 7, message = " hi ") == 721 + 200
+    assert sum(transaction_total_expenses(bcc = 1) for _ in range(1000)) == transaction_total_expenses(bcc = 1000)
+
+def test_negative_bcc_is_rejected(ledger):
+    transaction = make_transaction(0, 1, bcc = -50)
+    assert ledger.check_transaction(transaction) == (False, "Invalid amount of bcc or message.")
+    with pytest.raises(LedgerError):
+        ledger.apply_block(block_of(ledger, [transaction]))
+    assert ledger.balance("key1") == 0
+
+@pytest.mark.parametrize("bcc", ["50", 2.5, True])
+def test_non_numeric_bcc_is_rejected(ledger, bcc):
+    # Such a transaction cannot even be hashed, so only its content reaches the check.
+    transaction = SimpleNamespace(sender_public_key = "key0", recipient_public_key = "key1", bcc = bcc, message = None, nonce = 1)
+    assert ledger.check_transaction(transaction) == (False, "Invalid amount of bcc or message.")
+
+def test_overdrawn_transactions_are_rejected(ledger):
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 97)) == (True, "Transaction validation successful.")
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 98)) == (False, "Insufficient balance.")
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 50), pending_expenses = transaction_total_expenses(bcc = 50)) == (False, "Insufficient balance.")
+
+def test_overdrawing_block_is_not_applied(ledger):
+    block = block_of(ledger, [make_transaction(0, 1, bcc = 60, nonce = 1), make_transaction(0, 1, bcc = 60, nonce = 2)])
+    with pytest.raises(LedgerError):
+        ledger.apply_block(block)
+    assert ledger.balance("key0") == 100 * config.BCC_CENTS and ledger.next_nonce("key0") == 1
+
+def test_nonce_must_be_the_next_one(ledger):
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 1, nonce = 2)) == (False, "Invalid nonce.")
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 1, nonce = 2), next_nonce = 1, last_nonce = 2)[0]
+    ledger.apply_block(block_of(ledger, [make_transaction(0, 1, bcc = 1, nonce = 1)]))
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 1, nonce = 1)) == (False, "Invalid nonce.")
+    assert ledger.check_transaction(make_transaction(0, 1, bcc = 1, nonce = 2))[0]
+
+def test_applied_block_moves_whole_cents(ledger):
+    ledger.apply_block(block_of(ledger, [make_transaction(0, 1, bcc = 10, message = "hey", nonce = 1)]))
+    assert ledger.balance("key1") == 10 * config.BCC_CENTS
+    # The validator, node 0, collects the fees of its own transaction.
+    assert ledger.balance("key0") == (100 - 10) * config.BCC_CENTS
+
+@pytest.mark.parametrize("value, expected", [(None, 0), ("", 0), ("12", 12), (" 3 ", 3), (4, 4), (5.0, 5), ("6.0", 6)])
+def test_parse_bcc_accepts_whole_amounts(value, expected):
+    assert parse_bcc(value) == expected
+
+@pytest.mark.parametrize("value", ["-1", -1, 2.5, "abc", True, [1], "nan"])
+def test_parse_bcc_rejects_other_values(value):
+    with pytest.raises(ValueError):
+        parse_bcc(value)
+
+def test_block_is_checked_on_its_net_deltas(ledger):
+    ledger.register_account(2, "key2")
+    # Node 1 spends the coins it receives in the same block.
+    block = block_of(ledger, [make_transaction(0, 1, bcc = 50, nonce = 1), make_transaction(1, 2, bcc = 40, nonce = 1)])
+    ledger.apply_block(block)
+    assert ledger.balance("key1") == 50 * config.BCC_CENTS - transaction_total_expenses(bcc = 40)
+    assert ledger.balance("key2") == 40 * config.BCC_CENTS
+
+def test_rollback_restores_balances_nonces_and_stakes(ledger):
+    balances = [ledger.balance("key0"), ledger.balance("key1")]
+    ledger.apply_block(block_of(ledger, [make_transaction(0, 1, bcc = 30, nonce = 1)]))
+    ledger.apply_block(block_of(ledger, [make_transaction(0, 1, bcc = 20, nonce = 2)]))
+    assert ledger.applied_height == 2 and ledger.stakes.stakes[1] == 50
+    ledger.rollback(2)
+    assert [ledger.balance("key0"), ledger.balance("key1")] == balances
+    assert ledger.next_nonce("key0") == 1 and ledger.applied_height == 0
+    assert ledger.stakes.stakes == [100, 0]
+    ledger.apply_block(block_of(ledger, [make_transaction(0, 1, bcc = 10, nonce = 1)]))
+    assert ledger.balance("key1") == 10 * config.BCC_CENTS
+
+def test_rollback_is_bounded_by_the_undo_records():
+    ledger = make_ledger([100, 0])
+    with pytest.raises(LedgerError):
+        ledger.rollback(1)
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+from mempool import Mempool
+
+class Ledger:
+    """The next nonces and the balances of the senders, as the mempool reads them from the ledger."""
+
+    def __init__(self, balances, next_nonces = None):
+        self.balances = balances
+        self.next_nonces = next_nonces or {}
+
+    def balance(self, public_key):
+        return self.balances.get(public_key, 0)
+
+    def next_nonce(self, public_key):
+        return self.next_nonces.get(public_key, 1)
+
+def transaction(sender, nonce, fee, expenses = None):
+    """Returns a validated transaction of the given sender with the given fee."""
+    return SimpleNamespace(hash = f"{sender}-{nonce}-{fee}", sender_public_key = sender, nonce = nonce, fee = lambda: fee, total_expenses = lambda: fee * 10 if expenses is None else expenses)
+
+@pytest.fixture
+def ledger():
+    return Ledger({"a": 10000, "b": 10000, "c": 10000})
+
+def test_pack_takes_the_highest_fee_first_but_keeps_the_nonce_order_of_every_sender(ledger):
+    mempool = Mempool()
+    for added in (transaction("a", 1, 1), transaction("a", 2, 9), transaction("b", 1, 5), transaction("b", 2, 4), transaction("c", 1, 3)):
+        assert mempool.add(added)[0]
+    packed = mempool.pack(ledger, capacity = 10)
+    assert [(packed_transaction.sender_public_key, packed_transaction.nonce) for packed_transaction in packed] == [("b", 1), ("b", 2), ("c", 1), ("a", 1), ("a", 2)]
+    assert [packed_transaction.hash for packed_transaction in mempool.pack(ledger, capacity = 2)] == ["b-1-5", "b-2-4"]
+    assert len(mempool) == 5
+
+def test_pack_starts_at_the_next_nonce_of_the_ledger_and_stops_a_sender_that_cannot_pay(ledger):
+    mempool = Mempool()
+    for added in (transaction("a", 1, 1), transaction("a", 2, 1), transaction("b", 1, 2, expenses = 6000), transaction("b", 2, 2, expenses = 6000), transaction("b", 3, 9)):
+        mempool.add(added)
+    ledger.next_nonces["a"] = 2
+    assert [packed_transaction.hash for packed_transaction in mempool.pack(ledger, capacity = 10)] == ["b-1-2", "a-2-1"]
+
+def test_duplicates_are_rejected_by_hash_and_by_nonce():
+    mempool = Mempool()
+    assert mempool.add(transaction("a", 1, 1))[0]
+    assert not mempool.add(transaction("a", 1, 1))[0]
+    assert not mempool.add(transaction("a", 1, 2))[0]
+    assert mempool.metrics()["duplicates"] == 2
+
+def test_full_mempool_evicts_the_lowest_fee_last_transaction_of_another_sender():
+    mempool = Mempool(max_size = 3)
+    for added in (transaction("a", 1, 1), transaction("a", 2, 5), transaction("b", 1, 3)):
+        mempool.add(added)
+    # The last transaction of a has the highest fee, so the last transaction of b goes, not the cheaper a-1 that a-2 depends on.
+    assert mempool.add(transaction("c", 1, 4))[0]
+    assert "b-1-3" not in mempool and {"a-1-1", "a-2-5", "c-1-4"} == set(mempool.transactions)
+    # No transaction pays less than the new one, or only the sender's own last transaction would go.
+    assert not mempool.add(transaction("b", 1, 2))[0]
+    assert not mempool.add(transaction("c", 2, 9))[0]
+    assert mempool.metrics()["evicted"] == 1 and mempool.metrics()["rejected_full"] == 2
+
+def test_pending_expenses_next_nonce_and_pruning_follow_the_transactions(ledger):
+    mempool = Mempool()
+    for added in (transaction("a", 1, 1), transaction("a", 2, 2), transaction("b", 1, 3)):
+        mempool.add(added)
+    assert mempool.pending_expenses("a") == 30 and mempool.next_nonce(ledger, "a") == 3
+    mempool.remove_included([transaction("a", 1, 1)])
+    ledger.next_nonces["a"] = 2
+    assert mempool.pending_expenses("a") == 20 and mempool.next_nonce(ledger, "a") == 3
+    ledger.next_nonces["b"] = 2
+    mempool.prune(ledger)
+    assert set(mempool.transactions) == {"a-2-2"} and mempool.pending_expenses("b") == 0
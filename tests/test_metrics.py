@@ -0,0 +1,79 @@
+import pytest
+
+import config
+from libraries.metrics import Counter, Histogram, MetricsRegistry
+
+@pytest.fixture(autouse = True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", True)
+
+def test_counter_renders_one_sample_per_label_values():
+    counter = Counter("requests_total", "Requests served.", ("endpoint", "status"))
+    counter.inc(endpoint = "get_balance", status = 200)
+    counter.inc(2, endpoint = "get_balance", status = 200)
+    counter.inc(endpoint = "view_block", status = 404)
+    assert counter.render() == [
+        "# HELP requests_total Requests served.",
+        "# TYPE requests_total counter",
+        "requests_total{endpoint=\"get_balance\",status=\"200\"} 3",
+        "requests_total{endpoint=\"view_block\",status=\"404\"} 1",
+    ]
+
+def test_counter_without_labels():
+    counter = Counter("blocks_total", "Blocks sealed.")
+    counter.inc()
+    assert counter.render()[-1] == "blocks_total 1"
+
+def test_histogram_renders_cumulative_buckets_a_sum_and_a_count():
+    histogram = Histogram("duration_seconds", "Time spent.", ("endpoint",), buckets = (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value, endpoint = "get_balance")
+    assert histogram.render() == [
+        "# HELP duration_seconds Time spent.",
+        "# TYPE duration_seconds histogram",
+        "duration_seconds_bucket{endpoint=\"get_balance\",le=\"0.1\"} 2",
+        "duration_seconds_bucket{endpoint=\"get_balance\",le=\"1\"} 3",
+        "duration_seconds_bucket{endpoint=\"get_balance\",le=\"+Inf\"} 4",
+        "duration_seconds_sum{endpoint=\"get_balance\"} 2.65",
+        "duration_seconds_count{endpoint=\"get_balance\"} 4",
+    ]
+
+def test_histogram_times_a_block_of_code():
+    histogram = Histogram("duration_seconds", "Time spent.", ("mode",))
+    with histogram.time(mode = "inline"):
+        pass
+    [(key, _, total, count)] = histogram.samples()
+    assert key == ("inline",) and count == 1 and total >= 0
+
+def test_label_values_are_escaped():
+    counter = Counter("requests_total", "Requests served.", ("endpoint",))
+    counter.inc(endpoint = "a\\b\"c\nd")
+    assert counter.render()[-1] == "requests_total{endpoint=\"a\\\\b\\\"c\\nd\"} 1"
+
+def test_nothing_is_recorded_while_the_metrics_are_disabled(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    counter = Counter("requests_total", "Requests served.")
+    histogram = Histogram("duration_seconds", "Time spent.")
+    counter.inc()
+    histogram.observe(1)
+    with histogram.time():
+        pass
+    assert counter.samples() == [] and histogram.samples() == []
+
+def test_registry_renders_every_metric():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests served.").inc()
+    registry.histogram("duration_seconds", "Time spent.", buckets = (1,)).observe(0.5)
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "# TYPE requests_total counter\nrequests_total 1\n" in text
+    assert "duration_seconds_bucket{le=\"1\"} 1\n" in text
+
+def test_metrics_endpoint_serves_the_prometheus_text_format(client):
+    client.get("/blockchat/health")
+    response = client.get("/blockchat/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain" and "version=0.0.4" in response.content_type
+    text = response.get_data(as_text = True)
+    assert "# TYPE blockchat_endpoint_duration_seconds histogram" in text
+    assert "blockchat_endpoint_requests_total{endpoint=\"health\",method=\"GET\",status=\"200\"}" in text
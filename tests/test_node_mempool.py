@@ -0,0 +1,70 @@
+import pytest
+
+import config
+import node as node_module
+from blockchain import Blockchain
+from libraries.broadcast_engine import BroadcastResult, PeerResult
+from node import Node
+from transaction import Transaction
+
+@pytest.fixture
+def node(nodes, monkeypatch):
+    """Node 0, the holder of the whole stake and so the validator of every block, with the tasks it schedules in the background recorded instead of run."""
+    monkeypatch.setattr(config, "total_nodes", 2)
+    monkeypatch.setattr(config, "block_capacity", 2)
+    node = Node()
+    node.id = 0
+    node.wallet = nodes[0].wallet
+    node.chain = Blockchain(nodes[0])
+    node.set_ring([{"id": peer.id, "ip": "127.0.0.1", "port": 5000 + peer.id, "public_key": peer.wallet.public_key} for peer in nodes])
+    node.scheduled = []
+    monkeypatch.setattr(node, "_in_background", lambda function, *args: node.scheduled.append(function.__name__))
+    return node
+
+def transfer(nodes, nonce, valid_signature = True):
+    """Returns a transaction of 1 BCC from node 0 to node 1."""
+    transaction = Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 1, nonce = nonce)
+    transaction.get_signature()
+    if not valid_signature:
+        transaction.signature = bytes(len(transaction.signature))
+    return transaction
+
+def test_relayed_transaction_enters_the_mempool_only_if_it_is_signed_and_follows_the_ledger(nodes, node):
+    assert node.receive_transaction(transfer(nodes, 1, valid_signature = False)) == (False, "Invalid signature.")
+    assert not node.receive_transaction(transfer(nodes, 2))[0] # nonce 1 is missing
+    no_nonce = transfer(nodes, 1)
+    no_nonce.nonce = None
+    assert not node.receive_transaction(no_nonce)[0]
+    assert node.receive_transaction(transfer(nodes, 1))[0]
+    assert len(node.mempool) == 1
+
+def test_invalid_transaction_in_the_mempool_does_not_stall_sealing(nodes, node):
+    # A transaction with a bad signature that reached the mempool, e.g. before the checks at its door.
+    node.mempool.add(transfer(nodes, 1))
+    node.mempool.add(transfer(nodes, 2, valid_signature = False))
+    assert node.seal_block_if_ready() is None
+    assert len(node.mempool) == 1 and node.scheduled == ["seal_block_if_ready"]
+
+    assert node.receive_transaction(transfer(nodes, 2))[0]
+    block = node.seal_block_if_ready()
+    assert block is not None and [transaction.nonce for transaction in block.transactions] == [1, 2]
+    assert node.ledger.applied_height == 1 and len(node.mempool) == 0
+
+def test_validated_nonce_lets_the_next_one_validate_before_the_mempool(nodes, node):
+    assert node.validate_transaction(transfer(nodes, 1))[0]
+    assert node.validate_transaction(transfer(nodes, 2))[0]
+    assert not node.validate_transaction(transfer(nodes, 4))[0]
+
+def test_nonce_rejected_by_the_network_is_released(nodes, node, monkeypatch):
+    rejection = PeerResult(1, "rejected", 400, "no", 0.0, {"results": [{"result": False, "message": "Node 1: no"}]})
+    monkeypatch.setattr(node_module.broadcast_engine, "broadcast", lambda *args, **kwargs: BroadcastResult(False, [rejection], 0.0))
+    assert node.validate_transaction(transfer(nodes, 1))[0]
+    assert node.relay_validate_transactions([transfer(nodes, 2)], root_id = 0) == [(False, "Node 1: no")]
+    assert not node.validate_transaction(transfer(nodes, 3))[0]
+    assert node.validate_transaction(transfer(nodes, 2))[0] # the sender may try the nonce again
+
+def test_validated_nonce_expires(nodes, node, monkeypatch):
+    monkeypatch.setattr(config, "VALIDATED_NONCE_TIMEOUT", 0)
+    assert node.validate_transaction(transfer(nodes, 1))[0]
+    assert not node.validate_transaction(transfer(nodes, 2))[0]
+    assert node._validated_nonces == {}
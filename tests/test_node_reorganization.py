@@ -0,0 +1,77 @@
+import io
+
+import pytest
+
+import config
+from blockchain import Blockchain
+from libraries.custom_exceptions import ChainSyncError
+from libraries.wire_format import stream_header, stream_frame, stream_end, BLOCK_STREAM_MAGIC
+import node as node_module
+from node import Node
+from test_blockchain import branch
+
+@pytest.fixture
+def node(nodes, monkeypatch):
+    monkeypatch.setattr(config, "total_nodes", 2)
+    node = Node()
+    node.id = 0
+    node.wallet = nodes[0].wallet
+    node.chain = Blockchain(nodes[0])
+    node.set_ring([{"id": peer.id, "ip": "127.0.0.1", "port": 5000 + peer.id, "public_key": peer.wallet.public_key} for peer in nodes])
+    # The blocks carry no transactions, so node 0 keeps the whole stake and is elected for every block.
+    node.chain.append_synced_blocks(branch(nodes, node.chain.blocks[-1], 5))
+    node.update_ledger()
+    return node
+
+def test_preferred_fork_replaces_the_blocks_above_the_fork_point(nodes, node):
+    other_branch = branch(nodes, node.chain.blocks[2], 5, salt = 1)
+    assert node._reorganize(other_branch) == 5
+    assert node.chain.tip() == (7, other_branch[-1].hash)
+    assert node.ledger.applied_height == 7
+
+def test_shorter_fork_is_ignored(nodes, node):
+    tip = node.chain.tip()
+    assert node._reorganize(branch(nodes, node.chain.blocks[2], 2, salt = 1)) == 0
+    assert node.chain.tip() == tip and node.ledger.applied_height == 5
+
+def test_fork_that_fails_the_ledger_leaves_the_chain_and_the_ledger_as_they_were(nodes, node):
+    other_branch = branch(nodes, node.chain.blocks[2], 5, salt = 1)
+    # Node 1 holds no stake, so a block that it sealed is rejected by the ledger.
+    other_branch[-1].validator_id = 1
+    other_branch[-1].get_new_hash()
+    tip = node.chain.tip()
+    balance = node.ledger.balance(nodes[0].wallet.public_key)
+    with pytest.raises(ChainSyncError):
+        node._reorganize(other_branch)
+    assert node.chain.tip() == tip
+    assert node.ledger.applied_height == 5 and node.ledger.balance(nodes[0].wallet.public_key) == balance
+    # The restored ledger still follows the chain.
+    node.chain.append_synced_blocks(branch(nodes, node.chain.blocks[-1], 1))
+    node.update_ledger()
+    assert node.ledger.applied_height == 6
+
+class StreamedResponse:
+    """A response of a peer to /get_blocks, which streams the given blocks."""
+
+    def __init__(self, blocks):
+        self.status_code = 200
+        self.raw = io.BytesIO(stream_header(BLOCK_STREAM_MAGIC) + b"".join(stream_frame(block.to_bytes()) for block in blocks) + stream_end())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+def test_sync_stops_at_the_first_block_that_the_ledger_rejects(nodes, node, monkeypatch):
+    blocks = branch(nodes, node.chain.blocks[-1], 3)
+    # Node 1 holds no stake, so the ledger rejects a block that it sealed, although the block itself is well formed.
+    blocks[1].validator_id = 1
+    blocks[1].get_new_hash()
+    blocks[2].update_previous_hash(blocks[1])
+    blocks[2].get_new_hash()
+    monkeypatch.setattr(node_module, "make_get_request", lambda *args, **kwargs: StreamedResponse(blocks))
+    with pytest.raises(ChainSyncError):
+        node.sync_chain("127.0.0.1", 5001)
+    assert node.chain.tip() == (6, blocks[0].hash)
+    assert node.ledger.applied_height == 6
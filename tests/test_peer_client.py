@@ -0,0 +1,38 @@
+import socket
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from libraries.peer_client import PeerClient
+
+def closed_port():
+    """Returns a local port that nothing listens on."""
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        return free_socket.getsockname()[1]
+
+@pytest.fixture
+def peer_client():
+    peer_client = PeerClient(connect_timeout = 1, read_timeout = 1, max_retries = 2, backoff_factor = 0)
+    yield peer_client
+    peer_client.close()
+
+def test_refused_connection_is_retried_for_every_method(peer_client):
+    with pytest.raises(requests.exceptions.ConnectionError) as refused:
+        peer_client.post("127.0.0.1", closed_port(), "health")
+    assert peer_client._should_retry("POST", refused.value) and peer_client._should_retry("GET", refused.value)
+    assert peer_client._should_retry("POST", requests.exceptions.ConnectTimeout())
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError())),
+    requests.exceptions.ConnectionError(MaxRetryError(None, "/", ProtocolError("Connection aborted."))),
+    requests.exceptions.ReadTimeout(),
+])
+def test_request_that_may_have_reached_the_peer_is_retried_only_for_get(peer_client, error):
+    assert peer_client._should_retry("GET", error)
+    assert not peer_client._should_retry("POST", error)
+
+def test_other_errors_are_not_retried(peer_client):
+    assert not peer_client._should_retry("GET", requests.exceptions.InvalidURL())
+    assert peer_client._is_refused_connection(requests.exceptions.ConnectionError(MaxRetryError(None, "/", NewConnectionError(None, "refused"))))
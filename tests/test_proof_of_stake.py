@@ -0,0 +1,72 @@
+import hashlib
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from ledger_state import LedgerState
+from libraries.proof_of_stake import StakeLottery
+
+def lottery_of(stakes):
+    lottery = StakeLottery()
+    for node_id, stake in enumerate(stakes):
+        lottery.add_node(node_id, stake)
+    return lottery
+
+def test_prefix_stake_follows_incremental_updates():
+    stakes = [5, 0, 3, 7, 1, 0, 2]
+    lottery = lottery_of(stakes)
+    for node_id, stake in [(1, 4), (3, 0), (6, 10), (0, 0)]:
+        lottery.set_stake(node_id, stake)
+        stakes[node_id] = stake
+    assert lottery.total_stake == sum(stakes)
+    for node_id in range(len(stakes)):
+        assert lottery.prefix_stake(node_id) == sum(stakes[:node_id + 1])
+
+def test_find_maps_every_point_to_its_stake_range():
+    stakes = [2, 0, 3, 1, 0, 4]
+    lottery = lottery_of(stakes)
+    expected = [node_id for node_id, stake in enumerate(stakes) for _ in range(stake)]
+    assert [lottery.find(point) for point in range(sum(stakes))] == expected
+
+def test_draw_without_stake_elects_nobody():
+    assert lottery_of([0, 0, 0]).draw("seed") is None
+
+def test_draw_is_deterministic_for_a_seed():
+    lottery = lottery_of([10, 20, 30])
+    assert all(lottery.draw(f"hash{i}") == lottery_of([10, 20, 30]).draw(f"hash{i}") for i in range(50))
+
+def test_draw_distribution_is_proportional_to_stake():
+    stakes = [100, 300, 0, 600]
+    lottery = lottery_of(stakes)
+    draws = 20000
+    counts = Counter(lottery.draw(hashlib.sha256(str(i).encode()).hexdigest()) for i in range(draws))
+    assert counts[2] == 0
+    for node_id, stake in enumerate(stakes):
+        assert counts[node_id] / draws == pytest.approx(stake / sum(stakes), abs = 0.02)
+
+def test_ledger_rejects_a_block_of_a_node_that_was_not_elected():
+    ledger = LedgerState()
+    for node_id in range(3):
+        ledger.register_account(node_id, f"key{node_id}")
+    ledger.balances.commit(ledger.balances.stage([1], [50 * config.BCC_CENTS]))
+    ledger.stakes.set_stake(1, 50)
+    ledger.applied_height = 0
+
+    assert ledger.elected_validator(1, "hash0") == 1
+    block = SimpleNamespace(index = 1, validator_id = 2, previous_hash = "hash0", transactions = [])
+    result, description = ledger.check_block(block)
+    assert not result and "not the elected validator" in description
+    block.validator_id = 1
+    assert ledger.check_block(block)[0]
+
+def test_ledger_feeds_the_lottery_with_the_balances_of_applied_blocks(monkeypatch):
+    monkeypatch.setattr(config, "total_nodes", 2)
+    ledger = LedgerState()
+    for node_id in range(2):
+        ledger.register_account(node_id, f"key{node_id}")
+    genesis = SimpleNamespace(index = 0, validator_id = 0, previous_hash = "1", transactions = [])
+    ledger.apply_block(genesis)
+    assert ledger.stakes.stakes[0] == ledger.balance("key0") // config.BCC_CENTS > 0
+    assert ledger.stakes.total_stake == ledger.stakes.stakes[0]
@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from libraries.relay_tree import relay_children, SeenCache
+
+def make_ring(size):
+    return [{"id": node_id, "ip": "127.0.0.1", "port": 5000 + node_id} for node_id in range(size)]
+
+def children_ids(ring, root_id, node_id, fanout):
+    return [child["id"] for child in relay_children(ring, root_id, node_id, fanout)]
+
+def test_children_follow_the_ring_from_the_root():
+    ring = make_ring(10)
+    assert children_ids(ring, 0, 0, 3) == [1, 2, 3]
+    assert children_ids(ring, 0, 1, 3) == [4, 5, 6]
+    assert children_ids(ring, 0, 3, 3) == [] and children_ids(ring, 0, 2, 3) == [7, 8, 9]
+    # The tree of another root is the same tree, rotated along the ring.
+    assert children_ids(ring, 7, 7, 3) == [8, 9, 0]
+    assert children_ids(ring, 7, 8, 3) == [1, 2, 3]
+
+@pytest.mark.parametrize("size", [1, 2, 5, 16, 33])
+@pytest.mark.parametrize("fanout", [1, 2, 4])
+def test_every_node_is_reached_once_within_logarithmic_hops(size, fanout):
+    ring = make_ring(size)
+    for root_id in range(size):
+        reached = {root_id: 0} # node id --> hops from the root
+        frontier = [root_id]
+        while frontier:
+            node_id = frontier.pop()
+            for child_id in children_ids(ring, root_id, node_id, fanout):
+                assert child_id not in reached
+                reached[child_id] = reached[node_id] + 1
+                frontier.append(child_id)
+        assert set(reached) == set(range(size))
+        max_hops = size - 1 if fanout == 1 else math.ceil(math.log(size * (fanout - 1) + 1, fanout)) - 1
+        assert max(reached.values()) <= max_hops
+
+def test_unknown_root_or_node_relays_to_nobody():
+    ring = make_ring(4)
+    assert children_ids(ring, 9, 0, 2) == [] and children_ids(ring, 0, 9, 2) == []
+
+def test_seen_cache_drops_duplicates_and_forgets_the_least_recently_seen():
+    cache = SeenCache(max_size = 2)
+    assert cache.add("a") and cache.add("b")
+    assert not cache.add("a")
+    assert cache.add("c")
+    assert "a" in cache and "c" in cache and "b" not in cache
@@ -0,0 +1,51 @@
+import pytest
+
+import transaction as transaction_module
+from libraries import batch_verifier as batch_verifier_module
+from libraries.batch_verifier import BatchVerifier
+from libraries.crypto_engine import VerifiedSignatureCache
+from transaction import Transaction
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = VerifiedSignatureCache(max_size = 2)
+    monkeypatch.setattr(transaction_module, "verified_signatures", cache)
+    monkeypatch.setattr(batch_verifier_module, "verified_signatures", cache)
+    return cache
+
+def signed_transactions(nodes, count):
+    transactions = [Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 1, nonce = nonce) for nonce in range(1, count + 1)]
+    for transaction in transactions:
+        transaction.get_signature()
+    return transactions
+
+def test_signature_is_verified_once(nodes, cache):
+    transaction = signed_transactions(nodes, 1)[0]
+    assert transaction.verify_signature(transaction.get_hash())
+    assert transaction.verify_signature(transaction.get_hash())
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_invalid_signature_is_not_cached(nodes, cache):
+    transaction = signed_transactions(nodes, 1)[0]
+    transaction.signature = bytes(len(transaction.signature))
+    assert not transaction.verify_signature(transaction.get_hash())
+    assert not transaction.verify_signature(transaction.get_hash())
+    assert len(cache) == 0 and cache.misses == 2
+
+def test_least_recently_used_pair_is_dropped(nodes, cache):
+    first, second, third = signed_transactions(nodes, 3)
+    for transaction in (first, second, first, third):
+        transaction.verify_signature(transaction.get_hash())
+    assert cache.is_verified(first.get_hash(), first.signature)
+    assert not cache.is_verified(second.get_hash(), second.signature)
+
+def test_batch_verifies_only_the_signatures_not_in_the_cache(nodes, cache, monkeypatch):
+    transactions = signed_transactions(nodes, 2)
+    transactions[0].verify_signature(transactions[0].get_hash())
+    verified_chunks = []
+    verify_chunk = batch_verifier_module._verify_chunk
+    monkeypatch.setattr(batch_verifier_module, "_verify_chunk", lambda items: verified_chunks.append(items) or verify_chunk(items))
+    assert BatchVerifier(min_parallel = 10).verify_transactions(transactions) == [True, True]
+    assert [[item[0] for item in items] for items in verified_chunks] == [[transactions[1].get_hash()]]
+    assert BatchVerifier(min_parallel = 10).verify_transactions(transactions) == [True, True]
+    assert len(verified_chunks) == 1
@@ -0,0 +1,102 @@
+import pytest
+
+from block import Block
+from libraries.custom_exceptions import WireFormatError
+from libraries.wire_format import WireWriter, TRANSACTION_MAGIC, TRANSACTION_BATCH_MAGIC, BLOCK_MAGIC, WIRE_FORMAT_VERSION
+from transaction import Transaction
+
+def signed_transaction(nodes, nonce = 1, message = None):
+    transaction = Transaction(nodes[0], 1, nodes[1].wallet.public_key, bcc = 5, message = message, nonce = nonce)
+    transaction.get_signature()
+    return transaction
+
+def encoded_transaction(sender_public_key = "key", bcc = 5, message = "hello", nonce = 1, signature = b"signature"):
+    """Returns a transaction encoded field by field, whose fields may be malformed."""
+    writer = WireWriter(TRANSACTION_MAGIC)
+    writer.int64(0)
+    writer.bytes(sender_public_key.encode() if isinstance(sender_public_key, str) else sender_public_key)
+    writer.int64(1)
+    writer.string("recipient key")
+    writer.uint8(0)
+    writer.int64(bcc)
+    writer.bytes(message.encode() if isinstance(message, str) else message)
+    writer.float64(1.0)
+    writer.int64(nonce)
+    writer.bytes(signature)
+    return writer.to_bytes()
+
+def test_transaction_round_trip_keeps_the_hash_and_the_signature(nodes):
+    transaction = signed_transaction(nodes, message = "héllo")
+    decoded = Transaction.from_bytes(transaction.to_bytes())
+    assert decoded.hash == transaction.hash
+    assert (decoded.sender_id, decoded.bcc, decoded.message, decoded.nonce, decoded.signature) == (0, 5, "héllo", 1, transaction.signature)
+    assert decoded.verify_signature(decoded.get_hash())
+
+def test_batch_and_block_round_trip(nodes):
+    transactions = [signed_transaction(nodes, nonce) for nonce in (1, 2, 3)]
+    assert [transaction.hash for transaction in Transaction.batch_from_bytes(Transaction.batch_to_bytes(transactions))] == [transaction.hash for transaction in transactions]
+    block = Block(validator = nodes[0], index = 0, previous_hash = "1")
+    for transaction in transactions:
+        block.add_transaction(transaction)
+    block.get_new_hash()
+    decoded = Block.from_bytes(block.to_bytes())
+    assert decoded.hash == block.hash == decoded.calculate_hash()
+    assert [transaction.hash for transaction in decoded.transactions] == [transaction.hash for transaction in transactions]
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"BT",
+    b"BB" + bytes([WIRE_FORMAT_VERSION]) + encoded_transaction()[3:],
+    b"BT" + bytes([WIRE_FORMAT_VERSION + 1]) + encoded_transaction()[3:],
+    encoded_transaction()[:-1],
+    encoded_transaction() + b"\x00",
+    encoded_transaction(message = b"\xff\xfe"),
+    encoded_transaction(sender_public_key = None),
+    encoded_transaction(signature = None),
+    encoded_transaction(nonce = None),
+    encoded_transaction(bcc = None),
+])
+def test_malformed_transaction_is_rejected(data):
+    with pytest.raises(WireFormatError):
+        Transaction.from_bytes(data)
+
+def test_message_without_an_amount_travels_with_0_bcc(nodes):
+    transaction = Transaction(nodes[0], 1, nodes[1].wallet.public_key, message = "hello", nonce = 1)
+    assert transaction.bcc == 0 and transaction.type == "message"
+    assert Transaction.from_bytes(transaction.to_bytes()).hash == transaction.hash
+    assert Transaction.from_bytes(encoded_transaction(message = None)).message is None
+
+def test_batch_and_block_with_an_absent_or_malformed_transaction_are_rejected():
+    writer = WireWriter(TRANSACTION_BATCH_MAGIC)
+    writer.uint32(2)
+    writer.bytes(encoded_transaction())
+    writer.bytes(None)
+    with pytest.raises(WireFormatError):
+        Transaction.batch_from_bytes(writer.to_bytes())
+
+    writer = WireWriter(BLOCK_MAGIC)
+    writer.int64(1)
+    writer.string("previous hash")
+    writer.int64(0)
+    writer.float64(1.0)
+    writer.string("hash")
+    writer.uint32(1)
+    writer.bytes(encoded_transaction(message = b"\xff"))
+    with pytest.raises(WireFormatError):
+        Block.from_bytes(writer.to_bytes())
+
+def test_block_without_an_index_is_rejected():
+    writer = WireWriter(BLOCK_MAGIC)
+    writer.int64(None)
+    writer.string("previous hash")
+    writer.int64(0)
+    writer.float64(1.0)
+    writer.string("hash")
+    writer.uint32(0)
+    with pytest.raises(WireFormatError):
+        Block.from_bytes(writer.to_bytes())
+
+@pytest.mark.parametrize("endpoint", ["validate_transaction", "validate_transactions", "receive_transaction", "receive_transactions", "receive_block"])
+def test_endpoints_answer_400_to_malformed_input(client, endpoint):
+    response = client.post(f"/blockchat/{endpoint}", data = encoded_transaction(message = b"\xff\xfe"))
+    assert response.status_code == 400